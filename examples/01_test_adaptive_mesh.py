@@ -14,6 +14,7 @@ from _context import tados
 from tados.illumination.point_in_triangle import point_in_triangle
 from tados.illumination.adaptive_mesh import AdaptiveMesh
 from tados.zemax import sampling, dde_link
+from tados.zemax.raytrace_engine import get_fields
 
 def analyze_transmission(hDDE):  
   # set up ray-trace parameters and image detector
@@ -38,8 +39,8 @@ def analyze_transmission(hDDE):
     def raytrace(pupil_points):        # local function for raytrace
       px,py = pupil_points.T;
       ret = hDDE.trace_rays(x,y,px,py,wavenum,surf=image_surface);
-      vigcode = ret[:,[1]]!=0;        # include vignetting by shifting ray outside image
-      return ret[:,[2,3]]+image_size*vigcode;
+      vigcode = ret['vigcode'][:,np.newaxis]!=0;  # include vignetting by shifting ray outside image
+      return get_fields(ret,('x','y'))+image_size*vigcode;
     Mesh=AdaptiveMesh(initial_sampling, raytrace);
 
     # mesh refinement  
@@ -111,9 +112,8 @@ if __name__ == '__main__':
   
   with dde_link.DDElinkHandler() as hDDE:
   
-    ln = hDDE.link;
     # load example file
-    #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+    #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
     #                        'Cooke 40 degree field.zmx')
     filename= os.path.join(moduledir,'tests','zemax','pupil_slicer.ZMX');
     hDDE.load(filename);
@@ -13,6 +13,7 @@ from _context import tados
 from tados.illumination.point_in_triangle import point_in_triangle
 from tados.illumination import transmission
 from tados.zemax import dde_link, sampling
+from tados.zemax.raytrace_engine import get_fields
 
 
 def __test_intensity_footprint(hDDE):  
@@ -24,9 +25,9 @@ def __test_intensity_footprint(hDDE):
     x,y   = params;      
     px,py = pupil_points.T;                # shape (nPoints,)
     ret   = hDDE.trace_rays(x,y,px,py,wavenum,surf=image_surface);
-    error = ret[:,0];
-    vigcode= ret[:,[1]];     
-    xy    = ret[:,[2,3]];    
+    error = ret['error'];
+    vigcode= ret['vigcode'][:,np.newaxis];     
+    xy    = get_fields(ret,('x','y'));    
     # return (x,y) coordinates in image space    
     xy   += image_size*(vigcode!=0);       # include vignetting by shifting ray outside image
     xy[error!=0]=np.nan;                   # rays that could not be traced
@@ -75,9 +76,9 @@ def __test_angular_distribution(hDDE):
     px,py = params;      
     x,y   = field_points.T;                # shape (nPoints,)
     ret   = hDDE.trace_rays(x,y,px,py,wavenum,surf=image_surface);
-    error = ret[:,0];
-    vigcode=ret[:,[1]];     
-    kxky  = ret[:,[5,6]];                  # return (kx,ky) direction cosine in image space    
+    error = ret['error'];
+    vigcode= ret['vigcode'][:,np.newaxis];     
+    kxky  = get_fields(ret,('l','m'));     # return (kx,ky) direction cosine in image space    
     kxky[error!=0]=np.nan;                 # rays that could not be traced
     return kxky;                             
 
@@ -118,9 +119,8 @@ if __name__ == '__main__':
   
   with dde_link.DDElinkHandler() as hDDE:
   
-    ln = hDDE.link;
     # load example file
-    #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+    #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
     #                        'Cooke 40 degree field.zmx')
     filename= os.path.join(moduledir,'tests','zemax','pupil_slicer.ZMX');
     hDDE.load(filename);
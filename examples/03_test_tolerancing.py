@@ -14,6 +14,7 @@ from _context import tados
 from tados.illumination import transmission
 from tados.tolerancing import tolerancing
 from tados.zemax import dde_link, sampling
+from tados.zemax.raytrace_engine import get_fields
 
 def __test_tolerancing(tol):  
   
@@ -25,9 +26,9 @@ def __test_tolerancing(tol):
     px,py = pupil_points.T;                # shape (nPoints,)
     isurf = tol.get_orig_surface(image_surface);
     ret   = tol.hDDE.trace_rays(x,y,px,py,wavenum,surf=isurf);
-    error = ret[:,0];
-    vigcode= ret[:,[1]];     
-    xy    = ret[:,[2,3]];    
+    error = ret['error'];
+    vigcode= ret['vigcode'][:,np.newaxis];     
+    xy    = get_fields(ret,('x','y'));    
     # return (x,y) coordinates in image space    
     xy   += image_size*(vigcode!=0);       # include vignetting by shifting ray outside image
     xy[error!=0]=np.nan;                   # rays that could not be traced
@@ -60,7 +61,7 @@ def __test_tolerancing(tol):
   tol.tilt_decenter_elements(1,3,ydec=0.02);  # [mm]
   tol.TETX(1,3,2.001) # [deg]
   tol.print_current_geometric_changes();
-  tol.ln.zPushLens(1);  
+  tol.hDDE.show();  
   
   # run Transmission calculation
   T = transmission.Transmission(field_sampling,pupil_sampling,raytrace,[dbg,img]);
@@ -82,9 +83,8 @@ if __name__ == '__main__':
   
   with dde_link.DDElinkHandler() as hDDE:
   
-    ln = hDDE.link;
     # load example file
-    #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+    #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
     #                        'Cooke 40 degree field.zmx')
     filename= os.path.join(moduledir,'tests','zemax','pupil_slicer.ZMX');
     tol=tolerancing.ToleranceSystem(hDDE,filename)
@@ -61,21 +61,19 @@ def intensity_in_box(x,F,min_width=None,max_width=None):
  
 def compensator_rotz(tol,angle):  
   " apply rotation of slicer about surface nomal by given angle [deg]"
-  ln = tol.ln; 
   tol.tilt_decenter_elements(6,8,ztilt=angle,cbComment1="compensator",cbComment2="~compensator");
   surf = tol.get_orig_surface(20);
-  assert ln.zGetComment(surf)=="rotate image plane";
+  assert tol.hDDE.link.zGetComment(surf)=="rotate image plane";
   # correct rotation of image plane
   angle_img = 90+np.rad2deg(np.arctan(np.sqrt(2)*np.tan(np.deg2rad(-22.20765+angle))));
-  ln.zSetSurfaceParameter(surf,5,angle_img);   #  5: TILT ABOUT Z 
+  tol.hDDE.set_surface_parameter(surf,5,angle_img);   #  5: TILT ABOUT Z 
   
  
 logging.basicConfig(level=logging.WARNING);
 
 with dde_link.DDElinkHandler() as hDDE:
-  ln = hDDE.link;
   # load example file
-  #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+  #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
   #                        'Cooke 40 degree field.zmx')
   filename= os.path.join(moduledir,'tests','zemax','pupil_slicer.ZMX');
   tol=tolerancing.ToleranceSystem(hDDE,filename)
@@ -87,8 +85,8 @@ with dde_link.DDElinkHandler() as hDDE:
     # shift of pupil slicer
     tol.reset();
     tol.change_thickness(4,11,value=2);
-    tol.ln.zDeleteSurface(21);           # remove spider aperture
-    tol.ln.zPushLens(1);    
+    tol.hDDE.link.zDeleteSurface(21);           # remove spider aperture
+    tol.hDDE.show();    
     if rotz==0: tol.print_current_geometric_changes();
   
     # compensator: rotate slicer around surface normal
@@ -13,6 +13,7 @@ from _context import tados
 import tados.illumination.adaptive_mesh as mesh
 from tados.illumination import transmission
 from tados.zemax import sampling, dde_link
+from tados.zemax.raytrace_engine import get_fields
 
 
 def analyze_transmission(hDDE):  
@@ -23,9 +24,9 @@ def analyze_transmission(hDDE):
     x,y   = params;      
     px,py = pupil_points.T;                # shape (nPoints,)
     ret   = hDDE.trace_rays(x,y,px,py,wavenum,surf=image_surface);
-    error = ret[:,0];
-    vigcode= ret[:,[1]];     
-    xy    = ret[:,[2,3]];    
+    error = ret['error'];
+    vigcode= ret['vigcode'][:,np.newaxis];     
+    xy    = get_fields(ret,('x','y'));    
     # return (x,y) coordinates in image space    
     xy   += image_size*(vigcode!=0);       # include vignetting by shifting ray outside image
     xy[error!=0]=np.nan;                   # rays that could not be traced
@@ -87,9 +88,8 @@ if __name__ == '__main__':
    
   with dde_link.DDElinkHandler() as hDDE:
   
-    ln = hDDE.link;
     # load example file
-    #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+    #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
     #                        'Cooke 40 degree field.zmx')
     filename= os.path.join(moduledir,'tests','zemax','fraunhofer_logo.ZMX');
     hDDE.load(filename);
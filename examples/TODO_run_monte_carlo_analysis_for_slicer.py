@@ -65,30 +65,29 @@ def intensity_in_box(x,F,min_width=None,max_width=None):
  
 def compensator_rotz(tol,angle):  
   " apply rotation of slicer about surface nomal by given angle [deg]"
-  ln = tol.ln; 
   tol.tilt_decenter_elements(6,8,ztilt=angle,cbComment1="compensator",cbComment2="~compensator");
   surf = tol.get_orig_surface(20);
-  assert ln.zGetComment(surf)=="rotate image plane";
+  assert tol.hDDE.link.zGetComment(surf)=="rotate image plane";
   # correct rotation of image plane
   angle_img = 90+np.rad2deg(np.arctan(np.sqrt(2)*np.tan(np.deg2rad(-22.20765+angle))));
-  ln.zSetSurfaceParameter(surf,5,angle_img);   #  5: TILT ABOUT Z 
+  tol.hDDE.set_surface_parameter(surf,5,angle_img);   #  5: TILT ABOUT Z 
   
 
 
 def tilt_obj(tol,xscale=0,yscale=0):   
   # corresponds to cleave angle of fiber 1
   tilt=np.tan(np.deg2rad(10)); # tilt by 10 deg
-  if xscale!=0: tol.ln.zSetSurfaceParameter(0,1,tilt*xscale)   # set Param1: X TANGENT
-  if yscale!=0: tol.ln.zSetSurfaceParameter(0,2,tilt*yscale)   # set Param1: X TANGENT 
-  tol.ln.zGetUpdate(); 
+  if xscale!=0: tol.hDDE.set_surface_parameter(0,1,tilt*xscale)   # set Param1: X TANGENT
+  if yscale!=0: tol.hDDE.set_surface_parameter(0,2,tilt*yscale)   # set Param1: X TANGENT 
+  tol.hDDE.update(); 
   return tilt*xscale,tilt*yscale
   
 def tilt_img(tol,xscale=0,yscale=0): 
   # corresponds to cleave angle of fiber 2  
   tilt=np.tan(np.deg2rad(10)); # tilt by 10 deg
-  if xscale!=0: tol.ln.zSetSurfaceParameter(-1,1,tilt*xscale)   # set Param1: X TANGENT
-  if yscale!=0: tol.ln.zSetSurfaceParameter(-1,2,tilt*yscale)   # set Param1: X TANGENT 
-  tol.ln.zGetUpdate(); 
+  if xscale!=0: tol.hDDE.set_surface_parameter(-1,1,tilt*xscale)   # set Param1: X TANGENT
+  if yscale!=0: tol.hDDE.set_surface_parameter(-1,2,tilt*yscale)   # set Param1: X TANGENT 
+  tol.hDDE.update(); 
   return tilt*xscale,tilt*yscale
   
 def decenter_L1(tol,xscale=0,yscale=0): 
@@ -155,12 +154,12 @@ def tilt_L2(tol,xscale=0,yscale=0):
 def tilt_single_mirror(tol,nMirror=1,xscale=0,yscale=0,zscale=0):
   tilt=np.rad2deg(0.001); # [rad]
   numSurf = tol.get_orig_surface(6);
-  pos = tol.ln.zGetNSCPosition(numSurf,nMirror)._asdict();
+  pos = tol.hDDE.link.zGetNSCPosition(numSurf,nMirror)._asdict();
   pos['tiltX'] += xscale*tilt;
   pos['tiltY'] += yscale*tilt;
   pos['tiltZ'] += zscale*tilt;
-  tol.ln.zSetNSCPositionTuple(numSurf,nMirror,**pos)
-  tol.ln.zGetUpdate();
+  tol.hDDE.link.zSetNSCPositionTuple(numSurf,nMirror,**pos)
+  tol.hDDE.update();
   return tilt*xscale,tilt*yscale
 
 def tilt_M1(tol,**kwargs):
@@ -177,11 +176,11 @@ def tilt_slicer(tol,xscale=0,yscale=0):
 
 def tilt_F1(tol,xscale=0,yscale=0): # note: pivot of tilt is in the object plane !
   tilt=np.rad2deg(0.005); # [rad]
-  tObj=tol.ln.zGetSurfaceData(0,tol.ln.SDAT_THICK);
-  tol.ln.zSetSurfaceData(0,tol.ln.SDAT_THICK,0);   # remove object thickness
+  tObj=tol.hDDE.get_surface_data(0,tol.hDDE.SDAT_THICK);
+  tol.hDDE.set_surface_data(0,tol.hDDE.SDAT_THICK,0);   # remove object thickness
   tol.insert_coordinate_break(1,xtilt=tilt*xscale,ytilt=tilt*yscale,comment="tilt F1");  
-  tol.ln.zSetSurfaceData(1,tol.ln.SDAT_THICK,tObj);# add object thickness
-  tol.ln.zGetUpdate();
+  tol.hDDE.set_surface_data(1,tol.hDDE.SDAT_THICK,tObj);# add object thickness
+  tol.hDDE.update();
   return tilt*xscale,tilt*yscale
 
 def tilt_F2(tol,xscale=0,yscale=0):
@@ -204,13 +203,13 @@ def slicer_mirror_separation(tol,dscale=0,xscale=0,yscale=0):
   if dscale==0: dscale=xscale;
   if dscale==0: dscale=yscale;# allow us to use xscale and yscale like in all other functions
   numSurf = tol.get_orig_surface(6);
-  pos = tol.ln.zGetNSCPosition(numSurf,1)._asdict(); # get M1
+  pos = tol.hDDE.link.zGetNSCPosition(numSurf,1)._asdict(); # get M1
   # shift mirror along global z-axis in order to avoid a change of the referenc point
   # -> also add chang in y-shift of M1  
   pos['y'] -= dscale*thick;
   pos['z'] += dscale*thick;
-  tol.ln.zSetNSCPositionTuple(numSurf,1,**pos)
-  tol.ln.zGetUpdate();
+  tol.hDDE.link.zSetNSCPositionTuple(numSurf,1,**pos)
+  tol.hDDE.update();
   return 0,thick*dscale
 
  
@@ -219,9 +218,8 @@ outpath = os.path.realpath('../05_monte_carlo_simulation_system11_NA0178');
 logfile = os.path.join(outpath,'monte_carlo_simulation.txt');  # file for summary of MC simulation
   
 with DDElinkHandler() as hDDE, open(logfile,'w') as OUT:
-  ln = hDDE.link;
   # load example file
-  #filename = os.path.join(ln.zGetPath()[1], 'Sequential', 'Objectives', 
+  #filename = os.path.join(hDDE.link.zGetPath()[1], 'Sequential', 'Objectives', 
   #                        'Cooke 40 degree field.zmx')
   #filename= os.path.realpath('../13_catalog_optics_1mm_pupil_inf-inf-relay_point_source_with_slicer_tolerancing.ZMX');
   filename= os.path.realpath('../11_catalog_optics_1mm_pupil_point_source_with_slicer_tolerancing.ZMX');  
@@ -281,7 +279,7 @@ with DDElinkHandler() as hDDE, open(logfile,'w') as OUT:
         #print "tolerance '%20s': dx=%8.5f, dy=%8.5f, dr=%8.5f"%(distrub_func.func_name,xs,ys,np.linalg.norm((xs,ys)))
          
       # update changes
-      tol.ln.zPushLens(1);    
+      tol.hDDE.show();    
       #if rotz==0: tol.print_current_geometric_changes();
     
       # compensator: rotate slicer around surface normal
@@ -0,0 +1 @@
+from tados.illumination.deposition import set_backend, get_backend, available_backends
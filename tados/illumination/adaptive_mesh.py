@@ -12,6 +12,175 @@ import matplotlib.pylab as plt
 import logging
 
 
+class _GrowingArray(object):
+  """
+  Array of rows with amortized O(1) appending (capacity doubling).
+  Only the first len(self) rows of the backing buffer are valid, the
+  property data returns a view of these rows (no copy).
+  """
+  
+  def __init__(self,data,capacity=None):
+    """
+      data     ... initial content, array of shape (nRows,...)
+      capacity ... (opt) minimal number of initially allocated rows
+    """
+    data = np.asarray(data);
+    capacity = max(16,2*data.shape[0],capacity or 0);
+    self.__buffer = np.empty((capacity,)+data.shape[1:],dtype=data.dtype);
+    self.__buffer[:data.shape[0]] = data;
+    self.__size = data.shape[0];
+    
+  def __len__(self):
+    return self.__size;
+    
+  @property
+  def data(self):
+    " view of all valid rows, shape (nRows,...)"
+    return self.__buffer[:self.__size];
+    
+  def __reserve(self,size):
+    " ensure that the buffer can hold at least size rows "
+    capacity = self.__buffer.shape[0];
+    if size <= capacity: return
+    while capacity < size: capacity*=2;
+    buffer = np.empty((capacity,)+self.__buffer.shape[1:],dtype=self.__buffer.dtype);
+    buffer[:self.__size] = self.__buffer[:self.__size];
+    self.__buffer = buffer;
+  
+  def append(self,rows):
+    """
+    append rows at the end of the array
+    Returns: index of first new row
+    """
+    rows = np.asarray(rows,dtype=self.__buffer.dtype);
+    start = self.__size;
+    self.__reserve(start+rows.shape[0]);
+    self.__buffer[start:start+rows.shape[0]] = rows;
+    self.__size += rows.shape[0];
+    return start;
+    
+  def replace(self,bReplace,rows):
+    """
+    remove rows indicated by boolean array bReplace and insert new rows.
+    The slots of removed rows are reused for the new rows first. Remaining 
+    empty slots are filled with rows from the end of the array, i.e., the
+    order of the rows is not preserved. The cost is proportional to the
+    number of removed and added rows (apart from scanning bReplace).
+      bReplace ... boolean array of shape (len(self),)
+      rows     ... new rows, shape (nNew,...)
+    Returns: index,moved_from,moved_to
+      index    ... row index of each new row, shape (nNew,)
+      moved_from.. old row index of rows that have been moved
+      moved_to ... new row index of these rows
+    """
+    rows  = np.asarray(rows,dtype=self.__buffer.dtype);
+    free  = np.flatnonzero(bReplace);       # free slots, sorted
+    nFree = free.size; nNew = rows.shape[0];
+    # reuse free slots for new rows, append the rest
+    nReuse = min(nFree,nNew);
+    self.__buffer[free[:nReuse]] = rows[:nReuse];
+    if nNew > nFree: 
+      start = self.append(rows[nReuse:]);
+      index = np.concatenate((free,np.arange(start,self.__size)));
+      return index, np.empty(0,dtype=int), np.empty(0,dtype=int);
+    # fill remaining holes by moving rows from the end of the array
+    holes = free[nReuse:];
+    size  = self.__size - holes.size;       # new number of rows
+    tail  = np.setdiff1d(np.arange(size,self.__size),holes,assume_unique=True);
+    holes = holes[holes<size];              # holes in the tail are simply dropped
+    assert holes.size==tail.size;
+    self.__buffer[holes] = self.__buffer[tail];
+    self.__size = size;
+    return free[:nReuse], tail, holes;
+
+
+class _KeyIndex(object):
+  """
+  Map of unique keys (numpy scalars of a fixed dtype) to integer values with
+  vectorized lookup and insertion. The keys are kept in sorted blocks of 
+  decreasing size, which are searched by np.searchsorted (logarithmic method):
+  new keys form a new block, which is merged with all blocks that are not
+  larger. Each key is copied O(log(N)) times in total, i.e., the cost of an
+  insertion does not depend on the total number of keys (amortized).
+  """
+
+  def __init__(self,dtype):
+    self.__dtype  = np.dtype(dtype);
+    self.__blocks = [];                   # list of (keys,values), sorted by keys
+
+  def __len__(self):
+    return sum(keys.size for keys,_ in self.__blocks);
+
+  def lookup(self,keys):
+    " returns value of each key, -1 for unknown keys "
+    values = -np.ones(keys.size,dtype=int);
+    for block_keys,block_values in self.__blocks:
+      pos = np.minimum(np.searchsorted(block_keys,keys),block_keys.size-1);
+      found = block_keys[pos]==keys;
+      values[found] = block_values[pos[found]];
+    return values;
+
+  def insert(self,keys,values):
+    " insert unique, unknown keys with given values "
+    keys   = np.asarray(keys,dtype=self.__dtype);
+    values = np.asarray(values,dtype=int);
+    while self.__blocks and self.__blocks[-1][0].size<=keys.size:
+      block_keys,block_values = self.__blocks.pop();
+      keys   = np.concatenate((block_keys,keys));
+      values = np.concatenate((block_values,values));
+    order = np.argsort(keys,kind='stable');     # merges sorted runs in linear time
+    if keys.size>0: self.__blocks.append((keys[order],values[order]));
+
+
+class _PointIndex(object):
+  """
+  Exact-match lookup of 2D points with vectorized queries and insertions.
+  Each point is identified by the bytes of its coordinates (void scalar),
+  see _KeyIndex.
+  """
+
+  def __init__(self,points=None):
+    """
+      points ... (opt) initial points, shape (nPoints,2), the value of each
+                   point is its row index (first occurrence for duplicates)
+    """
+    self.__index = _KeyIndex((np.void,16));
+    if points is not None and len(points)>0:
+      keys,first = np.unique(self.__get_keys(points),return_index=True);
+      self.__index.insert(keys,first);
+
+  def __len__(self):
+    return len(self.__index);
+
+  @staticmethod
+  def __get_keys(points):
+    " void view of coordinates, shape (nPoints,) "
+    points = np.ascontiguousarray(points,dtype=float).reshape(-1,2)+0.;  # -0. -> 0.
+    return points.view((np.void,16)).ravel();
+
+  def add(self,points,first_value):
+    """
+    look up points and add unknown points, which get consecutive values
+    starting from first_value (in order of their first occurrence)
+      points      ... shape (nPoints,2)
+      first_value ... value of first new point
+    Returns: (values,new)
+      values ... value of each point, shape (nPoints,)
+      new    ... row index of first occurrence of each new point in points
+    """
+    keys = self.__get_keys(points);
+    values = self.__index.lookup(keys);
+    missing = np.flatnonzero(values<0);
+    if missing.size==0: return values,missing;
+    unique_keys,first,inverse = np.unique(keys[missing],return_index=True,return_inverse=True);
+    order = np.argsort(first);                 # unique keys in order of first occurrence
+    rank = np.empty_like(order); rank[order] = np.arange(order.size);
+    new_values = first_value+rank;
+    values[missing] = new_values[inverse.ravel()];
+    self.__index.insert(unique_keys,new_values);
+    return values,missing[first[order]];
+
+
 class AdaptiveMesh(object):
   """
   Implementation of an adaptive mesh for a given mapping f:domain->image.
@@ -22,7 +191,15 @@ class AdaptiveMesh(object):
   in domain space). Points outside of the domain (e.g. raytrace fails) 
   should be mapped to image point (np.nan,np.nan) and are handled separately.
   
-  ToDo: add unit tests
+  The results of the mapping are cached, i.e. each domain point is mapped only
+  once, even if it is requested repeatedly during refinement.
+  
+  Points and simplices are stored in growing arrays with amortized constant
+  cost per added element. The attributes domain, image and simplices are 
+  views into these arrays and become invalid after the next refinement step.
+  Replaced simplices free their slots for new simplices, i.e., the order of 
+  the simplices changes during refinement. The edges and neighbors of each 
+  triangle (see neighbors) are updated incrementally.
   """
   
   def __init__(self,initial_domain,mapping):
@@ -41,16 +218,137 @@ class AdaptiveMesh(object):
     self.__tri = Delaunay(initial_domain,incremental=True);
     self.simplices = self.__tri.simplices;
     # calculate distorted grid
-    self.initial_image = self.mapping(self.initial_domain);
+    self.__cache_index = _PointIndex();      # key: domain coordinates, value: row in __cache_image
+    self.__cache_image = _GrowingArray(np.empty((0,2)));
+    self.initial_image = self.__map(self.initial_domain);
     assert( self.initial_image.ndim==2)
     assert( self.initial_image.shape==(self.initial_domain.shape[0],2))
     # current domain and image during refinement and for plotting
     self.domain = self.initial_domain;    
     self.image  = self.initial_image;   
+    # index of each point in mesh, key: domain coordinates (used for merging points)
+    self.__point_index = _PointIndex(self.initial_domain);
     # initial domain area
     self.initial_domain_area = np.sum(self.get_area_in_domain());
     
-          
+
+  # points and simplices are stored in growing arrays (see _GrowingArray)
+  @property
+  def domain(self):
+    " coordinates of all points in domain space, shape (nPoints,2)"
+    return self.__domain.data;
+  @domain.setter
+  def domain(self,domain):
+    self.__domain = _GrowingArray(domain);
+    
+  @property
+  def image(self):
+    " coordinates of all points in image space, shape (nPoints,2)"
+    return self.__image.data;
+  @image.setter
+  def image(self,image):
+    self.__image = _GrowingArray(image);
+
+  @property
+  def simplices(self):
+    " vertex indices of all triangles, shape (nTriangles,3)"
+    return self.__simplices.data;
+  @simplices.setter
+  def simplices(self,simplices):
+    self.__simplices = _GrowingArray(simplices);
+    self.__build_adjacency();
+
+  @property
+  def neighbors(self):
+    """
+    index of neighboring triangle at each edge of all triangles, shape (nTriangles,3),
+    neighbors[t,i] shares the edge from vertex simplices[t,i] to simplices[t,(i+1)%3]
+    with triangle t, -1 for edges at the boundary of the mesh or with hanging nodes
+    """
+    return self.__neighbors.data;
+
+  # adjacency: each edge (P,Q) with P<Q has an id (row in __edges), which is found
+  # by its key (see __get_edge_keys) in __edge_index. The sides of the triangles are 
+  # numbered as half-edges h=3*t+i (side i of triangle t), __tri_edges gives the edge
+  # of each side and __edge_sides the (at most two) sides at each edge (-1: empty,
+  # occupied entries first). Only the sides of new, replaced and moved triangles are
+  # updated in each refinement step (see __add_new_simplices).
+  @staticmethod
+  def __get_edge_keys(simplices):
+    " key P*2^32+Q of the edge (P,Q) with P<Q at each side of given simplices "
+    P = np.asarray(simplices,dtype=np.int64); Q = np.roll(P,-1,axis=1);
+    return (np.minimum(P,Q)<<32) | np.maximum(P,Q);
+
+  def __build_adjacency(self):
+    " setup edges and neighbors for all simplices "
+    keys,tri_edges = np.unique(self.__get_edge_keys(self.simplices),return_inverse=True);
+    self.__edge_index = _KeyIndex(np.int64);
+    self.__edge_index.insert(keys,np.arange(keys.size));
+    self.__edges = _GrowingArray(np.column_stack((keys>>32,keys&0xffffffff)).astype(int));
+    self.__edge_sides = _GrowingArray(-np.ones((keys.size,2),dtype=int));
+    self.__tri_edges = _GrowingArray(tri_edges.reshape(self.simplices.shape));
+    self.__neighbors = _GrowingArray(-np.ones(self.simplices.shape,dtype=int));
+    self.__link_sides(np.arange(self.simplices.size));
+
+  def __get_edge_ids(self,simplices):
+    " returns edge id at each side of given simplices (new edges are added) "
+    keys = self.__get_edge_keys(simplices).ravel();
+    ids = self.__edge_index.lookup(keys);
+    missing = np.flatnonzero(ids<0);
+    if missing.size>0:
+      new_keys,inverse = np.unique(keys[missing],return_inverse=True);
+      start = self.__edges.append(np.column_stack((new_keys>>32,new_keys&0xffffffff)));
+      self.__edge_sides.append(-np.ones((new_keys.size,2),dtype=int));
+      self.__edge_index.insert(new_keys,start+np.arange(new_keys.size));
+      ids[missing] = start+inverse.ravel();
+    return ids.reshape(-1,3);
+
+  def __update_neighbors(self,edges):
+    " connect the triangles at both sides of given edges "
+    g,h = self.__edge_sides.data[edges].T;
+    neighbors = self.__neighbors.data;
+    g,h = g[g>=0],h[g>=0];
+    neighbors[g//3,g%3] = np.where(h>=0,h//3,-1);
+    g,h = g[h>=0],h[h>=0];
+    neighbors[h//3,h%3] = g//3;
+
+  def __link_sides(self,sides):
+    " add given half-edges to their edges and update neighbors "
+    edges = self.__tri_edges.data.reshape(-1)[sides];
+    order = np.argsort(edges,kind='stable'); sides,edges = sides[order],edges[order];
+    # rank of each side among the new sides of the same edge
+    first = np.r_[True,edges[1:]!=edges[:-1]] if edges.size>0 else np.zeros(0,dtype=bool);
+    rank = np.arange(edges.size) - np.maximum.accumulate(np.where(first,np.arange(edges.size),0));
+    edge_sides = self.__edge_sides.data;
+    column = np.sum(edge_sides[edges]>=0,axis=1) + rank;
+    assert np.all(column<2), "edge is shared by more than two triangles";
+    edge_sides[edges,column] = sides;
+    self.__update_neighbors(edges[first]);
+
+  def __unlink_sides(self,sides):
+    " remove given half-edges from their edges and update neighbors "
+    edges = self.__tri_edges.data.reshape(-1)[sides];
+    edge_sides = self.__edge_sides.data;
+    for c in range(2):
+      found = edge_sides[edges,c]==sides;
+      edge_sides[edges[found],c] = -1;
+    edges = np.unique(edges);
+    empty = edge_sides[edges,0]<0;                # keep occupied entries first
+    edge_sides[edges[empty],0] = edge_sides[edges[empty],1];
+    edge_sides[edges[empty],1] = -1;
+    self.__update_neighbors(edges);
+
+  def __move_sides(self,moved_from,moved_to):
+    " renumber half-edges of triangles that have been moved to another row "
+    old_sides = (3*moved_from[:,np.newaxis]+np.arange(3)).ravel();
+    new_sides = (3*moved_to[:,np.newaxis]+np.arange(3)).ravel();
+    edges = self.__tri_edges.data[moved_to].ravel();
+    edge_sides = self.__edge_sides.data;
+    for c in range(2):
+      found = edge_sides[edges,c]==old_sides;
+      edge_sides[edges[found],c] = new_sides[found];
+    self.__update_neighbors(np.unique(edges));
+
   def get_mesh(self):
     """ 
     return triangles and points in domain and image space
@@ -296,12 +594,12 @@ class AdaptiveMesh(object):
       new_simplices.extend( [(q+i, q+i+1, p+i  ) for i in range(0,nCA)] ); # lower triangles
       new_simplices.extend( [(p+i, q+i+1, p+i+1) for i in range(0,nCA)] ); # upper triangles
          
-    # update points in mesh (points are no longer unique!)
+    # update points in mesh (duplicate points are merged)
     logging.debug("refining_skinny_triangles(): adding %d points"%len(new_domain_points));
     new_domain_points=np.asarray(new_domain_points);  
-    new_image_points=self.mapping(new_domain_points);
-    self.domain= np.vstack((self.domain,new_domain_points));    
-    self.image = np.vstack((self.image, new_image_points)); 
+    new_image_points=self.__map(new_domain_points);
+    index = self.__add_new_points(new_domain_points,new_image_points);
+    new_simplices = index[np.asarray(new_simplices)-nPointsOrigMesh];
     
    
     if bPlot:   
@@ -321,7 +619,7 @@ class AdaptiveMesh(object):
     assert(abs((old-new)/old)<1e-10) # segmentation of triangle has no holes/overlaps
 
     # update list of simplices
-    return self.__add_new_simplices(np.asarray(new_simplices),bSkinny);  
+    return self.__add_new_simplices(new_simplices,bSkinny);  
   
   
   def refine_skinny_triangles(self,skip_triangle=None,rthresh=5,Athresh=1e-10,scale_sampling=0.5,bPlot=False):
@@ -376,10 +674,10 @@ class AdaptiveMesh(object):
     # find point as C (opposit to min_edge) and calculate midpoint on CA and CB
     indC = min_edge-1;
     A,B,C,new_domain_points,new_image_points = \
-                self.__resample_edges_of_triangle(simplices,indC,x=(0.5,));
+                self.__resample_edges_of_triangle(np.flatnonzero(bSkinny),indC,x=(0.5,));
     # unique domain_points
-    new_domain_points = np.vstack(set(map(tuple, new_domain_points.reshape(2*nTriangles,2))))
-    new_image_points = self.mapping(new_domain_points);
+    new_domain_points = np.unique(new_domain_points.reshape(2*nTriangles,2),axis=0);
+    new_image_points = self.__map(new_domain_points);
     
     if bPlot:   
       from matplotlib.collections import PolyCollection
@@ -395,16 +693,16 @@ class AdaptiveMesh(object):
     
     # update triangulation  
     logging.debug("refining_skinny_triangles(): adding %d points"% (new_domain_points.shape[0]));
-    self.image = np.vstack((self.image,new_image_points)); 
-    self.domain= np.vstack((self.domain,new_domain_points));   
-    self.__tri.add_points(new_domain_points);
+    nPoints = self.domain.shape[0];
+    self.__add_new_points(new_domain_points,new_image_points);
+    self.__tri.add_points(self.domain[nPoints:]);         # only points that are not yet in mesh
     self.simplices = self.__tri.simplices;
 
     return 2*nTriangles;     
 
 
       
-  def refine_large_triangles(self,is_large):
+  def refine_large_triangles(self,is_large,bisection=None):
     """
     subdivide large triangles in the image mesh
     
@@ -413,6 +711,9 @@ class AdaptiveMesh(object):
       is_large : function, mask=is_large(triangles)
         function, which accepts a list of simplices of shape (nTriangles, 3) 
         and returns a flag for each triangle indicating if it should be subdivided
+      bisection : bool, optional
+        if True, use longest-edge bisection (see refine_large_triangles_by_bisection()),
+        default: only if mesh is no longer a Delaunay mesh
     
     Returns
     --------
@@ -424,9 +725,9 @@ class AdaptiveMesh(object):
       and the Delaunay triangulation is recalculated. Edge flips can occur.
       This procedure is suboptimal, as it produces skinny triangles.
     """
-    # check if mesh is still a Delaunay mesh
-    if self.__tri is None:
-      raise RuntimeError('Mesh is no longer a Delaunay mesh. Subdivision not implemented for this case.');
+    # use bisection, if mesh is no longer a Delaunay mesh
+    if bisection is None: bisection = self.__tri is None;
+    if bisection: return self.refine_large_triangles_by_bisection(is_large);
     
     ind = is_large(self.simplices);
     if np.sum(ind)==0: return; # nothing to do
@@ -435,14 +736,14 @@ class AdaptiveMesh(object):
     new_domain_points = np.sum(self.domain[self.simplices[ind]],axis=1)/3; # shape (nTriangles,2)
     # remove invalid points (coordinates are nan)    
     # new_domain_points = new_domain_points[~np.any(np.isnan(new_domain_points),axis=1)]
-    # update triangulation    
-    self.__tri.add_points(new_domain_points);
     logging.debug("refining_large_triangles(): adding %d points"%(new_domain_points.shape[0]))
     
     # calculate image points and update data
-    new_image_points = self.mapping(new_domain_points);
-    self.image = np.vstack((self.image,new_image_points));
-    self.domain= np.vstack((self.domain,new_domain_points));
+    new_image_points = self.__map(new_domain_points);
+    nPoints = self.domain.shape[0];
+    self.__add_new_points(new_domain_points,new_image_points);
+    # update triangulation (only points that are not yet in mesh)
+    self.__tri.add_points(self.domain[nPoints:]);
     # remove degenerated triangles (p1,p2 identical to A or B) => area is 0 
     simplices = self.__tri.simplices;
     area = self.get_area_in_domain(simplices);    
@@ -453,21 +754,94 @@ class AdaptiveMesh(object):
     return new_domain_points.shape[0];
 
 
+  def refine_large_triangles_by_bisection(self,is_large):
+    """
+    subdivide large triangles in the image mesh by longest-edge bisection
+    (works also for meshes which are no longer Delaunay meshes)
+    
+    Parameters
+    ----------
+      is_large : function, mask=is_large(triangles)
+        function, which accepts a list of simplices of shape (nTriangles, 3) 
+        and returns a flag for each triangle indicating if it should be subdivided
+    
+    Returns
+    --------
+      number of points added to the triangulation                 
+    
+    Note
+    ----
+      The longest edge (in domain space) of each large triangle is split at its
+      midpoint. To keep the mesh conforming, the neighboring triangles are split
+      at the same point. A triangle with a split edge always splits its own longest 
+      edge as well (closure), which avoids skinny triangles. Depending on the number
+      of split edges, a triangle (a,b,c) with longest edge ab is divided into
+      2, 3 or 4 triangles using the midpoints M,N,K of the edges ab,bc,ca:
+        ab split:       (a,M,c), (M,b,c)
+        ab,bc split:    (a,M,c), (M,b,N), (M,N,c)
+        ab,ca split:    (a,M,K), (K,M,c), (M,b,c)
+        all edges split:(a,M,K), (K,M,c), (M,b,N), (M,N,c)
+    """
+    simplices = self.simplices;
+    nTriangles= simplices.shape[0];
+    # edges of all triangles from adjacency, edge i of a triangle connects vertex i and i+1
+    # (edges contains also edges of removed triangles, which are never split)
+    P = simplices; Q = np.roll(simplices,-1,axis=1);             # shape (nTriangles,3)
+    edges = self.__edges.data;                                   # shape (nEdges,2)
+    tri_edges = self.__tri_edges.data;                           # edge index for each side
+    # longest edge of each triangle in domain space
+    lensq = np.sum((self.domain[Q]-self.domain[P])**2,axis=2);   # shape (nTriangles,3)
+    longest = np.argmax(lensq,axis=1);
+    longest_edge = tri_edges[np.arange(nTriangles),longest];
+    
+    # mark longest edge of large triangles and close the marking: each 
+    # triangle with a marked edge must also split its longest edge
+    bSplit = np.zeros(edges.shape[0],dtype=bool);
+    bSplit[longest_edge[is_large(simplices)]] = True;
+    while True:
+      bRefine = np.any(bSplit[tri_edges],axis=1);
+      if np.all(bSplit[longest_edge[bRefine]]): break
+      bSplit[longest_edge[bRefine]] = True;
+    if not np.any(bSplit): return 0;                             # nothing to do
+    
+    # add midpoints of all split edges
+    new_domain_points = 0.5*(self.domain[edges[bSplit,0]]+self.domain[edges[bSplit,1]]);
+    logging.debug("refine_large_triangles_by_bisection(): splitting %d triangles, adding %d points"
+                    %(np.sum(bRefine),new_domain_points.shape[0]));
+    new_image_points = self.__map(new_domain_points);
+    midpoint = -np.ones(edges.shape[0],dtype=int);               # index of midpoint of each edge
+    midpoint[bSplit] = self.__add_new_points(new_domain_points,new_image_points);
+    
+    # rotate vertices of refined triangles such that ab is the longest edge
+    ind = np.where(bRefine)[0]; j = longest[ind];
+    a,b,c = [simplices[ind,(j+k)%3] for k in range(3)];
+    M,N,K = [midpoint[tri_edges[ind,(j+k)%3]] for k in range(3)];   # midpoints of ab,bc,ca
+    bN = N>=0; bK = K>=0;
+    new_simplices = np.vstack((
+      np.column_stack((M,b,c))[~bN], np.column_stack((M,b,N))[bN], np.column_stack((M,N,c))[bN],
+      np.column_stack((a,M,c))[~bK], np.column_stack((a,M,K))[bK], np.column_stack((K,M,c))[bK] ));
+    self.__add_new_simplices(new_simplices,bRefine);
+    return new_domain_points.shape[0];
+
+
   def refine_broken_triangles(self,is_broken,nDivide=10,bPlot=False,bPlotTriangles=[0]):
     """
     subdivide triangles which contain discontinuities in the image mesh or invalid vertices
       is_broken  ... function mask=is_broken(triangles) that accepts a list of 
                       simplices of shape (nTriangles, 3) and returns a flag 
                       for each triangle indicating if it should be subdivided
-      nDivide    ... (opt) number of subdivisions of each side of broken triangle
+      nDivide    ... (opt) precision for locating the discontinuity on each side of the
+                      broken triangle, corresponds to a sampling with nDivide points
+                      (found by bisection with ceil(log2(nDivide-1)) mapping calls)
       bPlot      ... (opt) plot sampling and selected points for debugging 
       bPlotTriangles (opt) list of triangle indices for which segmentation should be shown
 
     returns: number of new triangles
-    Note: The resulting mesh will be no longer a Delaunay mesh (identical points 
-          might be present, circumference rule not guaranteed). Mesh functions, 
-          that need this property (like refine_large_triangles()) will not work
-          after calling this function.
+    Note: The resulting mesh will be no longer a Delaunay mesh (hanging nodes
+          at edges to unbroken neighbors, circumference rule not guaranteed). 
+          Neighboring broken triangles share the new points on their common 
+          edge. Mesh functions, that need this property (like refine_skinny_triangles()) will not work
+          after calling this function (refine_large_triangles() switches to bisection).
     """
     broken = is_broken(self.simplices);                    # shape (nSimplices)
     simplices = self.simplices[broken];                    # shape (nTriangles,3)
@@ -481,7 +855,6 @@ class AdaptiveMesh(object):
     # check if subdivision is needed at all    
     nTriangles = np.sum(broken)
     if nTriangles==0: return 0;                 # noting to do!
-    nPointsOrigMesh = self.image.shape[0];  
     
     # add new simplices:
     # segmentation of each broken triangle is generated in a cyclic manner,
@@ -506,28 +879,16 @@ class AdaptiveMesh(object):
     lensq = np.sum( np.diff(triangles[:,[0,1,2,0]],axis=1)**2, axis=2); # shape (nTriangles,3)
     min_edge = np.argmin( lensq,axis=1);                                # shape (nTriangles)
  
-    # find point as C (opposit to min_edge) and resample CA and CB
+    # find point as C (opposit to min_edge) and locate discontinuity on CA and CB,
+    # i.e., the segment with the largest length in image space (by bisection)
     indC = min_edge-1;
-    A,B,C,domain_points,image_points = self.__resample_edges_of_triangle(simplices,indC,nDivide=nDivide);
-                                                           # shape (nDivide,2,nTriangles,2)
-    # determine indices of broken segments (largest elements in CA and CB)
-    len_segments = np.sum(np.diff(image_points,axis=0)**2,axis=-1); 
-                                                    # shape (nDivide-1,2,nTriangle)
-    largest_segments = np.argmax(len_segments,axis=0); # shape (2,nTriangle) 
-    edge_points = np.asarray((largest_segments,largest_segments+1));
-                                                    # shape (2,2,nTriangle)
- 
-    # set points p1 ... p4 for segmentation of triangle
-    # see http://stackoverflow.com/questions/15660885/correctly-indexing-a-multidimensional-numpy-array-with-another-array-of-indices
-    idx_tuple = (edge_points[...,np.newaxis],) + tuple(np.ogrid[:2,:nTriangles,:2]);
-    new_domain_points = domain_points[idx_tuple];
-    new_image_points  = image_points[idx_tuple];    
+    A,B,C,new_domain_points,new_image_points = \
+          self.__bisect_edges_of_triangle(np.flatnonzero(broken),indC,self.__select_discontinuity,nDivide=nDivide);
               # shape (2,2,nTriangle,2), indicating iDistance,iEdge,iTriangle,(x/y)
  
-    # update points in mesh (points are no longer unique!)
+    # update points in mesh (points on shared edges are merged)
     logging.debug("refining_broken_triangles(): adding %d points"%(4*nTriangles));
-    self.image = np.vstack((self.image,new_image_points.reshape(-1,2))); 
-    self.domain= np.vstack((self.domain,new_domain_points.reshape(-1,2)));    
+    index = self.__add_new_points(new_domain_points.reshape(-1,2),new_image_points.reshape(-1,2));
    
     if bPlot:   
       from matplotlib.collections import PolyCollection
@@ -536,18 +897,15 @@ class AdaptiveMesh(object):
       ax1,ax2 = fig.axes;
       #params = dict(facecolors='r', edgecolors='none', alpha=0.3);      
       #ax1.add_collection(PolyCollection(self.domain[simplices],**params));   
-      ax1.plot(domain_points[...,0].flat,domain_points[...,1].flat,'k.',label='test points');
       ax1.plot(new_domain_points[...,0].flat,new_domain_points[...,1].flat,'g.',label='selected points');
       ax1.legend(loc=0);      
-      ax2.plot(image_points[...,0].flat,image_points[...,1].flat,'k.')
       ax2.plot(new_image_points[...,0].flat,new_image_points[...,1].flat,'g.',label='selected points');   
     
     # indices for points p1 ... p4 in new list of points self.domain 
-    # (offset by number of points in the original mesh!)
     # Note: by construction, the order of p1 ... p4 corresponds exactly to the order
     #       shown above (first tuple contains points closest to C,
     #       first on CA, then on CB, second tuple beyond the discontinuity)
-    (p1,p2),(p3,p4) = np.arange(4*nTriangles).reshape(2,2,nTriangles) + nPointsOrigMesh;
+    (p1,p2),(p3,p4) = index.reshape(2,2,nTriangles);
                                                     # shape (nTriangles,)
     # construct the five triangles from points
     t1=np.vstack((C,p1,p2));                        # shape (3,nTriangles)
@@ -584,7 +942,9 @@ class AdaptiveMesh(object):
   def refine_invalid_triangles(self,nDivide=10,bPlot=False,bPlotTriangles=[0]):
     """
     subdivide triangles which have one or two invalid vertices (x or y coordinate are np.nan)
-      nDivide    ... (opt) number of subdivisions of each side of triangle
+      nDivide    ... (opt) precision for locating the boundary of the valid region on
+                      each side of the triangle, corresponds to a sampling with nDivide
+                      points (found by bisection with ceil(log2(nDivide-1)) mapping calls)
       bPlot      ... (opt) plot sampling and selected points for debugging 
       bPlotTriangles (opt) list of triangle indices for which segmentation should be shown
 
@@ -593,8 +953,8 @@ class AdaptiveMesh(object):
     Note: This function might also reuse refine_broken_triangles(), if we 
           replace NaN's by a very large but finit number. However it might
           be less clean.
-    Note: The resulting mesh will be no longer a Delaunay mesh (identical 
-          points might be present, circumference rule n ot guaranteed) 
+    Note: The resulting mesh will be no longer a Delaunay mesh (hanging 
+          nodes might be present, circumference rule not guaranteed) 
           and the total area in domain is reduced.
     """
     vertices = self.image[self.simplices];                 # shape (nSimplices,3,2)    
@@ -610,12 +970,11 @@ class AdaptiveMesh(object):
     #  3. all vertices are invalid (triangle is skipped)
     # all triangles with only valid vertices are unchanged
     nInvalidVertices = np.sum(bInvalidVertex,axis=1);      # shape (nSimplices)
-    new_simplices=[]; 
     ind_case1 = nInvalidVertices==1;
-    new_simplices.extend(self.__subdivide_triangles_with_one_invalid_vertex(ind_case1,nDivide=nDivide));
     ind_case2 = nInvalidVertices==2;
-    new_simplices.extend(self.__subdivide_triangles_with_two_invalid_vertices(ind_case2,nDivide=nDivide));
-    new_simplices=np.reshape(new_simplices,(-1,3));    
+    new_simplices=np.vstack((
+      self.__subdivide_triangles_with_one_invalid_vertex(ind_case1,nDivide=nDivide),
+      self.__subdivide_triangles_with_two_invalid_vertices(ind_case2,nDivide=nDivide)));
     
     # update list of simplices
     bReplace=nInvalidVertices>0;   # includes case 1, 2 and 3
@@ -636,39 +995,31 @@ class AdaptiveMesh(object):
            /___________\           (p1,A,p2),(A,B,p2)
           A              B 
     """
-    if ~np.any(bInvalid): return [];                       # nothing to do
+    if ~np.any(bInvalid): return np.empty((0,3),dtype=int);  # nothing to do
     simplices = self.simplices[bInvalid];                  # shape (nTriangles,3)
     triangles = self.image[simplices];                     # shape (nTriangles,3,2)
     nTriangles= triangles.shape[0];
-    nPointsOrigMesh = self.image.shape[0];  
     
     # find invalid point as C (index on first axis) and resample CA and CB
     indC = np.where(np.any(np.isnan(triangles),axis=-1))[1];
-    A,B,C,domain_points,image_points = self.__resample_edges_of_triangle(simplices,indC,nDivide=nDivide);
-                                                           # shape (nDivide,2,nTriangles,2)
+    A,B,C,domain_points,image_points = \
+          self.__bisect_edges_of_triangle(np.flatnonzero(bInvalid),indC,self.__select_boundary,nDivide=nDivide);
+                                                           # shape (2,2,nTriangles,2)
     assert(np.all(np.any(np.isnan(self.image[C]),axis=-1)));  # all points C should be invalid
 
-    # iterate over all triangles and subdivide them
-    new_domain_points=[];
-    new_image_points=[];
-    new_simplices=[];
-    for k in range(nTriangles):    
-      # find index of first valid point p1 on CA and p2 on CB
-      ind = np.any(np.isnan(image_points[:,:,k]),axis=-1);  # shape (nDivide,2)
-      p1=np.where(~ind[:,0])[0][0];                   # first valid point on CA
-      p2=np.where(~ind[:,1])[0][0];                   # first valid ponit on CB
-      new_domain_points.extend((domain_points[p1,0,k,:], domain_points[p2,1,k,:]));
-      new_image_points.extend( ( image_points[p1,0,k,:],  image_points[p2,1,k,:]));
-      # calculate index for points p1 and p2 in self.domain = [self.domain, new_domain_points]
-      P1 = nPointsOrigMesh+2*k; P2=P1+1;
-      new_simplices.extend(((P1,A[k],P2), (A[k],B[k],P2)));
-
-    # update points in mesh (points are no longer unique!)
-    logging.debug("refine_invalid_triangles(case1): adding %d points"%(2*nTriangles));
-    self.image = np.vstack((self.image,np.reshape(new_image_points,(2*nTriangles,2)))); 
-    self.domain= np.vstack((self.domain,np.reshape(new_domain_points,(2*nTriangles,2))));  
+    # find index of first valid point p1 on CA and p2 on CB for all triangles
+    bValid = ~np.any(np.isnan(image_points),axis=-1);      # shape (nSamples,2,nTriangles)
+    first  = np.argmax(bValid,axis=0);                     # shape (2,nTriangles)
+    iSide,iTriangle = np.ogrid[:2,:nTriangles];
+    new_domain_points = domain_points[first,iSide,iTriangle]; # shape (2,nTriangles,2)
+    new_image_points  = image_points[first,iSide,iTriangle];
 
-    return np.reshape(new_simplices,(2*nTriangles,3));
+    # update points in mesh (points on shared edges are merged)
+    logging.debug("refine_invalid_triangles(case1): adding %d points"%(2*nTriangles));
+    P1,P2 = self.__add_new_points(new_domain_points.reshape(-1,2),
+                                  new_image_points.reshape(-1,2)).reshape(2,nTriangles);
+    # create new simplices (p1,A,p2),(A,B,p2) for each triangle
+    return np.vstack((np.column_stack((P1,A,P2)), np.column_stack((A,B,P2))));
     
 
   def __subdivide_triangles_with_two_invalid_vertices(self,bInvalid,nDivide=10):
@@ -684,51 +1035,43 @@ class AdaptiveMesh(object):
            xxxxxxxxxxxxxx           (p1,p2,C)
           A              B 
     """
-    if ~np.any(bInvalid): return [];                       # nothing to do
+    if ~np.any(bInvalid): return np.empty((0,3),dtype=int);  # nothing to do
     simplices = self.simplices[bInvalid];                  # shape (nTriangles,3)
     triangles = self.image[simplices];                     # shape (nTriangles,3,2)
     nTriangles= triangles.shape[0];
-    nPointsOrigMesh = self.image.shape[0];  
 
     # find valid point as C (index on first axis) and resample CA and CB
     indC = np.where(~np.any(np.isnan(triangles),axis=-1))[1];
-    A,B,C,domain_points,image_points = self.__resample_edges_of_triangle(simplices,indC,nDivide=nDivide);
-                                                           # shape (nDivide,2,nTriangles,2)
+    A,B,C,domain_points,image_points = \
+          self.__bisect_edges_of_triangle(np.flatnonzero(bInvalid),indC,self.__select_boundary,nDivide=nDivide);
+                                                           # shape (2,2,nTriangles,2)
     assert(np.all(np.any(np.isnan(self.image[A]),axis=-1)));  # all points A should be invalid
     assert(np.all(np.any(np.isnan(self.image[B]),axis=-1)));  # all points B should be invalid
     
-    # iterate over all triangles and subdivide them
-    new_domain_points=[];
-    new_image_points=[];
-    new_simplices=[];
-    for k in range(nTriangles):    
-      # find index of first valid point p1 on CA and p2 on CB
-      ind = np.any(np.isnan(image_points[:,:,k]),axis=-1);  # shape (nDivide,2)
-      p1=np.where(~ind[:,0])[0][-1];                   # last valid point on CA
-      p2=np.where(~ind[:,1])[0][-1];                   # last valid ponit on CB
-      new_domain_points.extend((domain_points[p1,0,k,:], domain_points[p2,1,k,:]));
-      new_image_points.extend( ( image_points[p1,0,k,:],  image_points[p2,1,k,:]));
-      # calculate index for points p1 and p2 in self.domain = [self.domain, new_domain_points]
-      P1 = nPointsOrigMesh+2*k; P2=P1+1;
-      new_simplices.append((P1,P2,C[k]));
+    # find index of last valid point p1 on CA and p2 on CB for all triangles
+    bValid = ~np.any(np.isnan(image_points),axis=-1);      # shape (nSamples,2,nTriangles)
+    last   = bValid.shape[0]-1-np.argmax(bValid[::-1],axis=0); # shape (2,nTriangles)
+    iSide,iTriangle = np.ogrid[:2,:nTriangles];
+    new_domain_points = domain_points[last,iSide,iTriangle];  # shape (2,nTriangles,2)
+    new_image_points  = image_points[last,iSide,iTriangle];
  
-    # update points in mesh (points are no longer unique!)
+    # update points in mesh (points on shared edges are merged)
     logging.debug("refine_invalid_triangles(case2): adding %d points"%(2*nTriangles));
-    self.image = np.vstack((self.image,np.reshape(new_image_points,(2*nTriangles,2)))); 
-    self.domain= np.vstack((self.domain,np.reshape(new_domain_points,(2*nTriangles,2))));  
-
-    return np.reshape(new_simplices,(nTriangles,3));
+    P1,P2 = self.__add_new_points(new_domain_points.reshape(-1,2),
+                                  new_image_points.reshape(-1,2)).reshape(2,nTriangles);
+    # create new simplex (p1,p2,C) for each triangle
+    return np.column_stack((P1,P2,C));
         
 
 
-  def __resample_edges_of_triangle(self,simplices,indC,x=None,nDivide=10):
+  def __resample_edges_of_triangle(self,rows,indC,x=None,nDivide=10):
     """
     generate dense sampling on edges CA and CB on given simplices
     
     Parameters
     ----------
-      simplices : ndarray of shape (nTriangles,3)
-        vertex indices of triangles that should be resampled
+      rows : vector of ints, length nTriangles
+        index of triangles (in self.simplices) that should be resampled
       indC : vector of length nTriangles
         vertex number (mod 3) that should be used as point C
       x : vector of floats, optional
@@ -751,19 +1094,138 @@ class AdaptiveMesh(object):
     else:
       x = np.asarray(x); 
       nDivide=x.size;
+    # get edges CA and CB (shared edges are sampled only once, if x is symmetric)
+    A,B,C,edges,inverse,flip = self.__get_edges_of_triangle(rows,indC,np.allclose(x,1-x[::-1]));
+    # create dense sampling along each edge in domain space and map it to image space
+    P,Q = edges.T;
+    edge_domain = self.__points_on_edges(P,Q,x[:,np.newaxis]); # shape (nDivide,nEdges,2)
+    edge_image  = self.__map(edge_domain.reshape(-1,2)).reshape(edge_domain.shape);
+    return A,B,C,self.__distribute_to_triangles(edge_domain,inverse,flip),\
+                 self.__distribute_to_triangles(edge_image,inverse,flip);
+      
+
+  def __bisect_edges_of_triangle(self,rows,indC,select,nDivide=10):
+    """
+    locate a discontinuity or boundary on edges CA and CB of given simplices by bisection
+    
+    Parameters
+    ----------
+      rows : vector of ints, length nTriangles
+        index of triangles (in self.simplices) that should be resampled
+      indC : vector of length nTriangles
+        vertex number (mod 3) that should be used as point C
+      select : function bLower=select(image_lo,image_mid,image_hi)
+        accepts the image points at the start, center and end of the current
+        interval on each edge (each of shape (nEdges,2)) and returns a flag 
+        for each edge indicating if the search continues in the lower half
+      nDivide : integer, optional
+        precision of the search, corresponds to a sampling with nDivide points
+        on each edge, i.e., ceil(log2(nDivide-1)) bisection steps are performed
+      
+    Returns
+    -------
+      A,B,C : vector of ints, length (nTriangles)
+        indices of points A,B,C
+      domain_points : ndarray of shape (2,2,nTriangle,2)
+        end points of final interval on CA,CB in domain, indices are (iPoint,iSide,iTriangle,xy),
+        the first point (iPoint=0) is closer to C
+      image_points : ndarray of shape (2,2,nTriangle,2)
+        end points of final interval on CA,CB in image
+    """
+    nIter = int(np.ceil(np.log2(nDivide-1))) if nDivide>2 else 0;
+    A,B,C,edges,inverse,flip = self.__get_edges_of_triangle(rows,indC);
+    # bisection of interval [lo,hi] along each edge P->Q (one mapping call for all edges per step)
+    P,Q = edges.T;
+    lo = np.zeros(P.size);   image_lo = self.image[P];  
+    hi = np.ones(P.size);    image_hi = self.image[Q];
+    for it in range(nIter):
+      mid = (lo+hi)/2.;
+      image_mid = self.__map(self.__points_on_edges(P,Q,mid));
+      bLower = select(image_lo,image_mid,image_hi);      # shape (nEdges,)
+      hi = np.where(bLower,mid,hi); image_hi = np.where(bLower[:,np.newaxis],image_mid,image_hi);
+      lo = np.where(bLower,lo,mid); image_lo = np.where(bLower[:,np.newaxis],image_lo,image_mid);
+    logging.debug("bisect_edges_of_triangle(): %d steps for %d edges"%(nIter,P.size));
+    edge_domain = self.__points_on_edges(P,Q,np.asarray((lo,hi)));   # shape (2,nEdges,2)
+    edge_image  = np.asarray((image_lo,image_hi));
+    return A,B,C,self.__distribute_to_triangles(edge_domain,inverse,flip),\
+                 self.__distribute_to_triangles(edge_image,inverse,flip);
+
+  @staticmethod
+  def __select_discontinuity(image_lo,image_mid,image_hi):
+    " bisection criterion: lower half of interval has larger length in image (invalid points: infinite length)"
+    len_lo = np.sum((image_mid-image_lo)**2,axis=-1);
+    len_hi = np.sum((image_hi-image_mid)**2,axis=-1);
+    return np.where(np.isnan(len_lo),np.inf,len_lo) >= np.where(np.isnan(len_hi),np.inf,len_hi);
+    
+  @staticmethod
+  def __select_boundary(image_lo,image_mid,image_hi):
+    " bisection criterion: validity of image points changes in lower half of interval"
+    return np.any(np.isnan(image_lo),axis=-1) != np.any(np.isnan(image_mid),axis=-1);
+
+
+  def __get_edges_of_triangle(self,rows,indC,bShare=True):
+    """
+    edge -> sampling map for edges CA and CB of the triangles with given row index
+    
+    Edges shared by neighboring triangles are sampled and mapped only once, 
+    the sampling direction P->Q is always from lower to higher vertex index
+    (bShare=False: no reversal of direction, only identical edges are shared).
+    The edges are taken from the adjacency of the mesh (no search over all edges).
+    
+    Returns
+    -------
+      A,B,C : vector of ints, length (nTriangles)
+        indices of points A,B,C
+      edges : ndarray of ints, shape (nEdges,2)
+        indices of points P,Q of each unique edge
+      inverse : vector of ints, length (2*nTriangles)
+        index of the edge for sides CA and CB of each triangle (CA first)
+      flip : vector of bools, length (2*nTriangles)
+        indicates, if the edge is sampled from A (or B) to C
+    """
     # get indices of points ABC as shown above (C is isolated point)
+    simplices = self.simplices[rows];
+    tri_edges = self.__tri_edges.data[rows];
     nTriangles = simplices.shape[0];    
     ind_triangle = np.arange(nTriangles)
     C = simplices[ind_triangle,(indC)%3];
     A = simplices[ind_triangle,(indC+1)%3];
     B = simplices[ind_triangle,(indC-1)%3];
-    # create dense sampling along C->B and C->A in domain space
-    CA = np.outer(1-x,self.domain[C]) + np.outer(x,self.domain[A]);
-    CB = np.outer(1-x,self.domain[C]) + np.outer(x,self.domain[B]);
-    # map sampling on CA and CB to image space 
-    domain_points= np.hstack((CA,CB)).reshape(nDivide,2,nTriangles,2);
-    image_points = self.mapping(domain_points.reshape(-1,2)).reshape(nDivide,2,nTriangles,2);
-    return A,B,C,domain_points,image_points;       
+    # edges CA and CB (side C->A and B->C of triangle), shape (2*nTriangles,)
+    start = np.hstack((C,C)); end = np.hstack((A,B));
+    ids = np.hstack((tri_edges[ind_triangle,(indC)%3],tri_edges[ind_triangle,(indC-1)%3]));
+    if bShare: 
+      flip = start>end; 
+    else:      
+      flip = np.zeros(2*nTriangles,dtype=bool);
+      ids = 2*ids + (start>end);                       # separate id for each direction
+    ids,inverse = np.unique(ids,return_inverse=True);
+    if bShare: 
+      edges = self.__edges.data[ids];                  # shape (nEdges,2), P<Q
+    else:
+      edges = self.__edges.data[ids//2];
+      edges = np.where((ids%2==1)[:,np.newaxis],edges[:,::-1],edges);
+    logging.debug("get_edges_of_triangle(): %d of %d edges are shared"%(2*nTriangles-edges.shape[0],2*nTriangles));
+    return A,B,C,edges,inverse.ravel(),flip;
+    
+  def __points_on_edges(self,P,Q,x):
+    """
+    points (1-x)*P + x*Q in domain space along edges P->Q
+      P,Q ... vertex indices, shape (nEdges,)
+      x   ... position along edge, shape (nEdges,) or (nPoints,nEdges)
+    returns: domain points, shape x.shape+(2,)
+    """
+    x = np.asarray(x)[...,np.newaxis];
+    return (1-x)*self.domain[P] + x*self.domain[Q];
+    
+  def __distribute_to_triangles(self,edge_values,inverse,flip):
+    """
+    distribute values along each edge (shape (nPoints,nEdges,2)) to the sides CA 
+    and CB of each triangle (shape (nPoints,2,nTriangles,2)), see __get_edges_of_triangle() 
+    """
+    values = edge_values[:,inverse];                   # shape (nPoints,2*nTriangles,2)
+    values[:,flip] = values[::-1,flip];                # reverse order on flipped edges
+    return values.reshape(values.shape[0],2,-1,2);
 
 
   def  __add_new_simplices(self,new_simplices,bReplace):
@@ -779,7 +1241,47 @@ class AdaptiveMesh(object):
     degenerated = np.abs(area/self.initial_domain_area)<1e-10;
     new_simplices = new_simplices[~degenerated];        # remove degenerate triangles
     assert(np.all(area[~degenerated]>0));               # by construction all triangles are oriented ccw
-    # update simplices in mesh    
+    # update simplices in mesh and adjacency (new triangles take free rows)
     self.__tri = None; # delete initial Delaunay triangulation        
-    self.simplices=np.vstack((self.simplices[~bReplace], new_simplices)); # no longer Delaunay
+    new_edges = self.__get_edge_ids(new_simplices);
+    replaced = np.flatnonzero(bReplace);
+    self.__unlink_sides((3*replaced[:,np.newaxis]+np.arange(3)).ravel());
+    index,moved_from,moved_to = self.__simplices.replace(bReplace,new_simplices);  # no longer Delaunay
+    self.__tri_edges.replace(bReplace,new_edges);                               # same rows as simplices
+    self.__neighbors.replace(bReplace,-np.ones_like(new_simplices));
+    self.__move_sides(moved_from,moved_to);
+    self.__link_sides((3*index[:,np.newaxis]+np.arange(3)).ravel());
     return new_simplices.shape[0];
+
+  def __map(self,domain_points):
+    """
+      evaluate mapping for given domain points using a cache of previous results
+      (key: exact domain coordinates). Only points which have not been mapped
+      before are passed to self.mapping (in a single call).
+        domain_points ... shape(nPoints,2)
+      returns: image points, shape(nPoints,2)
+    """
+    domain_points = np.asarray(domain_points,dtype=float).reshape(-1,2);
+    index,missing = self.__cache_index.add(domain_points,len(self.__cache_image));
+    if missing.size>0:
+      new_domain_points = domain_points[missing];     # unique points in order of first occurrence
+      new_image_points  = self.mapping(new_domain_points);
+      assert new_image_points.shape==new_domain_points.shape, "mapping returns wrong shape";
+      self.__cache_image.append(new_image_points);
+    logging.debug("mapping of %d points (%d cached)"%(missing.size,domain_points.shape[0]-missing.size));
+    return self.__cache_image.data[index];
+    
+  def __add_new_points(self,new_domain_points,new_image_points):
+    """
+      append new points to the mesh (amortized cost proportional to number of new points)
+      Points with identical domain coordinates are stored only once, i.e., points
+      which are already part of the mesh or occur several times are merged.
+        new_domain_points ... shape(nPoints,2)
+        new_image_points  ... shape(nPoints,2)
+      returns: index of each point in self.domain and self.image, shape (nPoints,)
+    """
+    index,new = self.__point_index.add(new_domain_points,len(self.__domain));
+    self.__domain.append(new_domain_points[new]);
+    self.__image.append(new_image_points[new]);
+    assert len(self.__domain)==len(self.__image)==len(self.__point_index);
+    return index;
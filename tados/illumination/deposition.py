@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Deposition of the intensity of triangles on the pixels of a detector.
+
+Two backends are provided:
+  'numpy' ... loop over triangles in Python, vectorized point_in_triangle
+  'numba' ... JIT-compiled loops over triangles and pixels (requires numba)
+By default, the numba backend is used if numba is installed.
+
+@author: Hambach
+"""
+
+from __future__ import division
+import importlib.util
+import logging
+import numpy as np
+
+from tados.illumination.point_in_triangle import point_in_triangle
+
+_backend = None;            # current backend, selected at first use
+_numba_deposit = None;      # compiled kernel of numba backend
+
+def available_backends():
+  " returns list of names of all backends that can be used "
+  backends = ['numpy'];
+  if importlib.util.find_spec('numba') is not None: backends.append('numba');
+  return backends;
+
+def set_backend(name='auto'):
+  """
+  select backend for the deposition of triangles
+    name ... 'numpy', 'numba' or 'auto' (numba if available, else numpy)
+  """
+  global _backend
+  backends = available_backends();
+  if name=='auto': name = backends[-1];
+  if name not in backends:
+    raise ValueError("Backend '%s' is not available, choose one of %s."%(name,backends));
+  logging.debug("deposition: using backend '%s'"%name);
+  _backend = name;
+
+def get_backend():
+  " returns name of current backend "
+  if _backend is None: set_backend('auto');
+  return _backend;
+
+def deposit_triangles(points,triangles,density,intensity):
+  """
+  add the density of each triangle to the intensity of all points inside the
+  triangle (same result as a loop over point_in_triangle() for each triangle)
+    points    ... coordinates of detector pixels, shape (2,...)
+    triangles ... coordinates of triangle vertices, shape (nTriangles,3,2)
+    density   ... intensity per area for each triangle, shape (nTriangles,)
+    intensity ... intensity of detector pixels, shape points.shape[1:],
+                    is updated in place
+  """
+  if get_backend()=='numba':
+    x,y = np.asarray(points,dtype=float).reshape(2,-1);
+    flat = np.ascontiguousarray(intensity,dtype=float).reshape(-1);
+    order = np.argsort(x,kind='stable');
+    _get_numba_kernel()(x,y,order,x[order],np.ascontiguousarray(triangles,dtype=float),
+                         np.ascontiguousarray(density,dtype=float),flat);
+    intensity[...] = flat.reshape(intensity.shape);
+  else:
+    for s,triangle in enumerate(triangles):
+      mask = point_in_triangle(points,triangle);
+      intensity += density[s]*mask;
+
+def _get_numba_kernel():
+  " compile numba kernel at first use "
+  global _numba_deposit
+  if _numba_deposit is None:
+    import numba
+
+    @numba.njit(error_model='numpy')
+    def deposit(x,y,order,xsorted,triangles,density,intensity):
+      for s in range(triangles.shape[0]):
+        ax,ay = triangles[s,0,0],triangles[s,0,1];
+        bx,by = triangles[s,1,0],triangles[s,1,1];
+        cx,cy = triangles[s,2,0],triangles[s,2,1];
+        xmin,xmax = min(ax,bx,cx),max(ax,bx,cx);
+        ymin,ymax = min(ay,by,cy),max(ay,by,cy);
+        d = density[s];
+        # only pixels with x inside the bounding box need to be tested, except
+        # for non-finite densities, which contribute (nan) to all pixels
+        if np.isfinite(d):
+          lo = np.searchsorted(xsorted,xmin,side='right');
+          hi = np.searchsorted(xsorted,xmax,side='left');
+        else:
+          lo = 0; hi = x.shape[0];
+        # barycentric coordinates (see point_in_triangle.PIT_barycentric)
+        v0x,v0y = cx-ax,cy-ay;
+        v1x,v1y = bx-ax,by-ay;
+        dot00 = v0x*v0x+v0y*v0y;
+        dot01 = v0x*v1x+v0y*v1y;
+        dot11 = v1x*v1x+v1y*v1y;
+        invDenom = 1. / (dot00 * dot11 - dot01 * dot01);
+        for k in range(lo,hi):
+          p = order[k];
+          inside = x[p]>xmin and x[p]<xmax and y[p]>ymin and y[p]<ymax;
+          if inside:
+            v2x,v2y = x[p]-ax,y[p]-ay;
+            dot02 = v0x*v2x+v0y*v2y;
+            dot12 = v1x*v2x+v1y*v2y;
+            u = (dot11 * dot02 - dot01 * dot12) * invDenom;
+            v = (dot00 * dot12 - dot01 * dot02) * invDenom;
+            inside = (u >= 0) and (v >= 0) and (u + v < 1);
+          if inside:               intensity[p] += d;
+          elif not np.isfinite(d): intensity[p] += d*0.;
+
+    _numba_deposit = deposit;
+  return _numba_deposit;
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduler for refining several adaptive meshes at the same time and
+collecting their mapping requests in one batched mapping call per round.
+This amortizes the (large) fixed overhead of each raytrace call, e.g.,
+for array traces via the Zemax DDE link.
+
+@author: Hambach
+"""
+
+from __future__ import division
+import threading
+import logging
+import numpy as np
+
+
+class MappingScheduler(object):
+  """
+  Each task (e.g. the refinement of an adaptive mesh for one field point)
+  runs in a separate worker thread and uses a mapping function provided
+  by the scheduler. A round ends, when all running tasks are waiting for
+  their mapping results (or have finished). The pending domain points of
+  all tasks are then concatenated and evaluated by a single call of the
+  batch mapping in the thread that called run().
+  """
+
+  def __init__(self,batch_mapping,max_active=64):
+    """
+      batch_mapping ... function image=batch_mapping(task_ids,domain_points) that
+                          accepts a list of domain points of shape (nPoints,2) and
+                          the index of the requesting task for each point, shape
+                          (nPoints,), and returns the image points, shape (nPoints,2)
+      max_active    ... (opt) maximal number of tasks that run simultaneously
+    """
+    self.batch_mapping = batch_mapping;
+    self.max_active = max_active;
+    self.ncalls = 0;                      # number of batched mapping calls
+
+  def run(self,tasks):
+    """
+    run all tasks and evaluate their mapping requests in batched calls
+      tasks ... list of functions result=task(mapping), where the function
+                  image=mapping(domain_points) should be used for evaluating
+                  the mapping for domain points of shape (nPoints,2)
+    Returns: list of results of all tasks
+    """
+    cond     = threading.Condition();
+    pending  = {};                        # key: task index, value: requested domain points
+    mapped   = {};                        # key: task index, value: image points or exception
+    running  = set();
+    results  = [None]*len(tasks);
+    errors   = [];
+
+    def start(i):
+      " run task i in worker thread "
+      def mapping(domain_points):
+        domain_points = np.asarray(domain_points,dtype=float).reshape(-1,2);
+        with cond:
+          pending[i] = domain_points;
+          cond.notify_all();
+          cond.wait_for(lambda: i in mapped);
+          image_points = mapped.pop(i);
+        if isinstance(image_points,Exception): raise image_points;
+        return image_points;
+      def worker():
+        try:
+          results[i] = tasks[i](mapping);
+        except Exception as e:
+          errors.append(e);
+        finally:
+          with cond:
+            running.discard(i);
+            cond.notify_all();
+      running.add(i);
+      thread = threading.Thread(target=worker,name="MappingScheduler-task%d"%i);
+      thread.daemon = True;
+      thread.start();
+
+    next_task = 0;
+    with cond:
+      while True:
+        while next_task<len(tasks) and len(running)<self.max_active:
+          start(next_task); next_task+=1;
+        if not running: break;
+        # wait until each running task is waiting for its mapping results
+        cond.wait_for(lambda: len(pending)==len(running));
+        if not pending: continue;
+        requests = dict(pending); pending.clear();
+        # evaluate all requests in one call (without blocking the worker threads)
+        cond.release();
+        try:     images = self.__evaluate(requests);
+        except Exception as e:
+          errors.append(e);
+          images = dict((i,RuntimeError("batched mapping failed")) for i in requests);
+        finally: cond.acquire();
+        mapped.update(images);
+        cond.notify_all();
+    if errors: raise errors[0];
+    return results;
+
+  def __evaluate(self,requests):
+    " evaluate mapping for dictionary of requests {task: domain_points} in a single call "
+    keys  = sorted(requests.keys());
+    sizes = [requests[i].shape[0] for i in keys];
+    task_ids = np.repeat(keys,sizes);
+    domain_points = np.concatenate([requests[i] for i in keys]);
+    logging.debug("MappingScheduler: mapping of %d points for %d tasks"%(domain_points.shape[0],len(keys)));
+    image_points = np.asarray(self.batch_mapping(task_ids,domain_points));
+    assert image_points.shape==domain_points.shape, "batch mapping returns wrong shape";
+    self.ncalls += 1;
+    return dict(zip(keys,np.split(image_points,np.cumsum(sizes)[:-1])));
@@ -15,24 +15,142 @@ ToDo: add unit tests
 
 from __future__ import division
 import abc, six
+import copy
 import logging
 import numpy as np
 import matplotlib.pylab as plt
 
 from tados.illumination.point_in_triangle import point_in_triangle
+from tados.illumination.deposition import deposit_triangles
 from tados.illumination.adaptive_mesh import AdaptiveMesh
+from tados.illumination.scheduler import MappingScheduler
 from tados.zemax.sampling import hexapolar_sampling
 
 @six.add_metaclass(abc.ABCMeta)
 class Detector(object):
+  """
+  Base class for detectors. The recorded data is stored in the attributes
+  listed in _accumulators, which are summed when merging detectors with 
+  identical geometry (attributes listed in _geometry). This allows to
+  split a calculation (e.g. field points, wavelengths, Monte-Carlo runs) 
+  over several processes and to combine or checkpoint partial results.
+  """
+  _geometry    = ();              # attributes defining the detector geometry
+  _accumulators= ('intensity',);  # attributes with recorded data
+  chunksize    = 2**16;           # max. number of simplices that are processed at once in add()
+  
   @abc.abstractmethod
   def add(self,mesh,bSkip=[],weight=1): return;
   @abc.abstractmethod  
   def show(self): return;
+  
+  def _iter_chunks(self,mesh,bSkip=[],weight=1):
+    """
+    iterate over the simplices of the mesh in chunks of at most chunksize 
+    simplices (in order of mesh.simplices), which limits the size of 
+    temporary arrays for very large meshes
+      mesh ... instance of AdaptiveMesh 
+      bSkip... logical array indicating simplices that should be skipped
+      weight.. weight of contribution (intensity in Watt)
+    Returns: generator of tuples (simplices, density) for each chunk
+      simplices... simplices in chunk, which are not skipped, shape (nChunk,3)
+      density  ... intensity per image area of each simplex, shape (nChunk,)
+    """
+    nTriangles = mesh.simplices.shape[0];
+    bSkip = np.asarray(bSkip,dtype=bool) if len(bSkip)>0 else np.zeros(nTriangles,dtype=bool);
+    for start in range(0,nTriangles,self.chunksize):
+      chunk = slice(start,start+self.chunksize);
+      simplices = mesh.simplices[chunk][~bSkip[chunk]];
+      domain_area = mesh.get_area_in_domain(simplices); 
+      domain_area/= mesh.initial_domain_area;     # normalized weight in domain
+      image_area  = mesh.get_area_in_image(simplices);  # size of triangle in image
+      yield simplices, weight * abs( domain_area / image_area);
+      
+  def reset(self):
+    " set detector to empty state (remove all recorded data) "
+    for name in self._accumulators:
+      setattr(self,name,np.zeros_like(getattr(self,name)));
+  
+  def empty(self):
+    " returns a copy of the detector with same geometry but without recorded data "
+    detector = copy.deepcopy(self);
+    detector.reset();
+    return detector;
+    
+  def merge(self,other):
+    """
+    add recorded data of other detector with identical geometry
+      other ... instance of the same Detector class
+    Returns: self
+    """
+    self.__check_geometry(type(other),dict((name,getattr(other,name)) for name in self._geometry));
+    self._merge_data(other);
+    return self;
+    
+  def save(self,filename):
+    """
+    save geometry and recorded data of detector in compressed numpy file (.npz)
+      filename ... name of file or file object
+    """
+    arrays = dict((name,getattr(self,name)) for name in self._geometry);
+    arrays.update(self._get_data());
+    np.savez_compressed(filename,detector_class=type(self).__name__,**arrays);
+    
+  def load(self,filename):
+    """
+    replace recorded data by data from file (see save()), the geometry of 
+    the detector in the file must be identical to the current detector
+      filename ... name of file or file object
+    Returns: self
+    """
+    with np.load(filename) as f:
+      if str(f['detector_class']) != type(self).__name__:
+        raise ValueError("Detector type '%s' in file differs from '%s'."%(f['detector_class'],type(self).__name__));
+      self.__check_geometry(type(self),dict((name,f[name]) for name in self._geometry));
+      self._set_data(f);
+    return self;
+
+  def relative_difference(self,other):
+    """
+    returns the L1-norm of the difference between the recorded data of 
+    both detectors relative to the L1-norm of the data of this detector
+      other ... instance of the same Detector class
+    """
+    data = self._get_data(); other_data = other._get_data();
+    diff = sum(np.nansum(np.abs(data[name]-other_data[name])) for name in data);
+    norm = sum(np.nansum(np.abs(data[name])) for name in data);
+    return diff/norm if norm>0 else float(diff>0);
+  
+  # access to recorded data, detectors with data that is not stored in 
+  # the arrays listed in _accumulators should overwrite these methods 
+  def _merge_data(self,other):
+    " add recorded data of other detector "
+    for name in self._accumulators:
+      data = getattr(self,name);
+      data+= getattr(other,name);
+
+  def _get_data(self):
+    " returns dictionary of arrays with recorded data "
+    return dict((name,getattr(self,name)) for name in self._accumulators);
+
+  def _set_data(self,data):
+    " replace recorded data by arrays from dictionary (see _get_data()) "
+    for name in self._accumulators:
+      setattr(self,name,data[name].astype(getattr(self,name).dtype));
+  
+  def __check_geometry(self,other_class,other_geometry):
+    " raise ValueError, if geometry of other detector differs "
+    if other_class is not type(self):
+      raise ValueError("Detectors of type '%s' and '%s' cannot be merged."%(type(self).__name__,other_class.__name__));
+    for name in self._geometry:
+      if not np.array_equal(getattr(self,name),other_geometry[name]):
+        raise ValueError("Detectors differ in geometry ('%s')."%name);
 
 
 class CheckTriangulationDetector(Detector):
   " Detector class for testing completeness of triangulation in domain"
+  _geometry    = ('ref_domain_area',);
+  _accumulators= ();                     # only logging, no recorded data
 
   def __init__(self, ref_area=np.pi):
     """
@@ -74,6 +192,7 @@ class CheckTriangulationDetector(Detector):
      
 class RectImageDetector(Detector):    
   " 2D Image Detector with cartesian coordinates "
+  _geometry = ('extent','pixels','origin');
 
   def __init__(self, extent=(1,1), pixels=(100,100), origin=(0,0)):
     """
@@ -102,15 +221,8 @@ class RectImageDetector(Detector):
       bSkip... logical array indicating simplices that should be skipped
       weight.. weight of contribution (intensity in Watt)
     """
-    domain_area = mesh.get_area_in_domain();
-    domain_area/= mesh.initial_domain_area;       # normalized weight in domain
-    image_area  = mesh.get_area_in_image();       # size of triangle in image
-    density = weight * abs( domain_area / image_area);
-    for s,simplex in enumerate(mesh.simplices):
-      if len(bSkip)>0 and bSkip[s]: continue
-      triangle = mesh.image[simplex];
-      mask = point_in_triangle(self.points,triangle);
-      self.intensity += density[s]*mask;
+    for simplices,density in self._iter_chunks(mesh,bSkip,weight):
+      deposit_triangles(self.points,mesh.image[simplices],density,self.intensity);
 
   def show(self,fMask=None):
     """
@@ -181,12 +293,203 @@ class RectImageDetector(Detector):
     yprofile = np.nansum(intensity,axis=0)*dx; # integral over x  
     return yaxis,yprofile;
     
+class SparseImageDetector(Detector):
+  """
+  2D Image Detector with cartesian coordinates, which stores only the 
+  illuminated parts of the detector. The pixels are grouped in square tiles
+  of tile_size x tile_size pixels. A tile that is completely covered by a
+  triangle only records a constant value, pixel data is allocated only for
+  tiles that contain an edge of a triangle (i.e. a gradient of the intensity).
+  Memory and deposition time scale with the illuminated area (and the length
+  of the edges in the footprint) instead of the size of the detector.
+  Without invalid triangles, the footprint is the same as for a 
+  RectImageDetector of the same geometry.
+  """
+  _geometry    = ('extent','pixels','origin','tile_size');
+  _accumulators= ();                     # recorded data is stored in dictionaries
+
+  def __init__(self, extent=(1,1), pixels=(1000,1000), origin=(0,0), tile_size=16):
+    """
+     extent ... size of detector in image space (xwidth, ywidth)
+     pixels ... number of pixels in x and y at full resolution (xnum,ynum)
+     origin ... center position of detector in image space (x0,y0)
+     tile_size. number of pixels along each side of a tile
+    """
+    self.extent = np.asarray(extent);
+    self.pixels = np.asarray(pixels);
+    self.origin = np.asarray(origin);
+    self.tile_size = tile_size;
+    # cartesian sampling (same as RectImageDetector)
+    xmax,ymax = self.extent/2.; nx,ny = self.pixels; x0,y0 = self.origin   
+    xbins = np.linspace(x0-xmax,x0+xmax,nx+1);    # edges of nx pixels  
+    ybins = np.linspace(y0-ymax,y0+ymax,ny+1);
+    self.x = 0.5*(xbins[:-1]+xbins[1:]);          # centers of nx pixels
+    self.y = 0.5*(ybins[:-1]+ybins[1:]);    
+    self.reset();
+
+  def reset(self):
+    " set detector to empty state (remove all recorded data) "
+    self.tile_constant = {};               # key: tile index (tx,ty), value: constant intensity
+    self.tile_data = {};                   # key: tile index (tx,ty), value: intensity of pixels
+  
+  def add(self,mesh,bSkip=[],weight=1):
+    """
+    calculate footprint in image plane (triangles with invalid vertices are ignored)
+      mesh ... instance of AdaptiveMesh 
+      bSkip... logical array indicating simplices that should be skipped
+      weight.. weight of contribution (intensity in Watt)
+    """
+    for simplices,density in self._iter_chunks(mesh,bSkip,weight):
+      self.__deposit(mesh.image[simplices],density);
+        
+  def __deposit(self,triangles,density):
+    """
+    add constant density to all pixels with center inside each triangle
+      triangles ... coordinates of triangle vertices, shape (nTriangles,3,2)
+      density   ... intensity per area for each triangle, shape (nTriangles,)
+    """
+    valid = np.all(np.isfinite(triangles),axis=(1,2)) & np.isfinite(density);
+    triangles,density = triangles[valid],density[valid];
+    # range of pixels [i0,i1) x [j0,j1) with centers inside the bounding box of each triangle
+    tmin,tmax = np.min(triangles,axis=1), np.max(triangles,axis=1);
+    i0,i1 = np.searchsorted(self.x,tmin[:,0],side='right'), np.searchsorted(self.x,tmax[:,0],side='left');
+    j0,j1 = np.searchsorted(self.y,tmin[:,1],side='right'), np.searchsorted(self.y,tmax[:,1],side='left');
+    valid = (i0<i1) & (j0<j1);
+    triangles,density,i0,i1,j0,j1 = [a[valid] for a in (triangles,density,i0,i1,j0,j1)];
+    # all pairs of triangle s and tile (tx,ty) in the bounding box of the triangle
+    t = self.tile_size; nx,ny = self.pixels;
+    tx0,ty0 = i0//t, j0//t;
+    ntx,nty = (i1-1)//t-tx0+1, (j1-1)//t-ty0+1;
+    counts = ntx*nty;
+    s = np.repeat(np.arange(counts.size),counts);
+    k = np.arange(s.size) - np.repeat(np.cumsum(counts)-counts,counts);
+    tx,ty = tx0[s]+k//nty[s], ty0[s]+k%nty[s];
+    # tile is completely covered by the triangle, if its corner pixels are inside
+    ib,jb = np.minimum(nx,tx*t+t), np.minimum(ny,ty*t+t);      # end of tile
+    full = (i0[s]<=tx*t) & (i1[s]>=ib) & (j0[s]<=ty*t) & (j1[s]>=jb);
+    corners = np.stack((self.x[np.stack((tx*t,tx*t,ib-1,ib-1))],
+                        self.y[np.stack((ty*t,jb-1,ty*t,jb-1))]));  # shape (2,4,nPairs)
+    full[full] = np.all(self.__corners_in_triangles(corners[...,full],triangles[s[full]]),axis=0);
+    tiles,inverse = np.unique(np.stack((tx,ty),axis=1),axis=0,return_inverse=True);
+    inverse = inverse.ravel();
+    constant = np.bincount(inverse[full],weights=density[s[full]],minlength=len(tiles));
+    for n in np.flatnonzero(np.bincount(inverse[full],minlength=len(tiles))):
+      key = tuple(tiles[n]);
+      self.tile_constant[key] = self.tile_constant.get(key,0) + constant[n];
+    # otherwise test each pixel in the tile (all triangles of one tile at once)
+    edge = np.flatnonzero(~full);
+    edge = edge[np.argsort(inverse[edge],kind='stable')];
+    bounds = np.flatnonzero(np.diff(inverse[edge]))+1;
+    for group in np.split(edge,bounds) if edge.size>0 else []:
+      tx,ty = key = tuple(tiles[inverse[group[0]]]);
+      ia,ib,ja,jb = tx*t,min(nx,tx*t+t),ty*t,min(ny,ty*t+t);
+      points = np.asarray(np.meshgrid(self.x[ia:ib],self.y[ja:jb],indexing='ij'));
+      tile = np.zeros((t,t));
+      deposit_triangles(points,triangles[s[group]],density[s[group]],tile[:ib-ia,:jb-ja]);
+      if np.any(tile):
+        if key not in self.tile_data: self.tile_data[key] = tile;
+        else: self.tile_data[key] += tile;
+
+  @staticmethod
+  def __corners_in_triangles(points,triangles):
+    """
+    barycentric point-in-triangle test (see PIT_barycentric) for many triangles
+      points    ... coordinates of points, shape (2,nCorners,nTriangles)
+      triangles ... coordinates of triangles, shape (nTriangles,3,2)
+    Returns: boolean array of shape (nCorners,nTriangles)
+    """
+    a,b,c = triangles.transpose(1,2,0);       # shape (2,nTriangles)
+    v0 = c-a; v1 = b-a; v2 = points-a[:,np.newaxis];
+    dot00 = np.sum(v0*v0,axis=0); dot01 = np.sum(v0*v1,axis=0); dot11 = np.sum(v1*v1,axis=0);
+    dot02 = np.sum(v0[:,np.newaxis]*v2,axis=0); dot12 = np.sum(v1[:,np.newaxis]*v2,axis=0);
+    with np.errstate(divide='ignore',invalid='ignore'):
+      invDenom = 1. / (dot00 * dot11 - dot01 * dot01);
+      u = (dot11 * dot02 - dot01 * dot12) * invDenom;
+      v = (dot00 * dot12 - dot01 * dot02) * invDenom;
+    return (u >= 0) & (v >= 0) & (u + v < 1);
+  
+  def get_footprint(self,pixels=None):
+    """
+    export the footprint to a dense grid with arbitrary resolution
+      pixels ... (opt) number of pixels in x and y (xnum,ynum), default: full resolution
+    Returns:
+      X,Y      ... coordinates of pixel centers, shape (xnum,ynum)
+      intensity... 2d intensity sampled at the pixel centers, shape (xnum,ynum)
+    """
+    if pixels is None: pixels = self.pixels;
+    xmax,ymax = self.extent/2.; x0,y0 = self.origin;
+    xbins = np.linspace(x0-xmax,x0+xmax,pixels[0]+1);
+    ybins = np.linspace(y0-ymax,y0+ymax,pixels[1]+1);
+    x = 0.5*(xbins[:-1]+xbins[1:]); y = 0.5*(ybins[:-1]+ybins[1:]); 
+    # index of pixel at full resolution, which contains each sampling point
+    dx,dy = self.extent/self.pixels;
+    ix = np.clip(np.floor((x-(x0-xmax))/dx).astype(int),0,self.pixels[0]-1);
+    iy = np.clip(np.floor((y-(y0-ymax))/dy).astype(int),0,self.pixels[1]-1);
+    # fill intensity tile by tile (ix,iy are sorted)
+    t = self.tile_size;
+    intensity = np.zeros(pixels);
+    for key in set(self.tile_constant).union(self.tile_data):
+      tx,ty = key;
+      xslice = slice(*np.searchsorted(ix,(tx*t,tx*t+t)));
+      yslice = slice(*np.searchsorted(iy,(ty*t,ty*t+t)));
+      intensity[xslice,yslice] += self.tile_constant.get(key,0);
+      if key in self.tile_data:
+        intensity[xslice,yslice] += self.tile_data[key][np.ix_(ix[xslice]-tx*t,iy[yslice]-ty*t)];
+    X,Y = np.meshgrid(x,y,indexing='ij');
+    return X,Y,intensity
+
+  def show(self,pixels=None):
+    """
+    plotting 2D footprint in image plane and tiles with pixel data
+      pixels ... (opt) resolution of the plot (xnum,ynum), default: full resolution
+    Return: figure handle
+    """
+    X,Y,intensity = self.get_footprint(pixels);
+    fig,ax1 = plt.subplots(1);
+    ax1.set_title("SparseImageDetector: footprint in image plane");
+    x0,y0=self.origin-self.extent/2.; x1,y1=self.origin+self.extent/2.;
+    ax1.imshow(intensity.T,origin='lower',aspect='auto',interpolation='hanning',
+             extent=[x0,x1,y0,y1]);
+    logging.debug('SparseImageDetector: %d constant tiles, %d tiles with pixel data'
+                   %(len(self.tile_constant),len(self.tile_data)));
+    dx,dy = self.extent/self.pixels;
+    logging.debug('SparseImageDetector: total power = %5.3f W'%(np.sum(self.get_footprint()[2])*dx*dy)); 
+    return fig
+
+  # sparse recorded data (see Detector)
+  def relative_difference(self,other):
+    intensity = self.get_footprint()[2]; other_intensity = other.get_footprint()[2];
+    norm = np.nansum(np.abs(intensity));
+    diff = np.nansum(np.abs(intensity-other_intensity));
+    return diff/norm if norm>0 else float(diff>0);
+
+  def _merge_data(self,other):
+    for key,value in other.tile_constant.items():
+      self.tile_constant[key] = self.tile_constant.get(key,0) + value;
+    for key,data in other.tile_data.items():
+      if key in self.tile_data: self.tile_data[key] += data;
+      else:                     self.tile_data[key] = data.copy();
+
+  def _get_data(self):
+    t = self.tile_size;
+    return { 'constant_keys': np.array(list(self.tile_constant.keys()),dtype=int).reshape(-1,2),
+             'constant':      np.array(list(self.tile_constant.values()),dtype=float),
+             'data_keys':     np.array(list(self.tile_data.keys()),dtype=int).reshape(-1,2),
+             'data':          np.array(list(self.tile_data.values()),dtype=float).reshape(-1,t,t) };
+
+  def _set_data(self,data):
+    self.tile_constant = dict(zip(map(tuple,data['constant_keys'].tolist()),data['constant']));
+    self.tile_data = dict(zip(map(tuple,data['data_keys'].tolist()),data['data'].copy()));
+
+
 class PolarImageDetector(Detector):    
   """
   2D Image Detector with polar coordinates
   Todo: correct coordinates of pixels to coincide with center 
   (rmax denotes extent, i.e, pixel edge, while coordinates refer to pixel centers)
   """
+  _geometry = ('rmax','nrings');
+  
   def __init__(self, rmax=1, nrings=100):
     """
      rmax ... radial size of detector in image space
@@ -194,10 +497,11 @@ class PolarImageDetector(Detector):
     """
     self.rmax = rmax;
     self.nrings = nrings;
-    ret = hexapolar_sampling(nrings,rmax=rmax,ind=True); 
+    ret = hexapolar_sampling(nrings,rmax=rmax,ind=True,offsets=True); 
     self.points = np.asarray(ret[0:2]);     # shape: (2,nPixels)
     self.points_per_ring = ret[2];          # shape: (nrings,)
     self.weight_of_ring  = ret[3];          # shape: (nrings,)
+    self.ring_offsets    = ret[4];          # shape: (nrings+1,), pixels of ring i: ring_offsets[i]:ring_offsets[i+1]
     self.intensity = np.zeros(self.points.shape[1]);  # 1d array
 
   def add(self,mesh,bSkip=[],weight=1):
@@ -207,15 +511,8 @@ class PolarImageDetector(Detector):
       bSkip... logical array indicating simplices that should be skipped
       weight.. weight of contribution (intensity in Watt)
     """
-    domain_area = mesh.get_area_in_domain(); 
-    domain_area/= mesh.initial_domain_area;       # normalized weight in domain
-    image_area  = mesh.get_area_in_image();       # size of triangle in image
-    density = weight * abs( domain_area / image_area);
-    for s,simplex in enumerate(mesh.simplices):
-      if len(bSkip)>0 and bSkip[s]: continue
-      triangle = mesh.image[simplex];
-      mask = point_in_triangle(self.points,triangle);
-      self.intensity += density[s]*mask;
+    for simplices,density in self._iter_chunks(mesh,bSkip,weight):
+      deposit_triangles(self.points,mesh.image[simplices],density,self.intensity);
 
   def show(self):
     " plotting 2D footprint in image plane, returns figure handle"
@@ -245,15 +542,10 @@ class PolarImageDetector(Detector):
     Calculate azimuthal avererage over detector (radial projection).
     Return: r, radial_profile, encircled_energy, shape: (nrings,)
     """
-    Nr=np.insert(np.cumsum(self.points_per_ring),0,0); # index array for rings, size (nrings+1,)
+    first = self.ring_offsets[:-1];                   # index of first pixel in each ring
     # radial profile    
-    radial_profile = np.empty(self.nrings);
-    r = np.empty(self.nrings);
-    for i in range(self.nrings):
-      radial_profile[i] = np.sum(self.intensity[Nr[i]:Nr[i+1]]) / self.points_per_ring[i];
-      r2 = np.sum(self.points[:,Nr[i]:Nr[i+1]]**2,axis=0)
-      assert np.allclose(r2[0],r2);
-      r[i] = np.sqrt(r2[0]);
+    radial_profile = np.add.reduceat(self.intensity,first) / self.points_per_ring;
+    r = np.hypot(*self.points[:,first]);               # radius of each ring
     # encircled energy (area of ring = weight of ring x total area of detector)
     encircled_energy = np.cumsum(radial_profile*self.weight_of_ring*np.pi*self.rmax**2);
     return r, radial_profile, encircled_energy
@@ -262,7 +554,12 @@ class PolarImageDetector(Detector):
 class LineImageDetector(Detector):    
   """
   1D Image Detector along a specified direction
+  
+  The intensity of pixel k is the exact average of the projected density over
+  the interval [x_k,x_k+dx) along the detector (with x_k = k*dx = points[k]).
   """
+  _geometry = ('pixels','start','end');
+  
   def __init__(self, pixels=50, start=(0,0), end=(1,0)):
     """
      pixels ... number of pixels
@@ -285,28 +582,22 @@ class LineImageDetector(Detector):
       weight.. weight of contribution (intensity in Watt)
       bPlot... if True, plot triangulation and calculated density on line-detector
     """
-    # get coordinates of each triangle in mesh
-    simplices = mesh.simplices;                        # shape (nTriangles,3)
-    if np.any(bSkip): simplices=simplices[~bSkip];
-    triangles = mesh.image[simplices];                 # shape (nTriangles,3,2)
-
-    # switch to coordinates along direction of detector
+    # coordinate system along direction of detector
     ex = self.end-self.start;                          # new x-axis (normalized vector)
     xmax=np.linalg.norm(ex);
     ex = ex/xmax;
     ey = np.array((-ex[1],ex[0]));                     # new y-axis (perpendicular to x)
-    triangles_along_dir = \
-      np.tensordot(triangles-self.start, [ex,ey], axes=(2,1));    # (i,j,:) * (k,:), shape (nTriangles,3,2)
-
-    # calculate weight of each triangle
-    domain_area = mesh.get_area_in_domain(); 
-    domain_area/= mesh.initial_domain_area;       # normalized weight in domain
-    image_area  = mesh.get_area_in_image();       # size of triangle in image
-    density = weight * abs( domain_area / image_area);
-    if np.any(bSkip): density=density[~bSkip];
-
-    # integrate over triangle (given in coordinates along direction and perpendicular)
-    intensity=self.__project_triangles_to_x(triangles_along_dir,xmax,density);
+
+    # integrate over triangles chunk-wise, the accumulators do not depend on the chunksize
+    acc = np.zeros((3,self.pixels+1));
+    for simplices,density in self._iter_chunks(mesh,bSkip,weight):
+      x,y = (mesh.image[simplices]-self.start).T;      # shape (3,nChunk) each
+      triangles_along_dir = np.stack((x*ex[0]+y*ex[1], x*ey[0]+y*ey[1]),axis=-1); 
+      triangles_along_dir = triangles_along_dir.transpose(1,0,2);   # shape (nChunk,3,2)
+      self.__project_triangles_to_x(triangles_along_dir,xmax,density,acc);
+    # partial pixels + cumulative sum of slope and offset of linear pieces (at pixel centers)
+    xc = (self.__x_rc+0.5/self.pixels)*xmax;
+    intensity = acc[0,:-1] + np.cumsum(acc[1])[:-1]*xc + np.cumsum(acc[2])[:-1];
     self.intensity+=intensity;
     
     # DEBUG: plot mesh and calculated intensity
@@ -315,6 +606,7 @@ class LineImageDetector(Detector):
       # plot triangulation and projection axis
       ax1.set_title("LineImageDetector: Triangulation and Projected Density");
       ax1.set_aspect('equal');
+      simplices = mesh.simplices[~np.asarray(bSkip,dtype=bool)] if np.any(bSkip) else mesh.simplices;
       ax1.triplot(mesh.image[:,0], mesh.image[:,1], simplices,'b-');        
       ax1.plot([self.start[0],self.end[0]],[self.start[1],self.end[1]],'r',label='projection axis');
       # plot rotated intensity
@@ -325,9 +617,13 @@ class LineImageDetector(Detector):
       ax1.legend(loc=0);
 
 
-  def __project_triangles_to_x(self,triangles,xmax,weights):
-    " project all triangles (shape: nTriangles,3,2) to x-coordinate in interval (0,xmax)"
-    # ToDo: could be replaced by more efficient function (C-code)
+  def __project_triangles_to_x(self,triangles,xmax,weights,acc):
+    """
+    project all triangles (shape: nTriangles,3,2) to x-coordinate in interval (0,xmax)
+    and add the average over each pixel to the accumulators acc, shape (3,pixels+1), 
+    containing the values for partially covered pixels and the difference arrays 
+    for slope and offset in completely covered pixels
+    """
     nTriangles= triangles.shape[0];  
     x=triangles[:,:,0]; y=triangles[:,:,1];
 
@@ -341,21 +637,42 @@ class LineImageDetector(Detector):
  
     # calculate distance of vertices to line AB (along y-direction)
     Cy= np.abs( (Cy-Ay) - (By-Ay) * ((Cx-Ax)/(Bx-Ax)) );
-    Ay=By=0;
-
-    # setup x-points for projecting triangles, and indices inside triangle
-    x,_=np.meshgrid( self.__x_rc*xmax, np.arange(nTriangles), indexing='ij' );
-    dy =np.zeros(x.shape);    
-    iAC = np.logical_and(Ax<=x,x<Cx);
-    iCB = np.logical_and(Cx<=x,x<=Bx);
-
-    # determin y-height of AC and CB over AB for all x-values between [0,xmax) 
-    dy[iAC] = ((x-Ax) * (Cy/(Cx-Ax)))[iAC];   # AC
-    dy[iCB] = ((x-Bx) * (Cy/(Cx-Bx)))[iCB];   # CB
-    assert np.all(dy>=0), "projected area should be non-negative"    
+
+    # the projected height is piecewise linear, dy = slope*(x-x0), with pieces
+    # AC for x in [Ax,Cx) and CB for x in [Cx,Bx), clipped to the detector [a,b)
+    # (pieces are ordered by triangles, i.e., AC and CB of first triangle, ...)
+    a  = np.clip(np.column_stack(( Ax, Cx )).ravel(),0,xmax);
+    b  = np.clip(np.column_stack(( Cx, Bx )).ravel(),0,xmax);
+    x0 = np.column_stack(( Ax, Bx )).ravel();
+    with np.errstate(divide='ignore',invalid='ignore'):
+      slope = (np.column_stack(( Cy/(Cx-Ax), Cy/(Cx-Bx) )) * weights[:,np.newaxis]).ravel();
+    with np.errstate(invalid='ignore'):
+      valid = (b>a) & np.isfinite(slope);      # no empty pieces or invalid triangles
+    a,b,x0,slope = a[valid],b[valid],x0[valid],slope[valid];
+    
+    # first pixel ka and last pixel kb of each piece (pixel k covers [k*dx,(k+1)*dx))
+    dx = xmax/self.pixels;
+    ka = np.minimum(np.floor(a/dx).astype(int),self.pixels-1);
+    kb = np.maximum(np.floor(b/dx).astype(int),ka);
+    
+    # partially covered first and last pixel: exact integral of the linear piece
+    # over [a,ea) and [eb,b), written in terms of the height difference slope*(hi-lo),
+    # which stays finite also for very narrow triangles with large slopes
+    same = (ka==kb);
+    ea = np.where(same,b,(ka+1)*dx);  eb = np.where(same,b,kb*dx);
+    Ia = slope*(ea-a)*(0.5*(a+ea)-x0);
+    Ib = slope*(b-eb)*(0.5*(eb+b)-x0);
+    np.add.at(acc[0],np.column_stack(( ka, kb )).ravel(),np.column_stack(( Ia, Ib )).ravel()/dx);
     
-    # calculate weighted sum over all triangles
-    return np.nansum(dy*weights,axis=1);   
+    # completely covered pixels ka+1,...,kb-1: average is slope*(xc-x0) at pixel 
+    # center xc, sum up slope and offset using difference arrays, i.e., add the 
+    # coefficients at ka+1 and subtract them at kb (np.add.at adds sequentially,
+    # therefore the result does not depend on the splitting of the triangles in chunks)
+    full  = (kb-ka>1);
+    ind   = np.column_stack(( ka[full]+1, kb[full] )).ravel();
+    slope = slope[full]; offset=-slope*x0[full];
+    np.add.at(acc[1],ind,np.column_stack(( slope, -slope )).ravel());
+    np.add.at(acc[2],ind,np.column_stack(( offset,-offset)).ravel());   
    
   def show(self,fig=None,**kwargs):
     " plot projected intensity in image plane, returns figure handle"
@@ -401,39 +718,172 @@ class Transmission(object):
     self.weights = weights;   
    
     
-  def total_transmission(self, lthresh, Athresh=np.pi/1000):
+  def total_transmission(self, lthresh, Athresh=np.pi/1000, executor=None, batched=False, rtol=None):
+    """
+    perform transmission calculation for all parameters and update detectors
     
-    def is_broken(simplices):
-        " local help function for defining which simplices should be subdivided"
-        broken = Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh);
-        area_broken = Mesh.get_area_in_domain(simplices=simplices[broken]);
-        broken[broken] = (area_broken>Athresh);  # only consider triangles > Athresh as broken
-        return broken;
-        
-    # incoherent sum on detector over all raytrace parameters
+      lthresh  ... absolute threshold for longest side of broken triangle (image space) 
+      Athresh  ... (opt) minimal area of broken triangles that are subdivided (domain space)
+      executor ... (opt) instance of concurrent.futures.Executor, if given, the mesh
+                     refinement for each parameter is performed in a separate worker 
+                     which records its results in empty copies of the detectors. 
+                     The partial detectors are summed up at the end. For a 
+                     ProcessPoolExecutor, raytrace and detectors must be picklable.
+      batched  ... (opt) if True, the meshes for all parameters are refined simultaneously
+                     and the pending mesh points of all parameters are traced in one
+                     call of raytrace per refinement round (see MappingScheduler). 
+                     In this case, raytrace is called with one set of parameters per 
+                     point, i.e., para has shape (nPoints,Np) (unpack with para.T)
+      rtol     ... (opt) target accuracy of the detector results relative to the power of 
+                     each parameter. If given, only the broken triangles with the largest 
+                     power are refined, until the power of the remaining broken triangles
+                     and the change of the detector results between two refinement levels
+                     are both below rtol (see _refine_until_converged()).
+    """
+    if batched:
+      if executor is not None: raise ValueError("batched mode cannot be combined with executor");
+      self.__batched_transmission(lthresh, Athresh, rtol);
+      return
+    if executor is None:
+      # incoherent sum on detector over all raytrace parameters
+      for ip,p in enumerate(self.parameters):
+        _transmission_for_parameter(p, self.weights[ip], self.mesh_points, self.raytrace,
+                                    self.detectors, lthresh, Athresh, rtol, bPlot=(ip==0));
+      return
+      
+    # parallel evaluation of each parameter in separate worker
+    futures = [];
     for ip,p in enumerate(self.parameters):
-      logging.info("Transmission for parameter: "+str(p));      
+      partial_detectors = [d.empty() for d in self.detectors];
+      futures.append( executor.submit(_transmission_for_parameter, p, self.weights[ip], 
+                        self.mesh_points, self.raytrace, partial_detectors, lthresh, Athresh, rtol) );
+    # incoherent sum of partial detectors (in order of parameters)
+    for future in futures:
+      for d,partial in zip(self.detectors,future.result()):
+        d.merge(partial);
+
+  def __batched_transmission(self, lthresh, Athresh, rtol):
+    " transmission with one batched raytrace per refinement round for all parameters "
+    parameters = np.asarray(self.parameters);
+    batch_raytrace = lambda iparams,points: self.raytrace(parameters[iparams],points);
+    scheduler = MappingScheduler(batch_raytrace);
+    def task(ip):
+      def run(mapping):
+        partial_detectors = [d.empty() for d in self.detectors];
+        raytrace = lambda p,points: mapping(points);
+        return _transmission_for_parameter(parameters[ip], self.weights[ip], self.mesh_points,
+                                           raytrace, partial_detectors, lthresh, Athresh, rtol);
+      return run;
+    results = scheduler.run([task(ip) for ip in range(parameters.shape[0])]);
+    logging.debug("Transmission: %d batched raytrace calls"%scheduler.ncalls);
+    # incoherent sum of partial detectors (in order of parameters)
+    for partial_detectors in results:
+      for d,partial in zip(self.detectors,partial_detectors):
+        d.merge(partial);
+      
 
-      # initialize adaptive grid for 
-      mapping = lambda mesh_points: self.raytrace(p,mesh_points);
-      Mesh=AdaptiveMesh(self.mesh_points, mapping);  
+def _transmission_for_parameter(p, weight, mesh_points, raytrace, detectors, lthresh, Athresh, rtol=None, bPlot=False):
+  """
+  transmission for a single set of parameters p (see Transmission.total_transmission())
+  builds and refines the adaptive mesh and adds its contribution to the given detectors
+  returns: list of detectors
+  """
+  logging.info("Transmission for parameter: "+str(p));      
+
+  def is_broken(simplices):
+      " local help function for defining which simplices should be subdivided"
+      broken = Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh);
+      area_broken = Mesh.get_area_in_domain(simplices=simplices[broken]);
+      broken[broken] = (area_broken>Athresh);  # only consider triangles > Athresh as broken
+      return broken;
       
-      # subdivision of invalid triangles (raytrace failed for some vertices)
-      Mesh.refine_invalid_triangles(nDivide=100,bPlot=(ip==0));
+  # initialize adaptive grid for 
+  mapping = lambda mesh_points: raytrace(p,mesh_points);
+  Mesh=AdaptiveMesh(mesh_points, mapping);  
+  
+  # subdivision of invalid triangles (raytrace failed for some vertices)
+  Mesh.refine_invalid_triangles(nDivide=100,bPlot=bPlot);
+
+  # refinement driven by error estimate
+  if rtol is not None:
+    converged_detectors = _refine_until_converged(Mesh, detectors, weight, lthresh, Athresh, rtol);
+    for d,converged in zip(detectors,converged_detectors):
+      d.merge(converged);
+    return detectors;
+  
+  # iterative mesh refinement (subdivision of broken triangles)
+  while True:  
+    if bPlot: # plot mesh for first set of parameters
+      skip = lambda simplices: Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh)        
+      Mesh.plot_triangulation(skip_triangle=skip);
+    # refine mesh until nothing changes
+    nNew = Mesh.refine_broken_triangles(is_broken,nDivide=100,bPlot=bPlot);        
+    if nNew==0: break 
       
-      # iterative mesh refinement (subdivision of broken triangles)
-      while True:  
-        if ip==0: # plot mesh for first set of parameters
-          skip = lambda simplices: Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh)        
-          Mesh.plot_triangulation(skip_triangle=skip);
-        # refine mesh until nothing changes
-        nNew = Mesh.refine_broken_triangles(is_broken,nDivide=100,bPlot=(ip==0));        
-        if nNew==0: break 
-          
-      # update detectors
-      broken = Mesh.find_broken_triangles(lthresh=lthresh);
-      for d in self.detectors:
-        d.add(Mesh,bSkip=broken,weight=self.weights[ip]);
+  # update detectors
+  broken = Mesh.find_broken_triangles(lthresh=lthresh);
+  for d in detectors:
+    d.add(Mesh,bSkip=broken,weight=weight);
+  return detectors;
+
+
+def _refine_until_converged(Mesh, detectors, weight, lthresh, Athresh, rtol, max_levels=20):
+  """
+  refine broken triangles of the mesh level by level until the detector results
+  have converged to the relative accuracy rtol. The error of the detector results
+  is estimated by the power of the broken triangles, which are skipped by the
+  detectors. At each level, only the broken triangles with the largest power
+  are subdivided, such that the power of the remaining ones is below the 
+  tolerance. Refinement stops, if the power of all broken triangles is below 
+  rtol*weight and the detector results changed by less than rtol compared to
+  the previous level (otherwise, the tolerance for the next level is halved).
+  
+    Mesh      ... instance of AdaptiveMesh
+    detectors ... list of detectors (not modified)
+    weight    ... weight of contribution (power of mesh)
+    lthresh   ... absolute threshold for longest side of broken triangle (image space) 
+    Athresh   ... minimal area of broken triangles that are subdivided (domain space)
+    rtol      ... relative tolerance
+    max_levels... (opt) maximal number of refinement levels
+  returns: list of empty copies of the detectors with results for the refined mesh
+  """
+  def triangle_power(simplices):
+    return weight*np.abs(Mesh.get_area_in_domain(simplices=simplices))/Mesh.initial_domain_area;
+
+  previous = None; tol = rtol*weight;
+  for level in range(max_levels):
+    # detector results for current mesh and estimated error
+    broken = Mesh.find_broken_triangles(lthresh=lthresh);
+    current = [d.empty() for d in detectors];
+    for d in current:
+      d.add(Mesh,bSkip=broken,weight=weight);
+    power = triangle_power(Mesh.simplices[broken]);
+    error = np.sum(power);
+    change= np.inf if previous is None else \
+              max([0]+[c.relative_difference(p) for c,p in zip(current,previous)]);
+    logging.debug("Refinement level %d: %d broken triangles, estimated error %.2e, change %.2e"
+                   %(level,power.size,error/weight,change));
+    if error<=rtol*weight and change<=rtol: return current;
+    if error<=tol: tol/=2;           # results not converged, decrease tolerance
+    previous = current;
+    
+    # tolerated power per triangle (equidistribution of the error): the sum
+    # over all triangles with a power below this threshold is smaller than tol
+    pthresh = tol/max(power.size,1);
+    def is_broken(simplices):
+      " local help function for defining which simplices should be subdivided"
+      broken = Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh);
+      broken[broken] = (Mesh.get_area_in_domain(simplices=simplices[broken])>Athresh) \
+                     & (triangle_power(simplices[broken])>pthresh);
+      return broken;
+    if Mesh.refine_broken_triangles(is_broken,nDivide=100)==0:
+      # mesh cannot be refined any further (triangles smaller than Athresh)
+      if error>rtol*weight:
+        logging.warning("Refinement stopped at level %d before reaching the target "\
+          "accuracy (estimated error %.2e), decrease Athresh."%(level,error/weight));
+      return current;
+  logging.warning("Maximal number of refinement levels reached (estimated error %.2e)."%(error/weight));
+  return current;
 
 
 
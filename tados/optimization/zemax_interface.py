@@ -1,5 +1,6 @@
 """
 Module providing a class for optimizing optical systems in Zemax
+(or any other raytrace engine, see tados.zemax.raytrace_engine)
 
 @author: Lippmann
 """
@@ -16,8 +17,8 @@ class External_Zemax_Optimizer(object):
     
         Parameters
         ----------
-          hDDE : instance of pyOptics.zemax.dde_link.DDElinkHandler
-            DDE-link handler
+          hDDE : instance of tados.zemax.raytrace_engine.RaytraceEngine
+            raytrace engine, e.g. DDE-link handler (tados.zemax.dde_link)
           filename : string
             name of the ZMX system file
         
@@ -29,7 +30,6 @@ class External_Zemax_Optimizer(object):
         >>> logging.basicConfig(level=logging.DEBUG);
         """
         self.hDDE=hDDE;
-        self.zlink = hDDE.link;
         self.filename=filename;
         self.reset();
         # variable parameters 
@@ -41,17 +41,10 @@ class External_Zemax_Optimizer(object):
     def reset(self):
         " reset system to original state"
         self.hDDE.load(self.filename);
-        self.zlink.zPushLens(1);
+        self.hDDE.show();
 
     def getVariables(self):
-        # TODO: include extra data editor
-        surfaces = self.zlink.zGetNumSurf()
-        variables = []
-        for surf in range(surfaces + 1):
-            for param in list(range(0,3))+list(range(4,18)):     # exclude SDIA=column #3
-                if self.zlink.zGetSolve(surf, param)[0] == 1:
-                    variables.append((surf, param))
-        return variables
+        return self.hDDE.get_variables()
     
     def getVariableNames(self):
         " return array of strings, describing the meaning of each varable"
@@ -64,30 +57,16 @@ class External_Zemax_Optimizer(object):
     
     def get_MFE_weights(self):
         " return weight of each row in the merit function editor"
-        # workaround to get number of operands in MFE: 
-        # insert and remove operand at first postion        
-        self.zlink.zInsertMFO(1);
-        nRows=self.zlink.zDeleteMFO(1);
-        # get weight of each operand
-        weights = [];      
-        for row in range(1,nRows+1):
-          # set weight of comment rows to 0
-          typ=self.zlink.zGetOperand(row, 1);
-          if typ=='BLNK': weights.append(0); 
-          else:           weights.append( self.zlink.zGetOperand(row, 9) );
-        return np.asarray(weights);
+        return np.asarray(self.hDDE.get_merit_weights());
     
     def get_MFE_targets(self):
         " return target for each row in the merit function editor"
-        targets=[];
-        for row in range(1,self.MFE_weights.size+1):
-          targets.append( self.zlink.zGetOperand(row,8) );
-        return np.asarray(targets);
+        return np.asarray(self.hDDE.get_merit_targets());
         
     def get_MFE_values(self,rows=None):
         """
         return current value of each row in the merit function editor, 
-        use zOptimize(-1) before to update all values of the merit function editor
+        use evaluate_merit() before to update all values of the merit function editor
                 
         Parameters
         ---------
@@ -102,16 +81,11 @@ class External_Zemax_Optimizer(object):
             
         See
         ---
-          zlink.zOptimize(), evaluate_operands();
+          RaytraceEngine.evaluate_merit(), evaluate_operands();
         """
         # interesting rows of the MFE
         if rows is None: rows = np.arange(1,self.MFE_weights.size+1);
-        # get all values via the DDE-link  
-        values = [];        
-        for row in rows:
-          values.append( self.zlink.zGetOperand(row,10) );
-        # print ["%10.8f "%v for v in values];
-        return np.asarray(values);
+        return np.asarray(self.hDDE.get_merit_values(rows));
         
       
     def evaluate(self, x):
@@ -131,13 +105,13 @@ class External_Zemax_Optimizer(object):
         if x.ndim == 1:
             self.setSystemState(x);
             #self.showSystem(x);
-            val = np.array(self.zlink.zOptimize(-1))
+            val = np.array(self.hDDE.evaluate_merit())
         else:
             nParam,nStates = x.shape;
             val = np.zeros(nStates)
             for i in range(nStates):
                 self.setSystemState(x[:, i])
-                val[i] = self.zlink.zOptimize(-1)
+                val[i] = self.hDDE.evaluate_merit()
         logging.debug("FOM: %8.5f"%val + "".join([" %12.9f,"%f for f in x]));
         return val
 
@@ -175,32 +149,32 @@ class External_Zemax_Optimizer(object):
         for i, (surf,param) in enumerate(self.variables):
             # Curvature, thickness and conic are read by zGetSurfaceData()
             if param < 5:
-                x[i] = self.zlink.zGetSurfaceData(surf, param + 2)
+                x[i] = self.hDDE.get_surface_data(surf, param + 2)
             # Parameter values must be read by zGetSurfaceParameter()
             elif param < 17:
-                x[i] = self.zlink.zGetSurfaceParameter(surf, param - 4)
+                x[i] = self.hDDE.get_surface_parameter(surf, param - 4)
             # Parameter 0 is addressed by solve parameter number 17
             elif param == 17:
-                x[i] = self.zlink.zGetSurfaceParameter(surf, 0)
+                x[i] = self.hDDE.get_surface_parameter(surf, 0)
         return x
 
     def setSystemState(self, x):
         for i, (surf,param) in enumerate(self.variables):
             # Curvature, thickness and conic are set by zSetSurfaceData()
             if param < 5:
-                self.zlink.zSetSurfaceData(surf, param + 2, x[i])
+                self.hDDE.set_surface_data(surf, param + 2, x[i])
             # Parameter values must be set by zSetSurfaceParameter()
             elif param < 17:
-                self.zlink.zSetSurfaceParameter(surf, param - 4, x[i])
+                self.hDDE.set_surface_parameter(surf, param - 4, x[i])
             # Parameter 0 is addressed by solve parameter number 17
             elif param == 17:
-                self.zlink.zSetSurfaceParameter(surf, 0, x[i])
+                self.hDDE.set_surface_parameter(surf, 0, x[i])
         # update pupil positions, solves, and index data and return error flag
-        return self.zlink.zGetUpdate();
+        return self.hDDE.update();
 
     def showSystem(self, x):
         self.setSystemState(x)
-        self.zlink.zPushLens(1)
+        self.hDDE.show()
         
     def print_status(self, x=None, out=stdout):  
         if x is None:
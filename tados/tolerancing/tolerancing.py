@@ -11,11 +11,14 @@ import numpy as np
 class ToleranceSystem(object):
   """
   Helper class for tolerancing the system
+
+  The system is changed via the raytrace-engine interface (see
+  tados.zemax.raytrace_engine), tilts, decenters and coordinate breaks
+  use further functions of Zemax (hDDE.link, see DDElinkHandler)
   """
 
   def __init__(self,hDDE,filename):
     self.hDDE=hDDE;
-    self.ln = hDDE.link;
     self.filename=filename;
     self.reset();
     # initial orientation and position of each surface
@@ -24,9 +27,9 @@ class ToleranceSystem(object):
   def reset(self):
     " reset system to original state"
     self.hDDE.load(self.filename);
-    self.ln.zPushLens(1);
+    self.hDDE.show();
 
-    self.numSurf = self.ln.zGetNumSurf();
+    self.numSurf = self.hDDE.get_num_surfaces();
     # index arrays for conversion between real and all surfaces
     self.__isRealSurf = np.ones(self.numSurf,dtype=bool);
     self.__real2all = np.arange(self.numSurf);
@@ -48,14 +51,14 @@ class ToleranceSystem(object):
            | R31  R32  R33 |                 | Z |
     Returns: (R,t) of shape (numSurf,3,3) and (numSurf,3) respectively
     """    
-    coords = [ self.ln.zGetGlobalMatrix(s) for s in self.__real2all]
+    coords = [ self.hDDE.link.zGetGlobalMatrix(s) for s in self.__real2all]
     coords = np.asarray(coords);
     R = coords[:,0:9].reshape(self.numSurf,3,3);
     t = coords[:,9:12];
     return R,t
     
   def __get_surface_comments(self):
-    return [ self.ln.zGetComment(s) for s in self.__real2all];
+    return [ self.hDDE.link.zGetComment(s) for s in self.__real2all];
     
   def __register_dummy_surfaces(self,surf):
     """ 
@@ -77,7 +80,7 @@ class ToleranceSystem(object):
 
   
   def print_LDE(self,bShowDummySurfaces=False):
-    print(self.ln.ipzGetLDE());
+    print(self.hDDE.link.ipzGetLDE());
 
   def print_current_geometric_changes(self):
     """
@@ -122,21 +125,22 @@ class ToleranceSystem(object):
     """    
     #
     surfNum = self.__real2all[surf];              # calculate real surface indices 
+    ln = self.hDDE.link;                          # codes of surface data in Zemax
     def apply_surf_parameter(surfNum,code,value): # local help function
       if value==0: return  # do nothing
-      assert self.ln.zGetSurfaceData(surfNum,code)==0; # decenter / tilt must be 0 before
-      self.ln.zSetSurfaceData(surfNum,code,value);   
-    apply_surf_parameter(surfNum,self.ln.SDAT_DCNTR_X_BEFORE,xdec);
-    apply_surf_parameter(surfNum,self.ln.SDAT_DCNTR_Y_BEFORE,ydec);
-    apply_surf_parameter(surfNum,self.ln.SDAT_TILT_X_BEFORE,xtilt);
-    apply_surf_parameter(surfNum,self.ln.SDAT_TILT_Y_BEFORE,ytilt);
-    apply_surf_parameter(surfNum,self.ln.SDAT_TILT_Z_BEFORE,ztilt);
-    apply_surf_parameter(surfNum,self.ln.SDAT_TILT_DCNTR_ORD_BEFORE,order);
+      assert self.hDDE.get_surface_data(surfNum,code)==0; # decenter / tilt must be 0 before
+      self.hDDE.set_surface_data(surfNum,code,value);   
+    apply_surf_parameter(surfNum,ln.SDAT_DCNTR_X_BEFORE,xdec);
+    apply_surf_parameter(surfNum,ln.SDAT_DCNTR_Y_BEFORE,ydec);
+    apply_surf_parameter(surfNum,ln.SDAT_TILT_X_BEFORE,xtilt);
+    apply_surf_parameter(surfNum,ln.SDAT_TILT_Y_BEFORE,ytilt);
+    apply_surf_parameter(surfNum,ln.SDAT_TILT_Z_BEFORE,ztilt);
+    apply_surf_parameter(surfNum,ln.SDAT_TILT_DCNTR_ORD_BEFORE,order);
     # After status. 0 for explicit; 1 for pickup current surface; 
     #         2 for reverse current surface; 3 for pickup previous surface; 
     #         4 for reverse previous surface, etc.
-    self.ln.zSetSurfaceData(surfNum,self.ln.SDAT_TILT_DCNTR_STAT_AFTER,2); # reverse current surface
-    self.ln.zGetUpdate();    
+    self.hDDE.set_surface_data(surfNum,ln.SDAT_TILT_DCNTR_STAT_AFTER,2); # reverse current surface
+    self.hDDE.update();    
     
   def tilt_decenter_elements(self,firstSurf,lastSurf,**kwargs):
     """
@@ -152,7 +156,7 @@ class ToleranceSystem(object):
     s1,s2 = self.__real2all[[firstSurf,lastSurf]]; 
     if not all(self.__isRealSurf[s1:s2+1]):
       raise RuntimeError("Elements (surface ranges) are not allowed to overlap in tolerancing.");
-    added_surf = self.ln.zTiltDecenterElements(s1,s2,**kwargs);
+    added_surf = self.hDDE.link.zTiltDecenterElements(s1,s2,**kwargs);
     self.__register_dummy_surfaces(added_surf);
     return added_surf;
     
@@ -167,9 +171,9 @@ class ToleranceSystem(object):
     # calculate real surface indices and check, that there are no
     # coordinate breaks or dummy surfaces between these
     numSurf = self.__real2all[surf]; 
-    self.ln.zInsertCoordinateBreak(numSurf,**kwargs);
+    self.hDDE.link.zInsertCoordinateBreak(numSurf,**kwargs);
     self.__register_dummy_surfaces([numSurf]);
-    self.ln.zGetUpdate()
+    self.hDDE.update()
     return numSurf;
     
     
@@ -189,12 +193,13 @@ class ToleranceSystem(object):
     s1,s2 = self.__real2all[[surf,adjust_surf]]; 
     if not all(self.__isRealSurf[s1:s2+1]):
       raise RuntimeError("Elements (surface ranges) are not allowed to overlap in tolerancing.");
-    t1=self.ln.zGetThickness(s1);
-    self.ln.zSetThickness(s1,value=t1+value);
+    THICK = self.hDDE.SDAT_THICK;
+    t1=self.hDDE.get_surface_data(s1,THICK);
+    self.hDDE.set_surface_data(s1,THICK,t1+value);
     if adjust_surf>surf:  
-      t2=self.ln.zGetThickness(s2);
-      self.ln.zSetThickness(s2,value=t2-value);
-    self.ln.zGetUpdate();  
+      t2=self.hDDE.get_surface_data(s2,THICK);
+      self.hDDE.set_surface_data(s2,THICK,t2-value);
+    self.hDDE.update();  
 
 
   # Wrapper for simulating ZEMAX operands follow
@@ -230,7 +235,7 @@ if __name__ == '__main__':
     tol.insert_coordinate_break(10,xdec=-0.01,comment="new CB")
     tol.print_current_geometric_changes();
     
-    tol.ln.zPushLens(1); # show changes also in Zemax LDE
+    tol.hDDE.show(); # show changes also in Zemax LDE
     #  changes to system by hand:
     #
     #  ln.zSetSurfaceData(surfNum=5, code=ln.SDAT_THICK, value=2);
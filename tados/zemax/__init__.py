@@ -1 +1 @@
-__all__ = ["dde_link", "sampling", "glasstools"]
\ No newline at end of file
+__all__ = ["dde_link", "dde_pool", "sampling", "glasstools", "raytrace_engine", "local_engine", "analysis_files", "raytrace_cache"]
\ No newline at end of file
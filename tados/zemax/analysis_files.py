@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Fast parser for the text-file output of Zemax analyses (e.g. Geometric
+Image Analysis or Interferogram, see zGetTextFile() in pyzdde).
+
+@author: Hambach
+"""
+import codecs
+import warnings
+import numpy as np
+
+def read_text(filename):
+  " read text file written by Zemax (unicode or ansi, depending on Zemax settings) "
+  with open(filename,'rb') as f: raw = f.read();
+  if raw.startswith(codecs.BOM_UTF16_LE) or raw.startswith(codecs.BOM_UTF16_BE):
+    return raw.decode('utf-16');
+  if raw.startswith(codecs.BOM_UTF8):
+    return raw.decode('utf-8-sig');
+  return raw.decode('latin-1');
+
+def read_analysis_file(filename,title,last_header_key):
+  """
+  parse text-file output of a Zemax analysis, consisting of a header with
+  lines 'key : value' and a block of numbers (separated by whitespace),
+  which starts two lines after the last header line
+
+  Only the header is scanned line by line, the data block is handed to
+  a bulk numeric reader (much faster than numpy.loadtxt for large listings).
+
+  Parameters
+  ----------
+    filename : string
+      name of the text file
+    title : string
+      expected first line of the file
+    last_header_key : string
+      text in the last line of the header, e.g. 'Units' (substring match
+      on stripped lines, like in pyzdde)
+
+  Returns
+  -------
+    params : dictionary
+      parameters given in the header
+    values : 1D array
+      all numbers of the data block in order of appearance, i.e., line by
+      line (use reshape with the number of pixels given in the header)
+
+  Raises ValueError, if the number of values does not match the number of
+  pixels given in the header (or the number of tokens in the data block, if
+  the header has no number of pixels), e.g., for truncated files or numbers
+  in an unsupported format (like decimal commas).
+  """
+  text = read_text(filename);
+  # scan header line by line
+  params = {}; pos = 0; nLine = 0;
+  while True:
+    end = text.find('\n',pos);
+    if end<0: raise IOError("Unexpected end of header in file '%s'."%filename);
+    line = text[pos:end].strip(); pos = end+1;
+    if nLine==0:
+      if line!=title: raise IOError("File '%s' does not start with '%s'."%(filename,title));
+    else:
+      key,sep,value = line.partition(':');
+      if sep and key.strip(): params[key.strip()] = value.strip();
+    nLine+=1;
+    if line.find(last_header_key)>=0: break;
+  # skip separator line and read data block at once (fromstring stops at the
+  # first invalid token with a DeprecationWarning, which is checked below)
+  pos = text.find('\n',pos)+1;
+  data = text[pos:] if pos>0 else '';
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore',DeprecationWarning);
+    values = np.fromstring(data,sep=' ');
+  if 'Number of pixels' in params: 
+    Nx,Ny = get_pixels(params); expected = Nx*Ny;
+  else:
+    expected = len(data.split());
+  if values.size!=expected:
+    raise ValueError("File '%s': expected %d values, found %d (truncated file or unsupported number format?)"
+                     %(filename,expected,values.size));
+  return params, values;
+
+def get_pixels(params):
+  " returns number of pixels (Nx,Ny) given in header as 'Number of pixels : Nx x Ny' "
+  Nx,Ny = map(int,params['Number of pixels'].split('x'));
+  return Nx,Ny;
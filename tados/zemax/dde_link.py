@@ -5,31 +5,121 @@ Created on Thu Apr 07 19:45:55 2016
 @author: Hambach
 """
 import numpy as np
+import functools
 import logging
 import os as _os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pyzdde.arraytrace as at  # Module for array ray tracing
 import pyzdde.zdde as pyz
 
-class DDElinkHandler(object):
+from tados.zemax.raytrace_engine import RaytraceEngine, RAY_DTYPE
+from tados.zemax.analysis_files import read_analysis_file, get_pixels
+
+def _on_link_thread(method):
+  " decorator: method is always executed in the link-owner thread (see DDElinkHandler.run)"
+  @functools.wraps(method)
+  def wrapper(self,*args,**kwargs):
+    return self.run(method,self,*args,**kwargs);
+  return wrapper
+
+class _LinkProxy(object):
   """
+  access to the pyzdde link of a DDElinkHandler from any thread: each method
+  call (e.g. link.zGetNumSurf()) is executed in the link-owner thread after
+  all previously submitted requests (see DDElinkHandler.run), other attributes
+  (e.g. constants like link.SDAT_THICK) are returned directly
+  """
+  def __init__(self,handler,link):
+    self.__handler = handler;
+    self.__link = link;
+
+  def __getattr__(self,name):
+    attr = getattr(self.__link,name);
+    if not callable(attr): return attr;
+    @functools.wraps(attr)
+    def call(*args,**kwargs):
+      return self.__handler.run(attr,*args,**kwargs);
+    return call
+
+class DDElinkHandler(RaytraceEngine):
+  """
+  raytrace engine using Zemax via the DDE link
+  
   ensure that DDE link is always closed, see discussion in 
   http://stackoverflow.com/questions/865115/how-do-i-correctly-clean-up-a-python-object
+
+  The DDE conversation belongs to the thread that created it. Therefore, the
+  link is created, used and closed in a single link-owner thread and all
+  methods that access the link are executed in this thread (see run() and
+  submit()), independent of the thread they are called from. The attribute
+  link gives access to further functions of pyzdde in the same way.
   """
   def __init__(self):
-    self.link=None;
+    self.__link=None;            # pyzdde link (only used in link-owner thread)
+    self.link=None;              # proxy of the link for all threads
+    self.__executor=None;        # link-owner thread
+    self.__owner=None;           # identifier of link-owner thread
   
   def __enter__(self):
-    " initialize DDE connection to Zemax "
-    self.link = pyz.createLink()
-    if self.link is None:
+    " start link-owner thread and initialize DDE connection to Zemax "
+    self.__executor = ThreadPoolExecutor(max_workers=1,thread_name_prefix='DDElink');
+    self.__owner = self.__executor.submit(threading.get_ident).result();
+    self.__link = self.run(pyz.createLink);
+    if self.__link is None:
+      self.__shutdown();
       raise RuntimeError("Zemax DDE link could not be established.");
+    self.link = _LinkProxy(self,self.__link);
     return self;
     
   def __exit__(self, exc_type, exc_value, traceback):
-    " close DDE link"
-    self.link.close();
+    " close DDE link (after all asynchronous requests are finished)"
+    if self.__executor is None: return
+    try:
+      if self.__link is not None: self.run(self.__link.close);
+    finally:
+      self.__link = self.link = None;
+      self.__shutdown();
+
+  def __shutdown(self):
+    " finish all requests and stop link-owner thread "
+    self.__executor.shutdown(wait=True);
+    self.__executor = self.__owner = None;
 
+  def run(self,func,*args,**kwargs):
+    """
+    synchronous request to Zemax: func(*args,**kwargs) is called in the
+    link-owner thread (directly, if called from this thread), returns result
+    """
+    if threading.get_ident()==self.__owner: return func(*args,**kwargs);
+    return self.submit(func,*args,**kwargs).result();
+
+  def submit(self,func,*args,**kwargs):
+    """
+    asynchronous request to Zemax: func(*args,**kwargs) is called in the
+    link-owner thread, i.e., all requests are processed one after another in
+    the order of submission, while the calling thread may continue with
+    Python-side work (e.g. post-processing of previous results)
+    
+    Note: the system should not be changed by other requests until the
+    request is finished, use wait() or future.result()
+    
+    Returns
+    -------
+      future : concurrent.futures.Future
+        result (or exception) of the request, see future.result()
+    """
+    if self.__executor is None:
+      raise RuntimeError("DDElinkHandler must be used as context manager.");
+    return self.__executor.submit(func,*args,**kwargs);
+
+  def wait(self):
+    " wait until all asynchronous requests to Zemax are finished "
+    if self.__executor is not None and threading.get_ident()!=self.__owner:
+      self.submit(lambda: None).result();
+
+  @_on_link_thread
   def load(self,zmxfile):
     " load ZMX file with name 'zmxfile' into Zemax "
     ln = self.link;   
@@ -46,7 +136,7 @@ class DDElinkHandler(object):
         raise RuntimeError("Extensions not allowed to push lenses. Please enable in Zemax.")
     ln.zPushLens(1)
     
-  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1):
+  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1, chunksize=None, callback=None):
     """ 
     array trace of rays
     
@@ -63,12 +153,25 @@ class DDElinkHandler(object):
       surf : integer, optional
         surface to trace the ray to. Usually, the ray data is only needed at
         the image surface (``surf = -1``, default)
+      chunksize : integer, optional
+        maximal number of rays per call of zArrayTrace (default: all rays).
+        The ray array of the next chunk is filled and the results of the
+        previous chunk are extracted in worker threads, while the current
+        chunk is traced by Zemax.
+      callback : function, optional
+        if given, the results of each chunk are passed to ``callback(start,results)``
+        instead of being returned, where ``start`` is the index of the first
+        ray of the chunk. The callback is called in a worker thread, but
+        always in order of the chunks.
 
     Returns
     --------
-      numpy array of shape (nRays,8) containing following parameters for each ray
+      structured numpy array of shape (nRays,) and dtype ``RAY_DTYPE`` containing
+      following fields for each ray (or None, if a callback is given), use
+      ``tados.zemax.raytrace_engine.get_fields(results,('x','y'))`` to get
+      several fields as 2D array without copy
       
-      err : error flag
+      error : integer, error flag
         * 0 = ray traced successfully;
         * +ve number = the ray missed the surface;
         * -ve number = the ray total internal reflected (TIR) at surface given 
@@ -89,32 +192,174 @@ class DDElinkHandler(object):
     if np.isscalar(y): y = np.zeros(nRays)+y;
     if np.isscalar(px): px = np.zeros(nRays)+px;
     if np.isscalar(py): py = np.zeros(nRays)+py;    
-    if np.isscalar(waveNum): waveNum=np.zeros(nRays,np.int)+waveNum;
+    if np.isscalar(waveNum): waveNum=np.zeros(nRays,int)+waveNum;
     assert(all(args.size == nRays for args in [x,y,px,py,waveNum]))
-    print("number of rays: %d"%nRays);
+    if chunksize is None: chunksize = max(nRays,1);
+    chunks = [slice(i,min(i+chunksize,nRays)) for i in range(0,max(nRays,1),chunksize)];
+    logging.debug("trace_rays(): number of rays: %d, chunks: %d"%(nRays,len(chunks)));
     import time;  t = time.time();    
-        
-    # fill in ray data array (following Zemax notation!)
-    rays = at.getRayDataArray(nRays, tType=0, mode=mode, endSurf=surf)
-    for k in range(nRays):
-      rays[k+1].x = x[k]      
-      rays[k+1].y = y[k]
-      rays[k+1].z = px[k]
-      rays[k+1].l = py[k]
-      rays[k+1].wave = waveNum[k];
-
-    print("set pupil values: %ds"%(time.time()-t))
-
-    # Trace the rays
-    ret = at.zArrayTrace(rays, timeout=100000);
-    print(("zArrayTrace: %ds"%(time.time()-t)))
-
-    # collect results
-    results = np.asarray( [(r.error,r.vigcode,r.x,r.y,r.z,r.l,r.m,r.n,r.Exr,r.Eyr,r.Ezr) for r in rays[1:]] );
-    print(("retrive data: %ds"%(time.time()-t)))    
+
+    def fill(s):
+      " fill in ray data array for rays in slice s "
+      return self.__get_ray_data(x[s],y[s],px[s],py[s],waveNum[s],mode,surf);
+
+    def extract(s,data):
+      " collect results for rays in slice s "
+      results = self.__get_results(data);
+      if callback is None: return results;
+      callback(s.start,results);
+
+    # pipeline: fill chunk k+1 and extract chunk k-1 while tracing chunk k in
+    # the link-owner thread
+    results = [];
+    with ThreadPoolExecutor(max_workers=1) as filler, \
+         ThreadPoolExecutor(max_workers=1) as extractor:
+      next_rays = filler.submit(fill,chunks[0]);
+      extracted = None;
+      for k,s in enumerate(chunks):
+        rays,data = next_rays.result();
+        if k+1<len(chunks): next_rays = filler.submit(fill,chunks[k+1]);
+        self.run(at.zArrayTrace, rays, timeout=100000);
+        if extracted is not None: results.append(extracted.result());
+        extracted = extractor.submit(extract,s,data);
+        del rays,data;
+      results.append(extracted.result());
+    logging.debug("trace_rays(): total time: %.2fs"%(time.time()-t))
+    if callback is not None: return None;
+    return results[0] if len(results)==1 else np.concatenate(results);
+
+  def __get_ray_data(self,x,y,px,py,waveNum,mode,surf):
+    """
+    fill in ray data array (following Zemax notation!) via a structured
+    numpy view of the ctypes buffer (no copy, rays[0] is the header),
+    returns the ctypes array and the view on the rays
+    """
+    rays = at.getRayDataArray(x.size, tType=0, mode=mode, endSurf=surf)
+    data = np.ctypeslib.as_array(rays)[1:];
+    data['x'] = x;  data['y'] = y;
+    data['z'] = px; data['l'] = py;
+    data['wave'] = waveNum;
+    return rays,data;
+
+  def __get_results(self,data):
+    " collect results from (structured view of) traced ray data array "
+    fields = ('error','vigcode','x','y','z','l','m','n','Exr','Eyr','Ezr');
+    results = np.empty(data.shape,dtype=RAY_DTYPE);
+    for name,field in zip(RAY_DTYPE.names,fields): results[name] = data[field];
     return results;
 
+  @_on_link_thread
+  def get_num_surfaces(self):
+    " returns number of surfaces in the system (without object surface) "
+    return self.link.zGetNumSurf();
+
+  @_on_link_thread
+  def get_surface_data(self,surf,code):
+    " returns surface data (given by code, see SDAT_*) of surface surf "
+    return self.link.zGetSurfaceData(surf,code);
 
+  @_on_link_thread
+  def set_surface_data(self,surf,code,value):
+    " set surface data (given by code, see SDAT_*) of surface surf "
+    return self.link.zSetSurfaceData(surf,code,value);
+
+  @_on_link_thread
+  def get_surface_parameter(self,surf,param):
+    " returns surface parameter param of surface surf "
+    return self.link.zGetSurfaceParameter(surf,param);
+
+  @_on_link_thread
+  def set_surface_parameter(self,surf,param,value):
+    " set surface parameter param of surface surf "
+    return self.link.zSetSurfaceParameter(surf,param,value);
+
+  @_on_link_thread
+  def update(self):
+    " update pupil positions, solves, and index data and return error flag "
+    return self.link.zGetUpdate();
+
+  @_on_link_thread
+  def show(self):
+    " push lens to the lens data editor of Zemax "
+    self.link.zPushLens(1);
+
+  @_on_link_thread
+  def get_fingerprint(self):
+    """
+    returns content of the ZMX file for the current state of the system
+
+    The system is saved under its current file name (saving under another 
+    name would change the lens file in Zemax, e.g. the location of the 
+    analysis settings), the original content of the file is restored afterwards.
+    """
+    filename = self.link.zGetFile();
+    original = None;
+    if _os.path.isfile(filename):
+      with open(filename,'rb') as f: original = f.read();
+    try:
+      ret = self.link.zSaveFile(filename);
+      if ret!=0: raise IOError("Could not save Zemax file '%s'. Error code %d" % (filename,ret));
+      with open(filename,'rb') as f: return f.read();
+    finally:
+      if original is not None:
+        with open(filename,'wb') as f: f.write(original);
+
+  @_on_link_thread
+  def get_analysis_settings(self):
+    " returns content of the configuration file <lens>.CFG with the analysis settings of the current lens "
+    filename = _os.path.splitext(self.link.zGetFile())[0]+'.CFG';
+    if not _os.path.isfile(filename): return b'';
+    with open(filename,'rb') as f: return f.read();
+
+  @_on_link_thread
+  def get_variables(self):
+    " returns list of variable parameters (surf,param) with param being the solve column "
+    # TODO: include extra data editor
+    variables = []
+    for surf in range(self.get_num_surfaces() + 1):
+      for param in list(range(0,3))+list(range(4,18)):     # exclude SDIA=column #3
+        if self.link.zGetSolve(surf, param)[0] == 1:
+          variables.append((surf, param))
+    return variables
+
+  @_on_link_thread
+  def evaluate_merit(self):
+    " update and return value of the merit function "
+    return self.link.zOptimize(-1);
+
+  @_on_link_thread
+  def get_merit_weights(self):
+    " returns weight of each row in the merit function editor "
+    # workaround to get number of operands in MFE: 
+    # insert and remove operand at first postion        
+    self.link.zInsertMFO(1);
+    nRows=self.link.zDeleteMFO(1);
+    # get weight of each operand (set weight of comment rows to 0)
+    weights = [];      
+    for row in range(1,nRows+1):
+      typ=self.link.zGetOperand(row, 1);
+      if typ=='BLNK': weights.append(0); 
+      else:           weights.append( self.link.zGetOperand(row, 9) );
+    return np.asarray(weights);
+
+  @_on_link_thread
+  def get_merit_targets(self):
+    " returns target of each row in the merit function editor "
+    nRows = self.get_merit_weights().size;
+    return np.asarray([self.link.zGetOperand(row,8) for row in range(1,nRows+1)]);
+
+  @_on_link_thread
+  def get_merit_values(self,rows=None):
+    """
+    returns current value of each row in the merit function editor, 
+    use evaluate_merit() before to update all values of the merit function editor
+      rows ... (opt) list of row indices (starting from 1!), default: all rows
+    """
+    if rows is None: rows = np.arange(1,self.get_merit_weights().size+1);
+    return np.asarray([self.link.zGetOperand(row,10) for row in rows]);
+
+
+  @_on_link_thread
   def zGeometricImageAnalysis(self,textFileName=None,timeout=None):
     """
     perform Geometric Image Analysis in Zemax and return Detector information
@@ -142,34 +387,22 @@ class DDElinkHandler(object):
     # perform Geometric Image Analysis (with current settings)
     ret = self.link.zGetTextFile(textFileName,'Ima',timeout=timeout);
     assert ret == 0, 'zGetTextFile() returned error code {}'.format(ret) 
-    lines = pyz._readLinesFromFile(pyz._openFile(textFileName))
-    assert lines[0]=='Image analysis histogram listing', "Output of Image analysis not found";
-
-    # scan header
-    last_line_header = pyz._getFirstLineOfInterest(lines,'Units');
-    params = [];  
-    for line in lines[1:last_line_header+1]:
-      pos = line.find(':');    
-      if pos>0: params.append((line[0:pos].strip(), line[pos+1:].strip()));
-    params=dict(params);  
-    # ... might be improved
+    params,values = read_analysis_file(textFileName,'Image analysis histogram listing','Units');
     
     # extract image size (e.g. '0.14 Millimeters')
     imgSize = float(params['Image Width'].split()[0]);
     Nrays   = int(params['Total Rays Launched']);
-    Nx,Ny   = map(int,params['Number of pixels'].split('x'));
+    Nx,Ny   = get_pixels(params);
     totFlux = float(params['Total flux in watts']);
     
     # scan data (values in textfile are ordered like in Zemax Window, i.e.
     #   with increasing column index, x increases from -imgSize/2 to imgSize/2
     #   with increasing line   index, y decreases from imgSize/2 to -imgSize/2
-    first_line_data  = last_line_header+2;
-    # load text reads 2d matrix as index [line,column], corresponds here to [-y,x]
-    data = np.loadtxt(lines[first_line_data:]);
+    assert (values.size==Nx*Ny);                   # correct number of pixels read from file
+    data = values.reshape(Ny,Nx);                  # index [line,column], corresponds here to [-y,x]
     data = data[::-1].T;                           # reorder data as [x,y]
     totFlux_data = np.sum(data)*imgSize**2/Nx/Ny;
-    print(totFlux)
-    assert (data.shape==(Nx,Ny));                  # correct number of pixels read from file
+    logging.debug("zGeometricImageAnalysis(): total flux %g W"%totFlux)
     assert (abs(1-totFlux_data/totFlux) < 0.001);  # check that total flux is correct within 0.1%
     #plt.figure()  
     #plt.imshow(data.T,origin='lower',aspect='auto',interpolation='hanning',
@@ -180,6 +413,14 @@ class DDElinkHandler(object):
 
 
 
+  def zGeometricImageAnalysisAsync(self,textFileName=None,timeout=None):
+    """
+    asynchronous version of zGeometricImageAnalysis() (see submit()), 
+    returns future for the tuple (data,params)
+    """
+    return self.submit(self.zGeometricImageAnalysis,textFileName,timeout=timeout);
+
+  @_on_link_thread
   def zInterferogram(self,textFileName=None,timeout=None):
     """
     perform calculation of Interferogram in Zemax and return data as numpy array
@@ -207,29 +448,25 @@ class DDElinkHandler(object):
     # perform Geometric Image Analysis (with current settings)
     ret = self.link.zGetTextFile(textFileName,'Int',timeout=timeout);
     assert ret == 0, 'zGetTextFile() returned error code {}'.format(ret) 
-    lines = pyz._readLinesFromFile(pyz._openFile(textFileName))
-    assert lines[0]=='Listing of Interferogram Data', "Output of Image analysis not found";
-    
-    # scan header
-    last_line_header = pyz._getFirstLineOfInterest(lines,'Xtilt');
-    params = [];  
-    for line in lines[1:last_line_header+1]:
-      pos = line.find(':');    
-      if pos>0: params.append((line[0:pos].strip(), line[pos+1:].strip()));
-    params=dict(params);  
-    # ... might be improved
-    
+    params,values = read_analysis_file(textFileName,'Listing of Interferogram Data','Xtilt');
     
     # scan data (values in textfile are ordered like in Zemax Window, i.e.
     #   with increasing column index, x increases from -imgSize/2 to imgSize/2
     #   with increasing line   index, y decreases from imgSize/2 to -imgSize/2
-    first_line_data  = last_line_header+2;
-    # load text reads 2d matrix as index [line,column], corresponds here to [-y,x]
-    data = np.loadtxt(lines[first_line_data:]);
+    if 'Number of pixels' in params: Nx,Ny = get_pixels(params);
+    else: Nx = Ny = int(round(np.sqrt(values.size)));   # square grid
+    assert (values.size==Nx*Ny);                   # correct number of pixels read from file
+    data = values.reshape(Ny,Nx);                  # index [line,column], corresponds here to [-y,x]
     data = data[::-1].T;                           # reorder data as [x,y]
-    assert (data.shape[0]==data.shape[1]);         # Nx=Ny
     #plt.figure()  
     #plt.imshow(data.T,origin='lower',aspect='auto',interpolation='hanning',
     #           cmap='gray',extent=np.array([-1,1,-1,1])*imgSize/2);  
     
-    return data,params
\ No newline at end of file
+    return data,params
+
+  def zInterferogramAsync(self,textFileName=None,timeout=None):
+    """
+    asynchronous version of zInterferogram() (see submit()), 
+    returns future for the tuple (data,params)
+    """
+    return self.submit(self.zInterferogram,textFileName,timeout=timeout);
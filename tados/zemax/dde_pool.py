@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of DDE links (each connected to its own Zemax instance) for running
+independent raytraces or analyses in parallel, e.g., for different field
+points, Monte-Carlo trials or sensitivity cases.
+
+@author: Hambach
+"""
+import logging
+import queue
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+class DDElinkPool(object):
+  """
+  Starts nLinks raytrace engines (default: DDElinkHandler), loads the same
+  system into each of them and dispatches jobs to idle engines. Each engine
+  is used by one job at a time and owns a dedicated thread, in which it is
+  started, used by all jobs, checked, restarted and finally closed (the DDE
+  conversation belongs to the thread that created it).
+
+  If a job fails, the engine is checked (it must respond and the loaded system
+  must have the original number of surfaces). Broken engines are restarted,
+  the system is reloaded and the job is repeated (up to max_retries times).
+  Errors of the job itself (engine still healthy) are passed to the caller.
+
+  Example:
+  >>> with DDElinkPool('system.zmx',nLinks=4) as pool:
+  >>>   results = pool.map(analysis, trials);     # analysis(hDDE,trial)
+  """
+
+  def __init__(self,filename,nLinks=2,engine_factory=None,max_retries=1):
+    """
+      filename       ... name of the ZMX file that is loaded into each engine
+      nLinks         ... (opt) number of links (Zemax instances)
+      engine_factory ... (opt) function returning a new (not yet entered)
+                           raytrace engine, default: DDElinkHandler
+      max_retries    ... (opt) number of repetitions of a job after restart
+                           of a broken engine
+    """
+    if engine_factory is None:
+      from tados.zemax.dde_link import DDElinkHandler as engine_factory  # requires pyzdde
+    self.filename = filename;
+    self.nLinks = nLinks;
+    self.engine_factory = engine_factory;
+    self.max_retries = max_retries;
+    self.engines = [None]*nLinks;
+    self.nSurfaces = None;              # number of surfaces of the loaded system
+    self.nRestarts = 0;
+    self.__idle = queue.Queue();        # indices of idle engines
+    self.__threads = [None]*nLinks;     # dedicated thread of each engine
+    self.__owners = [None]*nLinks;      # identifier of these threads
+    self.__executor = None;             # dispatcher of jobs to idle engines
+
+  def __enter__(self):
+    " start all engines (in parallel) and load system "
+    self.__threads = [ThreadPoolExecutor(max_workers=1,thread_name_prefix='DDElinkPool-%d'%i)
+                        for i in range(self.nLinks)];
+    try:
+      for i in range(self.nLinks): self.__threads[i].submit(self.__set_owner,i).result();
+      for f in [self.__threads[i].submit(self.__start,i) for i in range(self.nLinks)]: f.result();
+    except Exception:
+      self.__exit__(None,None,None);
+      raise
+    for i in range(self.nLinks): self.__idle.put(i);
+    self.__executor = ThreadPoolExecutor(max_workers=self.nLinks,thread_name_prefix='DDElinkPool');
+    return self;
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    " finish all jobs and close all engines "
+    if self.__executor is not None:
+      self.__executor.shutdown(wait=True);
+      self.__executor = None;
+    for i,thread in enumerate(self.__threads):
+      if thread is not None: thread.submit(self.__close,i);
+    for i,thread in enumerate(self.__threads):
+      if thread is not None: thread.shutdown(wait=True);
+    self.__threads = [None]*self.nLinks;
+    self.__owners = [None]*self.nLinks;
+    while not self.__idle.empty(): self.__idle.get();
+
+  def __set_owner(self,i):
+    self.__owners[i] = threading.get_ident();
+
+  def __call(self,i,func,*args):
+    " call func(*args) in the thread of engine i and return result "
+    if threading.get_ident()==self.__owners[i]: return func(*args);
+    assert self.__threads[i] is not None, "DDElinkPool must be used as context manager";
+    return self.__threads[i].submit(func,*args).result();
+
+  def __start(self,i):
+    " start engine i and load system "
+    engine = self.engine_factory();
+    engine.__enter__();
+    try:
+      engine.load(self.filename);
+      nSurfaces = engine.get_num_surfaces();
+    except Exception:
+      engine.__exit__(None,None,None);
+      raise
+    if self.nSurfaces is None: self.nSurfaces = nSurfaces;
+    self.engines[i] = engine;
+    logging.debug("DDElinkPool: started link %d"%i);
+
+  def __close(self,i):
+    " close engine i (errors are only logged) "
+    engine = self.engines[i]; self.engines[i] = None;
+    if engine is None: return;
+    try:
+      engine.__exit__(None,None,None);
+    except Exception as e:
+      logging.warning("DDElinkPool: closing link %d failed (%s)"%(i,e));
+
+  def __is_healthy(self,i):
+    try:
+      return self.engines[i].get_num_surfaces()==self.nSurfaces;
+    except Exception:
+      return False;
+
+  def is_healthy(self,i):
+    " returns True, if engine i responds and the loaded system is unchanged "
+    return self.__call(i,self.__is_healthy,i);
+
+  def __restart(self,i):
+    logging.warning("DDElinkPool: restarting link %d"%i);
+    self.__close(i);
+    self.__start(i);
+    self.nRestarts += 1;
+
+  def restart(self,i):
+    " restart engine i and reload system "
+    self.__call(i,self.__restart,i);
+
+  def __check(self,i):
+    " restart engine i if it is broken, returns number of restarts "
+    if self.__is_healthy(i): return 0;
+    self.__restart(i);
+    return 1;
+
+  def check_links(self):
+    " check all idle engines and restart broken ones, returns number of restarts "
+    idle = [];
+    while not self.__idle.empty(): idle.append(self.__idle.get());
+    try:
+      checks = [self.__threads[i].submit(self.__check,i) for i in idle];
+      return sum(f.result() for f in checks);
+    finally:
+      for i in idle: self.__idle.put(i);
+
+  def __run_job(self,i,func,args,kwargs):
+    " run job on engine i (in its thread), restart engine and repeat job on failure "
+    for attempt in range(self.max_retries+1):
+      try:
+        return func(self.engines[i],*args,**kwargs);
+      except Exception as e:
+        if self.__is_healthy(i): raise
+        logging.warning("DDElinkPool: job failed on link %d (%s)"%(i,e));
+        self.__restart(i);               # also after the last attempt
+        if attempt==self.max_retries: raise
+
+  def __run(self,func,args,kwargs):
+    " run job on next idle engine "
+    i = self.__idle.get();
+    try:
+      return self.__call(i,self.__run_job,i,func,args,kwargs);
+    finally:
+      self.__idle.put(i);
+
+  def submit(self,func,*args,**kwargs):
+    """
+    run func(engine,*args,**kwargs) on the next idle engine (in the thread
+    of the engine), returns future (concurrent.futures.Future). The job
+    should not rely on changes of the system by previous jobs (use
+    engine.load(pool.filename) for a reset).
+    """
+    assert self.__executor is not None, "DDElinkPool must be used as context manager";
+    return self.__executor.submit(self.__run,func,args,kwargs);
+
+  def map(self,func,iterable):
+    " returns [func(engine,item) for item in iterable], evaluated in parallel "
+    futures = [self.submit(func,item) for item in iterable];
+    return [f.result() for f in futures];
+
+  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1):
+    """
+    array trace of rays, which are distributed evenly over all engines
+    (see DDElinkHandler.trace_rays() for parameters and results)
+    """
+    x,y,px,py,waveNum = np.broadcast_arrays(*[np.atleast_1d(a) for a in (x,y,px,py,waveNum)]);
+    chunks = [s for s in np.array_split(np.arange(x.size),self.nLinks) if s.size>0];
+    trace = lambda engine,s: engine.trace_rays(x[s],y[s],px[s],py[s],waveNum[s],mode=mode,surf=surf);
+    return np.concatenate(self.map(trace,chunks or [np.arange(0)]));
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Simple sequential 3D raytracer for rotationally symmetric systems of conic
+surfaces, which can be used instead of Zemax (e.g., for testing or for
+systems that do not require the full functionality of Zemax).
+
+@author: Hambach
+"""
+
+from __future__ import division
+import copy
+import logging
+import numpy as np
+
+from tados.zemax.raytrace_engine import RaytraceEngine, RAY_DTYPE
+
+class LocalRaytraceEngine(RaytraceEngine):
+  """
+  raytrace engine implemented in Python/numpy (no external dependencies)
+
+  The system is given as list of surfaces, each described by a dictionary
+
+    {'curv': 0, 'thick': 0, 'n': 1, 'semidia': np.inf, 'conic': 0}
+
+  with curvature, thickness to the next surface, refractive index after the
+  surface (scalar or one value per wavelength), semi-diameter (rays outside
+  are vignetted) and conic constant. Surface 0 is the object surface (its
+  thickness is the object distance), surface 1 is the stop and the last
+  surface the image surface. The z-axis is the optical axis.
+
+  Reduced field coordinates (x,y) are scaled by 'field', which is the
+  maximal field angle in degrees for objects at infinity (field_type='angle')
+  or the maximal object height (field_type='height'). Reduced pupil
+  coordinates (px,py) are scaled by the radius of the stop surface.
+
+  The merit function is given as list of operands (func,target,weight),
+  where func(engine) returns the current value of the operand.
+  """
+
+  _keys = {RaytraceEngine.SDAT_CURV: 'curv', RaytraceEngine.SDAT_THICK: 'thick',
+           RaytraceEngine.SDAT_GLASS: 'n', RaytraceEngine.SDAT_SEMIDIA: 'semidia',
+           RaytraceEngine.SDAT_CONIC: 'conic'};
+
+  def __init__(self,surfaces=None,field=0,field_type='angle',epd=1.,
+               operands=(),variables=()):
+    """
+      surfaces   ... list of dictionaries describing each surface (see above)
+      field      ... (opt) maximal field angle [deg] or object height
+      field_type ... (opt) 'angle' or 'height'
+      epd        ... (opt) entrance pupil diameter, i.e. diameter of stop surface
+      operands   ... (opt) list of merit-function operands (func,target,weight)
+      variables  ... (opt) list of variable parameters (surf,param), where param
+                       is the column index as for the Zemax solves (0: curvature,
+                       1: thickness, 2: glass, 4: conic)
+    """
+    assert field_type in ('angle','height'), "unknown field type '%s'"%field_type;
+    self.field = field;
+    self.field_type = field_type;
+    self.epd = epd;
+    self.operands = list(operands);
+    self.variables = list(variables);
+    self.surfaces = [];
+    if surfaces is not None: self.set_surfaces(surfaces);
+    self.__merit_values = None;
+
+  def set_surfaces(self,surfaces):
+    " set list of surfaces, missing entries are filled with defaults "
+    default = {'curv': 0., 'thick': 0., 'n': 1., 'semidia': np.inf, 'conic': 0.};
+    self.surfaces = [];
+    for surface in surfaces:
+      s = dict(default); s.update(surface);
+      self.surfaces.append(s);
+    assert len(self.surfaces)>=3, "system requires object, stop and image surface";
+
+  def load(self,surfaces):
+    """
+    load optical system
+      surfaces ... list of surface dictionaries or filename of a numpy
+                     file containing such a list (see numpy.save())
+    """
+    if isinstance(surfaces,str):
+      surfaces = np.load(surfaces,allow_pickle=True).tolist();
+    self.set_surfaces(copy.deepcopy(surfaces));
+
+  def get_num_surfaces(self):
+    " returns number of surfaces in the system (without object surface) "
+    return len(self.surfaces)-1;
+
+  def __get_key(self,code):
+    if code not in self._keys:
+      raise NotImplementedError("Surface data code %d is not supported by LocalRaytraceEngine."%code);
+    return self._keys[code];
+
+  def get_surface_data(self,surf,code):
+    " returns surface data (given by code, see SDAT_*) of surface surf "
+    return self.surfaces[surf][self.__get_key(code)];
+
+  def set_surface_data(self,surf,code,value):
+    " set surface data (given by code, see SDAT_*) of surface surf "
+    self.surfaces[surf][self.__get_key(code)] = value;
+    return value;
+
+  def get_fingerprint(self):
+    " returns bytes identifying the current state of the system "
+    state = (self.surfaces,self.field,self.field_type,self.epd);
+    return repr(state).encode();
+
+  def _get_index(self,surf,waveNum):
+    " refractive index after surface surf for wavelength numbers waveNum (from 1) "
+    n = np.atleast_1d(np.asarray(self.surfaces[surf]['n'],dtype=float));
+    return n[0] if n.size==1 else n[np.asarray(waveNum)-1];
+
+  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1):
+    """
+    array trace of rays (see DDElinkHandler.trace_rays() for details), only
+    real raytrace is supported (mode=0); position and direction of rays which
+    missed a surface or are total internal reflected are set to NaN
+    """
+    if mode!=0: raise NotImplementedError("LocalRaytraceEngine supports only real raytracing (mode=0).");
+    nSurf = len(self.surfaces);
+    if surf<0: surf+=nSurf;
+    assert 0<surf<nSurf, "surface index %d out of range"%surf;
+    x,y,px,py,waveNum = np.broadcast_arrays(*[np.atleast_1d(a) for a in (x,y,px,py,waveNum)]);
+    x,y,px,py = [np.asarray(a,dtype=float).ravel() for a in (x,y,px,py)];
+    waveNum = np.asarray(waveNum,dtype=int).ravel();
+    nRays = x.size;
+    logging.debug("LocalRaytraceEngine.trace_rays(): number of rays: %d"%nRays);
+
+    # initial rays in global coordinates (stop surface at z=0)
+    r = self.epd/2.;
+    pos = np.column_stack((px*r,py*r,np.zeros(nRays)));
+    if self.field_type=='angle':
+      tx,ty = np.tan(np.deg2rad(x*self.field)),np.tan(np.deg2rad(y*self.field));
+      d = np.column_stack((tx,ty,np.ones(nRays)));
+    else:
+      obj = np.column_stack((x*self.field,y*self.field,np.full(nRays,-self.surfaces[0]['thick'])));
+      d = pos-obj;
+    d /= np.linalg.norm(d,axis=1)[:,np.newaxis];
+    n1 = self._get_index(0,waveNum);
+
+    error   = np.zeros(nRays,dtype=int);
+    vigcode = np.zeros(nRays,dtype=int);
+    normal  = np.tile([0.,0.,1.],(nRays,1));
+    z0 = 0.;                                  # vertex position of current surface
+    for k in range(1,surf+1):
+      s = self.surfaces[k];
+      c,K = s['curv'],s['conic'];
+      # intersection with conic surface c*(x^2+y^2+(1+K)*z^2) - 2z = 0 (local coordinates)
+      p = pos-[0,0,z0];
+      A = c*(d[:,0]**2+d[:,1]**2+(1+K)*d[:,2]**2);
+      B = c*(p[:,0]*d[:,0]+p[:,1]*d[:,1]+(1+K)*p[:,2]*d[:,2]) - d[:,2];
+      C = c*(p[:,0]**2+p[:,1]**2+(1+K)*p[:,2]**2) - 2*p[:,2];
+      with np.errstate(invalid='ignore',divide='ignore'):
+        disc = B**2-A*C;
+        t = -C/(B+np.where(B<0,-1,1)*np.sqrt(disc));  # root closest to vertex
+      missed = ~np.isfinite(t) & (error==0);
+      error[missed] = k;
+      pos = pos+t[:,np.newaxis]*d;
+      p = pos-[0,0,z0];
+      # vignetting by semi-diameter
+      vig = (p[:,0]**2+p[:,1]**2>s['semidia']**2) & (vigcode==0);
+      vigcode[vig] = k;
+      # surface normal (pointing in +z direction at the vertex) and refraction
+      normal = np.column_stack((-c*p[:,0],-c*p[:,1],1-c*(1+K)*p[:,2]));
+      normal /= np.linalg.norm(normal,axis=1)[:,np.newaxis];
+      n2 = self._get_index(k,waveNum);
+      mu = n1/n2;
+      cosi = np.sum(d*normal,axis=1);
+      with np.errstate(invalid='ignore'):
+        root = np.sqrt(1-mu**2*(1-cosi**2));
+      tir = np.isnan(root) & (error==0);
+      error[tir] = -k;
+      d = mu*d + (np.sign(cosi)*root-mu*cosi)[:,np.newaxis]*normal;
+      n1 = n2;
+      if k<surf: z0 += s['thick'];
+
+    # results in local coordinates of surface surf
+    results = np.empty(nRays,dtype=RAY_DTYPE);
+    results['error'] = error; results['vigcode'] = vigcode;
+    data = np.column_stack((pos-[0,0,z0],d,normal));
+    data[error!=0] = np.nan;
+    for i,name in enumerate(RAY_DTYPE.names[2:]): results[name] = data[:,i];
+    return results;
+
+  # merit function
+  def get_variables(self):
+    " returns list of variable parameters (surf,param) "
+    return list(self.variables);
+
+  def evaluate_merit(self):
+    " update and return value of the merit function (RMS deviation as in Zemax) "
+    self.__merit_values = np.asarray([func(self) for func,_,_ in self.operands],dtype=float);
+    weights = self.get_merit_weights();
+    diff = self.get_merit_targets()-self.__merit_values;
+    return np.sqrt(np.sum(weights*diff**2)/np.sum(weights));
+
+  def get_merit_weights(self):
+    " returns weight of each operand in the merit function "
+    return np.asarray([w for _,_,w in self.operands],dtype=float);
+
+  def get_merit_targets(self):
+    " returns target of each operand in the merit function "
+    return np.asarray([t for _,t,_ in self.operands],dtype=float);
+
+  def get_merit_values(self,rows=None):
+    """
+    returns current value of each operand in the merit function
+      rows ... (opt) list of row indices (starting from 1)
+    """
+    if self.__merit_values is None: self.evaluate_merit();
+    if rows is None: return self.__merit_values.copy();
+    return self.__merit_values[np.asarray(rows)-1];
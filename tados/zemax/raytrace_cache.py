@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent on-disk cache for the results of raytraces and analyses, which
+avoids repeated calculations for identical system states (e.g. the nominal
+system after ToleranceSystem.reset() or revisited points in line searches).
+
+@author: Hambach
+"""
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+class RaytraceCache(object):
+  """
+  content-addressed cache around a raytrace engine (e.g. DDElinkHandler)
+
+  The key of each entry is a hash of the current state of the system (see
+  RaytraceEngine.get_fingerprint()) and of all input arguments. Results are
+  stored as .npy files in the cache directory and are returned as copy-on-write
+  memory maps (no copy into memory, changes of the returned array are not
+  written back to the cache). Entries are evicted in least-recently used
+  order, if the total size exceeds max_size.
+
+  Note: with compress=True, results are stored in compressed .npz files,
+  which require less disk space but have to be loaded completely.
+
+  Example:
+  >>> cache = RaytraceCache(hDDE,'./raytrace_cache');
+  >>> ret = cache.trace_rays(x,y,px,py,1);         # same as hDDE.trace_rays()
+  """
+
+  def __init__(self,engine,cachedir,max_size=2**30,compress=False):
+    """
+      engine   ... raytrace engine, see tados.zemax.raytrace_engine
+      cachedir ... directory for cached results (created if necessary)
+      max_size ... (opt) maximal total size of the cache in bytes
+      compress ... (opt) store results in compressed files (no memory maps)
+    """
+    self.engine = engine;
+    self.cachedir = cachedir;
+    self.max_size = max_size;
+    self.compress = compress;
+    self.hits = self.misses = 0;
+    if not os.path.isdir(cachedir): os.makedirs(cachedir);
+
+  def get_key(self,name,*arrays,**params):
+    " hash of system state, name of the calculation and all input arguments "
+    h = hashlib.sha1(self.engine.get_fingerprint());
+    h.update(name.encode());
+    h.update(repr(sorted(params.items())).encode());
+    for a in arrays:
+      a = np.ascontiguousarray(a);
+      h.update(repr((a.dtype.str,a.shape)).encode());
+      h.update(a.tobytes());
+    return h.hexdigest();
+
+  def __path(self,key,ext):
+    return os.path.join(self.cachedir,key+ext);
+
+  def __save_array(self,key,data):
+    " store array atomically (write to temporary file first) "
+    ext = '.npz' if self.compress else '.npy';
+    tmp = self.__path(key,'.tmp'+ext);
+    if self.compress: np.savez_compressed(tmp,data=data);
+    else:             np.save(tmp,data);
+    os.replace(tmp,self.__path(key,ext));
+
+  def __save_params(self,key,params):
+    " store dictionary atomically as .json file "
+    tmp = self.__path(key,'.tmp.json');
+    with open(tmp,'w') as f: json.dump(params,f);
+    os.replace(tmp,self.__path(key,'.json'));
+
+  def __load_array(self,key):
+    " returns cached array or None, updates access time of entry "
+    for ext in ('.npy','.npz'):
+      path = self.__path(key,ext);
+      if os.path.exists(path):
+        os.utime(path);
+        if ext=='.npy': return np.load(path,mmap_mode='c');    # copy-on-write
+        with np.load(path) as f: return f['data'];
+    return None;
+
+  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1):
+    """
+    cached array trace of rays (see DDElinkHandler.trace_rays())
+    """
+    x,y,px,py = [np.asarray(a,dtype=float) for a in np.broadcast_arrays(x,y,px,py,waveNum)[:4]];
+    waveNum = np.broadcast_to(np.asarray(waveNum,dtype=int),x.shape);
+    key = self.get_key('trace_rays',x,y,px,py,waveNum,mode=mode,surf=surf);
+    results = self.__load_array(key);
+    if results is not None:
+      self.hits += 1;
+      return results;
+    self.misses += 1;
+    results = self.engine.trace_rays(x,y,px,py,waveNum,mode=mode,surf=surf);
+    self.__save_array(key,results);
+    self.evict();
+    return results;
+
+  def analysis(self,name,*args,**kwargs):
+    """
+    cached analysis, i.e., engine.<name>(*args,**kwargs), which must return
+    a tuple (data,params) of an array and a dictionary of strings, e.g.,
+    name='zGeometricImageAnalysis' or name='zInterferogram'. The key includes
+    the analysis settings of the engine (see RaytraceEngine.get_analysis_settings()).
+    """
+    settings = hashlib.sha1(self.engine.get_analysis_settings()).hexdigest();
+    key = self.get_key(name,args=args,settings=settings,**kwargs);
+    data = self.__load_array(key);
+    if data is not None and os.path.exists(self.__path(key,'.json')):
+      self.hits += 1;
+      with open(self.__path(key,'.json')) as f: params = json.load(f);
+      return data,params;
+    self.misses += 1;
+    data,params = getattr(self.engine,name)(*args,**kwargs);
+    self.__save_params(key,params);
+    self.__save_array(key,data);
+    self.evict();
+    return data,params;
+
+  def get_size(self):
+    " returns total size of all cached files in bytes "
+    return sum(os.path.getsize(os.path.join(self.cachedir,f)) for f in os.listdir(self.cachedir));
+
+  def evict(self,max_size=None):
+    " remove least-recently used entries until total size is below max_size "
+    if max_size is None: max_size = self.max_size;
+    entries = {};                      # key: [total size, last access time, files]
+    for f in os.listdir(self.cachedir):
+      path = os.path.join(self.cachedir,f);
+      stat = os.stat(path);
+      entry = entries.setdefault(f.split('.')[0],[0,0,[]]);
+      entry[0] += stat.st_size;
+      entry[1] = max(entry[1],stat.st_mtime);
+      entry[2].append(path);
+    size = sum(e[0] for e in entries.values());
+    for key,(nbytes,_,files) in sorted(entries.items(),key=lambda item: item[1][1]):
+      if size<=max_size: break;
+      logging.debug("RaytraceCache: evict entry %s (%d bytes)"%(key,nbytes));
+      try:
+        for path in files: os.remove(path);
+      except OSError as e:             # e.g. file still memory-mapped (Windows)
+        logging.warning("RaytraceCache: could not evict entry %s (%s)"%(key,e));
+        continue;
+      size -= nbytes;
+
+  def clear(self):
+    " remove all entries from the cache "
+    self.evict(max_size=0);
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Abstract interface for raytrace engines (e.g. Zemax via DDE link or a local
+raytracer), which is used by the optimization and transmission calculations.
+
+@author: Hambach
+"""
+
+import abc, six
+import numpy as np
+
+# structured data type for the results of trace_rays()
+RAY_DTYPE = np.dtype([('error',np.int32), ('vigcode',np.int32),
+                      ('x',float), ('y',float), ('z',float),
+                      ('l',float), ('m',float), ('n',float),
+                      ('l2',float), ('m2',float), ('n2',float)]);
+
+def get_fields(rays,names):
+  """
+  returns selected fields of the structured results of trace_rays() as 2D
+  float array of shape (nRays,len(names)). For adjacent float fields in the
+  order of RAY_DTYPE (e.g. ('x','y') or ('l','m','n')), this is a view on
+  the results (no copy), otherwise a new array.
+  """
+  names = list(names);
+  fields = rays.dtype.fields;
+  offsets = [fields[name][1] for name in names];
+  adjacent = all(fields[name][0]==np.float64 for name in names) and \
+             all(o==offsets[0]+8*i for i,o in enumerate(offsets));
+  if not adjacent:
+    return np.column_stack([rays[name] for name in names]).astype(float);
+  block = np.dtype({'names':['block'], 'formats':[(np.float64,(len(names),))],
+                    'offsets':[offsets[0]], 'itemsize':rays.dtype.itemsize});
+  return rays.view(block)['block'];
+
+@six.add_metaclass(abc.ABCMeta)    # backward compatible to 2.7
+class RaytraceEngine(object):
+  """
+  abstract base class for raytrace engines, defines interface only
+
+  Surface data is addressed by the codes of the Zemax DDE interface
+  (see class constants SDAT_*), merit-function rows start from 1.
+  """
+  SDAT_CURV    = 2;               # curvature of surface
+  SDAT_THICK   = 3;               # thickness after surface
+  SDAT_GLASS   = 4;               # glass (or refractive index) after surface
+  SDAT_SEMIDIA = 5;               # semi-diameter of surface
+  SDAT_CONIC   = 6;               # conic constant of surface
+
+  def __enter__(self):
+    return self;
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return;
+
+  @abc.abstractmethod
+  def load(self,filename):
+    " load optical system from file "
+    return;
+
+  @abc.abstractmethod
+  def trace_rays(self,x,y, px,py, waveNum, mode=0, surf=-1):
+    """
+    array trace of rays (see DDElinkHandler.trace_rays() for details)
+      x,y     ... reduced field coordinates for each ray, vectors of length nRays
+      px,py   ... reduced pupil coordinates for each ray, vectors of length nRays
+      waveNum ... wavelength number
+      mode    ... (opt) 0= real (default), 1 = paraxial
+      surf    ... (opt) surface to trace the ray to (default: -1, image surface)
+    Returns: structured array of shape (nRays,) and dtype RAY_DTYPE with fields
+      error,vigcode,x,y,z,l,m,n,l2,m2,n2 (use get_fields() for 2D arrays)
+    """
+    return;
+
+  @abc.abstractmethod
+  def get_num_surfaces(self):
+    " returns number of surfaces in the system (without object surface) "
+    return;
+
+  @abc.abstractmethod
+  def get_surface_data(self,surf,code):
+    " returns surface data (given by code, see SDAT_*) of surface surf "
+    return;
+
+  @abc.abstractmethod
+  def set_surface_data(self,surf,code,value):
+    " set surface data (given by code, see SDAT_*) of surface surf "
+    return;
+
+  def get_surface_parameter(self,surf,param):
+    " returns surface parameter param of surface surf "
+    raise NotImplementedError("Surface parameters are not supported by %s."%type(self).__name__);
+
+  def set_surface_parameter(self,surf,param,value):
+    " set surface parameter param of surface surf "
+    raise NotImplementedError("Surface parameters are not supported by %s."%type(self).__name__);
+
+  def update(self):
+    " update system after changes (pupil positions, solves, ...), returns error flag "
+    return 0;
+
+  def show(self):
+    " show current state of the system (e.g. in lens data editor) "
+    return;
+
+  def get_fingerprint(self):
+    " returns bytes identifying the current state of the system (e.g. for caching) "
+    raise NotImplementedError("Fingerprint is not supported by %s."%type(self).__name__);
+
+  def get_analysis_settings(self):
+    " returns bytes identifying the settings of the analyses (e.g. for caching) "
+    return b'';
+
+  # merit function
+  @abc.abstractmethod
+  def get_variables(self):
+    " returns list of variable parameters as tuples (surf,param) "
+    return;
+
+  @abc.abstractmethod
+  def evaluate_merit(self):
+    " update and return value of the merit function "
+    return;
+
+  @abc.abstractmethod
+  def get_merit_weights(self):
+    " returns weight of each row in the merit function "
+    return;
+
+  @abc.abstractmethod
+  def get_merit_targets(self):
+    " returns target of each row in the merit function "
+    return;
+
+  @abc.abstractmethod
+  def get_merit_values(self,rows=None):
+    """
+    returns current value of each row in the merit function
+    (call evaluate_merit() before to update the values)
+      rows ... (opt) list of row indices (starting from 1)
+    """
+    return;
@@ -6,6 +6,7 @@ Created on Thu Apr 07 19:45:55 2016
 """
 import numpy as np
 import matplotlib.pylab as plt
+from matplotlib.path import Path
 
 
 def cartesian_sampling(nx,ny,rmax=1.):
@@ -30,7 +31,7 @@ def cartesian_sampling(nx,ny,rmax=1.):
   ind = x**2 + y**2 <= rmax**2;
   return x[ind],y[ind]
 
-def hexapolar_sampling(Nr,rmax=1.,ind=False):
+def hexapolar_sampling(Nr,rmax=1.,ind=False,offsets=False):
   """
   hexapolar sampling with roughly equi-area sampling point distribution
   
@@ -42,6 +43,8 @@ def hexapolar_sampling(Nr,rmax=1.,ind=False):
      radius of circular aperture, default 1
    ind : bool, optional
      if true, number of points and weights of each ring are returned
+   offsets : bool, optional
+     if true, index of the first point of each ring is returned
      
   Returns
   ------
@@ -51,30 +54,32 @@ def hexapolar_sampling(Nr,rmax=1.,ind=False):
      number of points in each ring
    weight : 1d-array of size Nr, optional
      weight of each ring     
+   ring_offsets : 1d-array of size Nr+1, optional
+     points of ring i have indices ring_offsets[i]:ring_offsets[i+1]
   """
-  r = np.arange(1,Nr,dtype=np.double)/Nr*rmax;               # ring centers
-  Ntet = 6*np.arange(1,Nr);                  # number of points on each ring
-  # construct grid points in each ring  
-  x=[0]; y=[0];                              # first ring
-  for i in range(Nr-1):
-    tet = np.linspace(0,2*np.pi,Ntet[i],endpoint=False);
-    x.extend(r[i]*np.cos(tet));
-    y.extend(r[i]*np.sin(tet));
-  x=np.asarray(x).flatten();
-  y=np.asarray(y).flatten();
+  Ntet = np.ones(Nr,dtype=int);              # number of points on each ring
+  Ntet[1:] = 6*np.arange(1,Nr);
+  ring_offsets = np.zeros(Nr+1,dtype=int);
+  ring_offsets[1:] = np.cumsum(Ntet);
+  # construct grid points of all rings at once
+  ring = np.repeat(np.arange(Nr),Ntet);      # ring index of each point
+  k    = np.arange(ring_offsets[-1])-ring_offsets[ring];  # point index within ring
+  tet  = k*(2*np.pi/Ntet)[ring];             # same angles as np.linspace(0,2pi,Ntet,endpoint=False)
+  r    = ring/Nr*rmax;                       # ring centers
+  x = r*np.cos(tet);
+  y = r*np.sin(tet);
+  ret = (x,y);
   # calculate number of points and weight of each ring, if desired
-  if ind==False: 
-    return x,y;
-  elif Nr==1:
-    return x,y,[1],[1];
-  else:
-    # calculate area of each ring Nr>1
-    dr = r[1]-r[0];    
-    area = ( (r+dr/2.)**2 - (r-dr/2.)**2 );
-    # add first ring    
-    area = np.insert(area,0, (dr/2.)**2);
-    Ntet = np.insert(Ntet,0, 1);
-    return x,y,Ntet,area/rmax**2;
+  if ind:
+    # area of each ring, first ring is a circle with radius dr/2
+    dr = rmax/Nr;
+    rc = np.arange(Nr)*dr;
+    area = (rc+dr/2.)**2 - (rc-dr/2.)**2;
+    area[0] = (dr/2.)**2 if Nr>1 else rmax**2;   # single ring covers full aperture
+    ret += (Ntet,area/rmax**2);
+  if offsets:
+    ret += (ring_offsets,);
+  return ret;
     
       
 def fibonacci_sampling(N,rmax=1.):
@@ -133,6 +138,168 @@ def fibonacci_sampling_with_circular_boundary(N,Nboundary=None,rmax=1.):
   return np.hstack((x, xp)), np.hstack((y, yp));
   
 
+def regular_polygon(N,rinner=1.,angle=0.):
+  """
+  vertices of regular polygon, e.g. as aperture for the sampling functions
+  
+  Parameters
+  ----------
+   N : integer
+     number of edges
+   rinner: float, optional
+     inner radius (distance of edges from center), default 1
+   angle: float, optional
+     direction of normal of first edge [rad], default 0 (edge parallel to y)
+     
+  Returns
+  ------
+   polygon : 2d-array of shape (N,2)
+     x and y coordinates of each vertex
+  """
+  tet = angle + np.pi/N*(2*np.arange(N)+1);
+  R = rinner/np.cos(np.pi/N);                # outer radius
+  return np.column_stack((R*np.cos(tet),R*np.sin(tet)));
+
+def _get_bounding_box(rmax,polygon):
+  " returns (xmin,ymin),(xmax,ymax) of circular or polygonal aperture "
+  if polygon is None: return (-rmax,-rmax),(rmax,rmax);
+  polygon = np.asarray(polygon);
+  return polygon.min(axis=0),polygon.max(axis=0);
+
+def _inside_aperture(x,y,rmax,polygon):
+  " returns True for each point inside the circular or polygonal aperture "
+  if polygon is None: return x**2 + y**2 <= rmax**2;
+  return Path(polygon).contains_points(np.column_stack((x,y)));
+
+def _qmc_sampling(engine,N,rmax,polygon):
+  " first N points of the low-discrepancy sequence 'engine' inside aperture "
+  (xmin,ymin),(xmax,ymax) = _get_bounding_box(rmax,polygon);
+  x = np.zeros(0); y = np.zeros(0);
+  m = int(np.ceil(np.log2(max(N,1))));
+  while x.size<N:
+    if m>30: raise ValueError("aperture is too small for sampling");
+    # draw next 2^m points (keeps balance properties of Sobol sequences)
+    u = engine.random_base2(m) if hasattr(engine,'random_base2') else engine.random(2**m);
+    xi = xmin + u[:,0]*(xmax-xmin);
+    yi = ymin + u[:,1]*(ymax-ymin);
+    ind = _inside_aperture(xi,yi,rmax,polygon);
+    x = np.hstack((x,xi[ind])); y = np.hstack((y,yi[ind]));
+    m = int(round(np.log2(engine.num_generated)));  # next draw doubles number of points
+  return x[:N],y[:N],np.full(N,1./N);
+
+def sobol_sampling(N,rmax=1.,polygon=None,scramble=True,seed=None):
+  """
+  (scrambled) Sobol sequence inside circular or polygonal aperture, 
+  requires scipy>=1.7 (scipy.stats.qmc)
+
+  Parameters
+  ----------
+   N : integer
+     number of points
+   rmax: float, optional
+     radius of circular aperture, default 1
+   polygon: 2d-array of shape (nVertices,2), optional
+     vertices of polygonal aperture (replaces circular aperture)
+   scramble: bool, optional
+     randomized (Owen-scrambled) sequence, default True
+   seed: integer or numpy.random.Generator, optional
+     seed for scrambling
+     
+  Returns
+  ------
+   x,y :  1d-arrays of size N
+     x and y coordinates for each point 
+   weights : 1d-array of size N
+     weight of each point (uniform, sum is 1)
+  """
+  from scipy.stats import qmc
+  return _qmc_sampling(qmc.Sobol(2,scramble=scramble,seed=seed),N,rmax,polygon);
+
+def halton_sampling(N,rmax=1.,polygon=None,scramble=True,seed=None):
+  """
+  (scrambled) Halton sequence inside circular or polygonal aperture, 
+  requires scipy>=1.7 (scipy.stats.qmc), see sobol_sampling() for parameters
+  """
+  from scipy.stats import qmc
+  return _qmc_sampling(qmc.Halton(2,scramble=scramble,seed=seed),N,rmax,polygon);
+
+def stratified_sampling(N,rmax=1.,polygon=None,seed=None):
+  """
+  stratified (jittered) sampling inside circular or polygonal aperture:
+  one random point in each cell of a cartesian grid, the grid size is chosen
+  such that approximately N points are inside the aperture
+
+  Parameters
+  ----------
+   N : integer
+     approximate number of points
+   rmax: float, optional
+     radius of circular aperture, default 1
+   polygon: 2d-array of shape (nVertices,2), optional
+     vertices of polygonal aperture (replaces circular aperture)
+   seed: integer or numpy.random.Generator, optional
+     seed for the random jitter
+     
+  Returns
+  ------
+   x,y :  1d-arrays of size ~N
+     x and y coordinates for each point 
+   weights : 1d-array of size ~N
+     weight of each point (uniform, sum is 1)
+  """
+  rng = np.random.default_rng(seed);
+  (xmin,ymin),(xmax,ymax) = _get_bounding_box(rmax,polygon);
+  # area of aperture
+  if polygon is None: area = np.pi*rmax**2;
+  else:
+    px,py = np.asarray(polygon).T;
+    area = 0.5*np.abs(np.dot(px,np.roll(py,1))-np.dot(py,np.roll(px,1)));
+  h = np.sqrt(area/N);                       # size of grid cells
+  nx = max(int(round((xmax-xmin)/h)),1);
+  ny = max(int(round((ymax-ymin)/h)),1);
+  ix,iy = np.meshgrid(np.arange(nx),np.arange(ny));
+  x = xmin + (xmax-xmin)/nx*(ix.ravel()+rng.random(nx*ny));
+  y = ymin + (ymax-ymin)/ny*(iy.ravel()+rng.random(nx*ny));
+  ind = _inside_aperture(x,y,rmax,polygon);
+  return x[ind],y[ind],np.full(np.sum(ind),1./np.sum(ind));
+
+def apodized_sampling(N,w,n=2.,rmax=1.,polygon=None,sampling=sobol_sampling,**kwargs):
+  """
+  sampling with weights given by a (super-)Gaussian intensity profile
+  (see tados.laser.intensity_profile), e.g., for a laser beam in the pupil
+
+  Parameters
+  ----------
+   N : integer
+     number of points
+   w : float
+     beam radius (intensity drops to 1/e^2)
+   n : float, optional
+     order of the super-Gaussian profile, default 2 (Gaussian)
+   rmax, polygon : optional
+     circular or polygonal aperture, see sobol_sampling()
+   sampling : function, optional
+     sampling of the aperture, default: sobol_sampling
+   kwargs : optional
+     further arguments for sampling function (e.g. seed)
+     
+  Returns
+  ------
+   x,y :  1d-arrays of size N
+     x and y coordinates for each point 
+   weights : 1d-array of size N
+     weight of each point, proportional to the intensity (sum is 1)
+
+  Note: the weights are point samples of the intensity I at each point, not
+  the integral of I over the area represented by the point. For a point
+  spacing h, the error of each weight is bounded by max|grad I|*h, i.e.,
+  about 1.2*h/w relative to the peak intensity for a Gaussian profile (n=2).
+  """
+  from tados.laser.laser import intensity_profile
+  x,y,weights = sampling(N,rmax=rmax,polygon=polygon,**kwargs);
+  weights = weights*intensity_profile(np.hypot(x,y),w,n=n);
+  return x,y,weights/np.sum(weights);
+
 def __test_sampling(pos,title=""):
   (x,y) = pos;
   fig,ax=plt.subplots(1,1);
@@ -148,4 +315,6 @@ if __name__ == '__main__':
   __test_sampling( hexapolar_sampling(11),    'Hexapolar');
   __test_sampling( fibonacci_sampling(500),   'Fibonacci');
   __test_sampling( fibonacci_sampling_with_circular_boundary(500), 'Fibonacci+boundary');
+  __test_sampling( sobol_sampling(500)[:2],   'Sobol');
+  __test_sampling( stratified_sampling(500,polygon=regular_polygon(8))[:2], 'Stratified (octagon)');
  
\ No newline at end of file
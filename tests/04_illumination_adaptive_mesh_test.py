@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the adaptive mesh using an analytical mapping with a 
+discontinuity and a circular region of invalid points (no Zemax needed)
+
+@author: Hambach
+"""
+
+from __future__ import division
+import numpy as np
+
+from _context import tados
+from tados.illumination.adaptive_mesh import AdaptiveMesh, _GrowingArray
+from tados.zemax import sampling
+
+def mapping(domain_points):
+  " shift upper half plane by 0.5 along x, points outside circle r^2<0.8 are invalid"
+  x,y = domain_points.T;
+  image_points = np.column_stack((x+0.5*np.sign(y+0.1*x), y));
+  image_points[x**2+y**2>0.8] = np.nan;
+  return image_points;
+  
+def get_refined_mesh(lthresh=0.2,Athresh=1e-5,mapping=mapping):
+  px,py = sampling.fibonacci_sampling_with_circular_boundary(400);
+  Mesh = AdaptiveMesh(np.vstack((px,py)).T, mapping);
+  Mesh.refine_invalid_triangles(nDivide=100);
+  def is_broken(simplices):
+    broken = Mesh.find_broken_triangles(simplices=simplices,lthresh=lthresh);
+    broken[broken] = Mesh.get_area_in_domain(simplices=simplices[broken])>Athresh;
+    return broken;
+  while Mesh.refine_broken_triangles(is_broken,nDivide=100)>0: pass
+  return Mesh;
+  
+def test_growing_array():
+  ref = np.arange(30).reshape(10,3);
+  arr = _GrowingArray(ref,capacity=12);
+  arr.append(ref); ref=np.vstack((ref,ref));
+  assert np.array_equal(arr.data,ref);
+  # replace more, less and same number of rows than removed
+  for nNew in (7,1,4):
+    bReplace = np.zeros(len(arr),dtype=bool); bReplace[[0,3,4,len(arr)-1]]=True;
+    new = -np.arange(3*nNew).reshape(nNew,3);
+    ref = np.vstack((arr.data[~bReplace],new));
+    arr.replace(bReplace,new);
+    assert len(arr)==ref.shape[0];
+    assert sorted(map(tuple,arr.data))==sorted(map(tuple,ref));
+    
+def test_refinement_conserves_area():
+  Mesh = get_refined_mesh();
+  area = Mesh.get_area_in_domain();
+  assert np.all(area>0);                           # all triangles oriented ccw
+  assert not np.any(np.isnan(Mesh.image[Mesh.simplices]));  # no invalid vertices
+  # total area is close to area of the valid circle (r^2<0.8)
+  assert abs(np.sum(area)/(0.8*np.pi)-1) < 0.01;    
+  
+def test_refinement_merges_points():
+  Mesh = get_refined_mesh();
+  nPoints = Mesh.domain.shape[0];
+  assert np.unique(Mesh.domain,axis=0).shape[0] == nPoints;    # no duplicate points
+  
+  
+def test_points_are_mapped_only_once():
+  mapped_points = [];
+  def recording_mapping(domain_points):
+    mapped_points.extend(map(tuple,domain_points.tolist()));
+    return mapping(domain_points);
+  get_refined_mesh(mapping=recording_mapping);
+  assert len(mapped_points)==len(set(mapped_points));
+  
+def get_boundary_edges(Mesh):
+  " returns edges which belong to only one triangle, shape (nEdges,2)"
+  edges = np.sort(np.stack((Mesh.simplices,np.roll(Mesh.simplices,-1,axis=1)),axis=-1).reshape(-1,2),axis=1);
+  edges,count = np.unique(edges,axis=0,return_counts=True);
+  return edges[count==1];
+
+def test_bisection_keeps_mesh_conforming():
+  px,py = sampling.fibonacci_sampling_with_circular_boundary(200);
+  Mesh = AdaptiveMesh(np.vstack((px,py)).T, lambda p: p**2);
+  area = np.sum(Mesh.get_area_in_domain());
+  boundary = get_boundary_edges(Mesh);
+  perimeter = np.sum(np.linalg.norm(np.diff(Mesh.domain[boundary],axis=1),axis=2));
+  is_large = lambda simplices: np.abs(Mesh.get_area_in_image(simplices))>1e-3;
+  for it in range(3):
+    nTriangles = Mesh.simplices.shape[0];
+    assert Mesh.refine_large_triangles(is_large,bisection=True)>0;
+    assert Mesh.simplices.shape[0]>nTriangles;
+    assert np.all(Mesh.get_area_in_domain()>0);
+  assert np.isclose(np.sum(Mesh.get_area_in_domain()),area);
+  # no hanging nodes: edges with only one triangle are on the (split) boundary
+  boundary = get_boundary_edges(Mesh);
+  assert np.isclose(np.sum(np.linalg.norm(np.diff(Mesh.domain[boundary],axis=1),axis=2)),perimeter);
+  
+def test_bisection_after_broken_triangles():
+  Mesh = get_refined_mesh();
+  area = np.sum(Mesh.get_area_in_domain());
+  is_large = lambda simplices: np.abs(Mesh.get_area_in_domain(simplices))>1e-3;
+  Mesh.refine_large_triangles(is_large);                  # mesh is no Delaunay mesh
+  assert not np.any(is_large(Mesh.simplices)) or Mesh.refine_large_triangles(is_large)>0;
+  assert np.isclose(np.sum(Mesh.get_area_in_domain()),area);
+  
+def test_neighbors_are_updated():
+  def check_neighbors(Mesh):
+    # reference: triangles sharing the same edge (brute force)
+    simplices = Mesh.simplices; nTriangles = simplices.shape[0];
+    edges = np.sort(np.stack((simplices,np.roll(simplices,-1,axis=1)),axis=-1),axis=-1).reshape(-1,2);
+    edges,inverse,count = np.unique(edges,axis=0,return_inverse=True,return_counts=True);
+    ref = -np.ones(3*nTriangles,dtype=int);
+    order = np.argsort(inverse,kind='stable'); shared = (count[inverse[order]]==2);
+    h1,h2 = order[shared][::2],order[shared][1::2];
+    ref[h1] = h2//3; ref[h2] = h1//3;
+    assert np.array_equal(Mesh.neighbors,ref.reshape(nTriangles,3));
+  px,py = sampling.fibonacci_sampling_with_circular_boundary(400);
+  Mesh = AdaptiveMesh(np.vstack((px,py)).T, mapping);
+  check_neighbors(Mesh);
+  Mesh.refine_invalid_triangles(nDivide=10);
+  check_neighbors(Mesh);
+  is_broken = lambda simplices: Mesh.find_broken_triangles(simplices=simplices,lthresh=0.2);
+  for it in range(2):
+    Mesh.refine_broken_triangles(is_broken,nDivide=10);
+    check_neighbors(Mesh);
+  Mesh.refine_large_triangles(lambda simplices: Mesh.get_area_in_domain(simplices)>1e-3);
+  check_neighbors(Mesh);
+  
+
+if __name__ == '__main__':
+  test_growing_array();
+  test_refinement_conserves_area();
+  test_refinement_merges_points();
+  test_points_are_mapped_only_once();
+  test_bisection_keeps_mesh_conforming();
+  test_bisection_after_broken_triangles();
+  test_neighbors_are_updated();
+  get_refined_mesh().plot_triangulation();
+  import matplotlib.pylab as plt
+  plt.show();
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the transmission calculation using an analytical raytrace 
+function (parabolic distortion with field dependent shift, no Zemax needed)
+
+@author: Hambach
+"""
+
+from __future__ import division
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from _context import tados
+from tados.illumination import transmission
+from tados.zemax import sampling
+
+def raytrace(params, pupil_points):
+  " shift pupil points by field point, rays with px>0.8 are vignetted (invalid)"
+  x,y   = params.T;                                      # params of shape (Np,) or (nPoints,Np)
+  px,py = pupil_points.T;
+  image = np.column_stack((0.2*x+px*(1+0.1*py**2), 0.2*y+py));
+  image[px>0.8] = np.nan;
+  return image;
+
+def get_transmission(detectors):
+  xx,yy = sampling.cartesian_sampling(3,3,rmax=1);
+  field_sampling = np.vstack((xx,yy)).T;                 # size (nFieldPoints,2)
+  px,py = sampling.fibonacci_sampling_with_circular_boundary(200,40);
+  pupil_sampling = np.vstack((px,py)).T;                 # size (nPoints,2)
+  return transmission.Transmission(field_sampling,pupil_sampling,raytrace,detectors);
+
+def get_detectors():
+  return [ transmission.RectImageDetector(extent=(3,3),pixels=(60,50)),
+           transmission.PolarImageDetector(rmax=1.5,nrings=30),
+           transmission.LineImageDetector(pixels=80,start=(-1.5,0),end=(1.5,0)) ];
+
+def test_parallel_transmission():
+  detectors = get_detectors();
+  get_transmission(detectors).total_transmission(lthresh=0.5);
+  # same calculation with parallel evaluation of field points
+  parallel_detectors = get_detectors();
+  with ThreadPoolExecutor(max_workers=4) as executor:
+    get_transmission(parallel_detectors).total_transmission(lthresh=0.5,executor=executor);
+  for d,pd in zip(detectors,parallel_detectors):
+    assert np.sum(d.intensity)>0;
+    assert np.allclose(d.intensity,pd.intensity);
+  
+
+def test_batched_transmission():
+  ncalls = [0];
+  def counting_raytrace(params, pupil_points):
+    ncalls[0]+=1;
+    return raytrace(params, pupil_points);
+  detectors = get_detectors();
+  T = get_transmission(detectors); T.raytrace = counting_raytrace;
+  T.total_transmission(lthresh=0.5);
+  nSequential = ncalls[0]; ncalls[0] = 0;
+  # same calculation with one raytrace call per refinement round for all field points
+  batched_detectors = get_detectors();
+  T = get_transmission(batched_detectors); T.raytrace = counting_raytrace;
+  T.total_transmission(lthresh=0.5,batched=True);
+  assert ncalls[0] < nSequential/2;
+  for d,bd in zip(detectors,batched_detectors):
+    assert np.allclose(d.intensity,bd.intensity);
+
+def test_line_detector_projection():
+  from tados.illumination.adaptive_mesh import AdaptiveMesh
+  # identity mapping on a (refined) random mesh: projected area is the total area
+  points = np.random.RandomState(1).rand(200,2);
+  mesh = AdaptiveMesh(points,lambda p: p.copy());
+  d = transmission.LineImageDetector(pixels=1000,start=(0,0.5),end=(1,0.5));
+  d.add(mesh);
+  assert np.all(d.intensity>=-1e-10);                         # up to rounding errors
+  assert np.isclose(np.sum(d.intensity)/d.pixels, 1, rtol=1e-10); # exact integration over pixels
+  # triangle (0,0),(0.3,1),(0.45,0) with inner point: exact pixel averages of projected height
+  mesh = AdaptiveMesh(np.array([(0.,0.),(0.3,1.),(0.45,0.),(0.25,0.3)]),lambda p: p.copy());
+  d = transmission.LineImageDetector(pixels=4,start=(0,0.5),end=(1,0.5));
+  d.add(mesh);
+  area = mesh.initial_domain_area;
+  height = lambda x: np.where(x<0.3,x/0.3,np.maximum(0,(0.45-x)/0.15));
+  x = np.linspace(0,1,400001); avg = [np.mean(height(x[(x>=k/4.)&(x<(k+1)/4.)])) for k in range(4)];
+  assert np.allclose(d.intensity*area,avg,atol=1e-5);
+
+def test_chunked_detectors():
+  from tados.illumination.adaptive_mesh import AdaptiveMesh
+  points = 0.8*np.random.RandomState(2).rand(500,2);    # all rays valid
+  mesh = AdaptiveMesh(points,lambda p: raytrace(np.array((1.,0.)),p));
+  bSkip = np.arange(mesh.simplices.shape[0])%7==0;
+  for d in get_detectors():
+    d.add(mesh,bSkip=bSkip);
+    chunked = d.empty(); chunked.chunksize = 50;
+    chunked.add(mesh,bSkip=bSkip);
+    assert np.array_equal(d.intensity,chunked.intensity);
+
+def test_sparse_detector():
+  import io
+  dense  = transmission.RectImageDetector(extent=(3,3),pixels=(120,100));
+  sparse = transmission.SparseImageDetector(extent=(3,3),pixels=(120,100),tile_size=8);
+  get_transmission([dense,sparse]).total_transmission(lthresh=0.5);
+  X,Y,intensity = sparse.get_footprint();
+  assert np.allclose(intensity,dense.intensity);
+  assert len(sparse.tile_constant)+len(sparse.tile_data) < 15*13;   # not all tiles are used
+  # export with lower resolution
+  X,Y,intensity = sparse.get_footprint(pixels=(40,20));
+  assert np.allclose(intensity,dense.intensity[1::3,2::5]);
+  # checkpoint and merge
+  f = io.BytesIO(); sparse.save(f); f.seek(0);
+  restored = sparse.empty().load(f).merge(sparse);
+  assert np.allclose(restored.get_footprint()[2],2*dense.intensity);
+
+def test_deposition_backends():
+  import tados.illumination
+  if 'numba' not in tados.illumination.available_backends(): return   # numba not installed
+  backend = tados.illumination.get_backend();
+  results = [];
+  try:
+    for name in ('numpy','numba'):
+      tados.illumination.set_backend(name);
+      detectors = get_detectors()[:2];                   # rect and polar detector
+      get_transmission(detectors).total_transmission(lthresh=0.5);
+      results.append([d.intensity for d in detectors]);
+  finally:
+    tados.illumination.set_backend(backend);
+  for intensity_numpy,intensity_numba in zip(*results):
+    assert np.array_equal(intensity_numpy,intensity_numba);
+
+def test_converged_transmission():
+  nPoints = [0];
+  def split_raytrace(params, pupil_points):
+    " image is split along a line in the pupil (discontinuity) "
+    nPoints[0] += pupil_points.shape[0];
+    image = raytrace(params, pupil_points);
+    image[:,1] += 0.5*np.sign(pupil_points[:,1]+0.1*pupil_points[:,0]);
+    return image;
+  reference = get_detectors()[:2];
+  T = get_transmission(reference); T.raytrace = split_raytrace;
+  T.total_transmission(lthresh=0.4,Athresh=1e-9);
+  nReference = nPoints[0]; nPoints[0] = 0;
+  detectors = get_detectors()[:2];
+  T = get_transmission(detectors); T.raytrace = split_raytrace;
+  T.total_transmission(lthresh=0.4,Athresh=1e-9,rtol=1e-2);
+  assert nPoints[0] < nReference/2;
+  for d,ref in zip(detectors,reference):
+    assert d.relative_difference(ref) < 1e-2;
+
+def test_merge_and_save_detectors():
+  import io
+  detectors = get_detectors();
+  T = get_transmission(detectors);
+  T.total_transmission(lthresh=0.5);
+  # split calculation in two parts and merge results
+  parts = [];
+  for ind in (slice(0,4),slice(4,None)):
+    part = [d.empty() for d in detectors];
+    transmission.Transmission(T.parameters[ind],T.mesh_points,raytrace,part,
+                              weights=T.weights[ind]).total_transmission(lthresh=0.5);
+    parts.append(part);
+  for d,p1,p2 in zip(detectors,*parts):
+    assert np.allclose(d.intensity, p1.merge(p2).intensity);
+    # checkpoint detector to file and restore it
+    f = io.BytesIO(); p1.save(f); f.seek(0);
+    assert np.array_equal(p1.intensity, d.empty().load(f).intensity);
+  # detectors with different geometry cannot be merged
+  try:
+    detectors[0].merge(transmission.RectImageDetector(extent=(3,3),pixels=(60,51)));
+    assert False, "merge of detectors with different geometry should fail";
+  except ValueError: pass
+  
+
+if __name__ == '__main__':
+  import matplotlib.pylab as plt
+  test_parallel_transmission();
+  test_batched_transmission();
+  test_line_detector_projection();
+  test_chunked_detectors();
+  test_sparse_detector();
+  test_deposition_backends();
+  test_converged_transmission();
+  test_merge_and_save_detectors();
+  detectors = get_detectors();
+  get_transmission(detectors).total_transmission(lthresh=0.5);
+  for d in detectors: d.show();
+  plt.show();
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the local raytrace engine (plano-convex lens, no Zemax needed)
+and its use in the optimizer interface
+
+@author: Hambach
+"""
+
+from __future__ import division
+import numpy as np
+
+from _context import tados
+from tados.zemax.local_engine import LocalRaytraceEngine
+from tados.zemax.raytrace_engine import get_fields
+from tados.optimization import External_Zemax_Optimizer
+
+# plano-convex lens: f = R/(n-1) = 100, back focal length = f - t/n = 96.667
+BFL = 100-5/1.5;
+surfaces = [ {'thick': np.inf},                            # object at infinity
+             {'curv': 1/50., 'thick': 5, 'n': 1.5, 'semidia': 10},
+             {'thick': BFL},
+             {} ];                                         # image surface
+
+def spot_radius(engine):
+  " rms spot radius on image surface for on-axis field "
+  px,py = np.meshgrid(np.linspace(-1,1,11),np.linspace(-1,1,11));
+  ret = engine.trace_rays(0,0,px.ravel(),py.ravel(),1);
+  return np.sqrt(np.nanmean(ret['x']**2+ret['y']**2));
+
+def test_paraxial_focus():
+  engine = LocalRaytraceEngine(surfaces,field=1,epd=0.2);
+  ret = engine.trace_rays(0,0,[0,0.5,1],[1,0,-1],1);
+  assert np.all(ret['error']==0) and np.all(ret['vigcode']==0), "all rays should pass the system";
+  assert np.allclose(get_fields(ret,('x','y')),0,atol=1e-5), "paraxial rays should be focussed on image surface";
+  assert np.allclose(np.linalg.norm(get_fields(ret,('l','m','n')),axis=1),1);
+  # chief ray for maximal field angle
+  ret = engine.trace_rays(0,1,0,0,1);
+  assert np.isclose(ret['y'][0],100*np.tan(np.deg2rad(1)),rtol=1e-3);
+  # vignetting and missed surfaces
+  engine.epd = 22;
+  ret = engine.trace_rays(0,0,[0,1],0,1);
+  assert list(ret['vigcode'])==[0,1], "ray outside of semi-diameter should be vignetted";
+  engine.epd = 120;
+  ret = engine.trace_rays(0,0,[0,1],0,1);
+  assert ret['error'][1]==1 and np.isnan(ret['x'][1]), "ray should miss first surface";
+
+def test_local_optimizer():
+  # variable: distance to image surface, operand: rms spot radius with target 0
+  engine = LocalRaytraceEngine(epd=10,variables=[(2,1)],operands=[(spot_radius,0,1)]);
+  opt = External_Zemax_Optimizer(engine,surfaces);
+  x0 = opt.getSystemState();
+  assert np.allclose(x0,[BFL]) and opt.getVariableNames()==['S2.Thick'];
+  # spherical aberration shifts best focus towards the lens
+  dz = np.linspace(-1,0.2,61);
+  merit = [opt.evaluate(x0+z) for z in dz];
+  best = dz[np.argmin(merit)];
+  assert -1<best<0, "best focus should be in front of paraxial focus";
+  diff = opt.evaluate_operands(x0+best);
+  assert np.isclose(diff[0],-np.min(merit));
+  # reset restores original state
+  opt.reset();
+  assert np.allclose(opt.getSystemState(),x0);
+
+def test_structured_results():
+  engine = LocalRaytraceEngine(surfaces,field=1,epd=2);
+  ret = engine.trace_rays(0.5,0.5,np.linspace(-1,1,5),0.3,1);
+  assert ret.dtype['error']==np.int32 and ret.dtype['x']==np.float64;
+  # adjacent fields are returned as view, other fields are copied
+  xy = get_fields(ret,('x','y'));
+  assert xy.shape==(5,2) and np.shares_memory(xy,ret);
+  assert np.array_equal(xy,np.column_stack((ret['x'],ret['y'])));
+  xn = get_fields(ret,('x','n'));
+  assert not np.shares_memory(xn,ret) and np.array_equal(xn[:,1],ret['n']);
+
+if __name__ == '__main__':
+  test_paraxial_focus();
+  test_local_optimizer();
+  test_structured_results();
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parser of Zemax text-file analysis outputs (no Zemax needed)
+
+@author: Hambach
+"""
+
+import os
+import tempfile
+import numpy as np
+
+from _context import tados
+from tados.zemax.analysis_files import read_analysis_file, get_pixels
+
+def write_image_analysis(filename,data,encoding):
+  " write file in the format of the Geometric Image Analysis listing "
+  Ny,Nx = data.shape;
+  header = ["Image analysis histogram listing", "",
+            "File : C:\\lens.ZMX", "Title: test lens",
+            "Image Width        : 0.14 Millimeters",
+            "Number of pixels   : %d x %d"%(Nx,Ny),
+            "Total flux in watts: %g"%np.sum(data),
+            "Units              : Watts/Millimeters^2", ""];
+  lines = header + ["\t".join("%.6E"%v for v in row) for row in data];
+  with open(filename,'wb') as f:
+    f.write("\r\n".join(lines).encode(encoding));
+
+def test_read_image_analysis():
+  data = np.random.RandomState(1).rand(30,40);
+  tmpdir = tempfile.mkdtemp();
+  for encoding in ('latin-1','utf-16'):
+    filename = os.path.join(tmpdir,'gia_%s.txt'%encoding);
+    write_image_analysis(filename,data,encoding);
+    params,values = read_analysis_file(filename,'Image analysis histogram listing','Units');
+    assert get_pixels(params)==(40,30);
+    assert params['Units']=='Watts/Millimeters^2' and params['File']=='C:\\lens.ZMX';
+    assert np.allclose(values.reshape(30,40),data,rtol=1e-6);
+    os.remove(filename);
+  # wrong type of analysis
+  write_image_analysis(filename,data,'latin-1');
+  try:
+    read_analysis_file(filename,'Listing of Interferogram Data','Xtilt');
+    assert False, "reading wrong analysis should fail";
+  except IOError: pass
+  # truncated file and decimal commas
+  with open(filename,'rb') as f: text = f.read();
+  for broken in (text[:-200], text.replace(b'.',b',')):
+    with open(filename,'wb') as f: f.write(broken);
+    try:
+      read_analysis_file(filename,'Image analysis histogram listing','Units');
+      assert False, "reading broken file should fail";
+    except ValueError: pass
+  os.remove(filename); os.rmdir(tmpdir);
+
+if __name__ == '__main__':
+  test_read_image_analysis();
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the pool of raytrace engines, using the local raytrace engine
+instead of Zemax instances
+
+@author: Hambach
+"""
+
+from __future__ import division
+import threading
+import numpy as np
+
+from _context import tados
+from tados.zemax.dde_pool import DDElinkPool
+from tados.zemax.local_engine import LocalRaytraceEngine
+
+surfaces = [ {'thick': np.inf},
+             {'curv': 1/50., 'thick': 5, 'n': 1.5},
+             {'thick': 96.},
+             {} ];
+
+class ThreadBoundEngine(LocalRaytraceEngine):
+  " engine that must be used in the thread that started it (as a DDE link) "
+  def __enter__(self):
+    self.thread = threading.get_ident();
+    return self;
+  def __exit__(self,*args):
+    assert threading.get_ident()==self.thread, "engine closed in wrong thread";
+  def load(self,surfaces):
+    assert threading.get_ident()==self.thread, "engine used in wrong thread";
+    LocalRaytraceEngine.load(self,surfaces);
+  def get_num_surfaces(self):
+    assert threading.get_ident()==self.thread, "engine used in wrong thread";
+    return LocalRaytraceEngine.get_num_surfaces(self);
+  def trace_rays(self,*args,**kwargs):
+    assert threading.get_ident()==self.thread, "engine used in wrong thread";
+    return LocalRaytraceEngine.trace_rays(self,*args,**kwargs);
+
+class FlakyEngine(ThreadBoundEngine):
+  " engine that loses its system during the first raytrace (broken link) "
+  nFailures = 0;
+  def trace_rays(self,*args,**kwargs):
+    if FlakyEngine.nFailures<1:
+      FlakyEngine.nFailures+=1;
+      self.surfaces = [];
+      raise RuntimeError("link broken");
+    return ThreadBoundEngine.trace_rays(self,*args,**kwargs);
+
+def test_pool_trace_rays():
+  factory = lambda: ThreadBoundEngine(field=1,epd=10);
+  px,py = np.random.RandomState(0).rand(2,1001)*2-1;
+  reference = LocalRaytraceEngine(surfaces,field=1,epd=10).trace_rays(0.5,0,px,py,1);
+  with DDElinkPool(surfaces,nLinks=3,engine_factory=factory) as pool:
+    ret = pool.trace_rays(0.5,0,px,py,1);
+    assert np.array_equal(ret,reference);
+    # map over field points (x and y interchanged)
+    results = pool.map(lambda engine,y: engine.trace_rays(0,y,py,px,1), [0,0.5,1]);
+    assert np.allclose(results[1]['y'],reference['x']);
+    assert pool.nRestarts==0;
+
+def test_pool_restart():
+  FlakyEngine.nFailures = 0;
+  factory = lambda: FlakyEngine(field=1,epd=10);
+  with DDElinkPool(surfaces,nLinks=2,engine_factory=factory) as pool:
+    ret = pool.submit(lambda engine: engine.trace_rays(0,0,0.5,0.5,1)).result();
+    assert pool.nRestarts==1 and ret['error'][0]==0, "broken link should be restarted";
+    # errors of the job itself are passed to the caller without restart
+    try:
+      pool.submit(lambda engine: engine.trace_rays(0,0,0,0,1,mode=1)).result();
+      assert False, "paraxial raytrace should fail";
+    except NotImplementedError: pass
+    assert pool.nRestarts==1 and pool.check_links()==0;
+    pool.engines[0].surfaces = [];
+    assert pool.check_links()==1 and pool.is_healthy(0);
+
+def test_pool_restart_after_last_retry():
+  FlakyEngine.nFailures = 0;
+  factory = lambda: FlakyEngine(field=1,epd=10);
+  with DDElinkPool(surfaces,nLinks=1,engine_factory=factory,max_retries=0) as pool:
+    try:
+      pool.submit(lambda engine: engine.trace_rays(0,0,0.5,0.5,1)).result();
+      assert False, "job should fail without retry";
+    except RuntimeError: pass
+    # broken engine is restarted before it is used by the next job
+    assert pool.nRestarts==1 and pool.is_healthy(0);
+    assert pool.submit(lambda engine: engine.trace_rays(0,0,0.5,0.5,1)).result()['error'][0]==0;
+
+def test_pool_default_engine():
+  try:
+    import pyzdde.zdde as pyz
+  except ImportError: return          # pyzdde not installed
+  class Link(object):
+    " DDE link of Zemax with a system of 3 surfaces, bound to its thread "
+    def __init__(self): self.thread = threading.get_ident();
+    def __getattr__(self,name):
+      def call(*args,**kwargs):
+        assert threading.get_ident()==self.thread, "link used in wrong thread";
+        return {'zGetFile': 'lens.zmx', 'zPushLensPermission': 1, 'zGetNumSurf': 3}.get(name,0);
+      return call
+  createLink = pyz.createLink; pyz.createLink = Link;
+  try:
+    with DDElinkPool('lens.zmx',nLinks=2) as pool:
+      assert pool.map(lambda engine,i: engine.get_num_surfaces(), range(4))==[3]*4;
+      assert pool.check_links()==0;
+      assert pool.engines[0].link.zGetNumSurf()==3;   # proxy of the link in main thread
+  finally:
+    pyz.createLink = createLink;
+
+if __name__ == '__main__':
+  test_pool_trace_rays();
+  test_pool_restart();
+  test_pool_restart_after_last_retry();
+  test_pool_default_engine();
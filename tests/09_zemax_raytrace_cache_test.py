@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the on-disk cache of raytrace results (using the local raytrace
+engine, no Zemax needed)
+
+@author: Hambach
+"""
+
+from __future__ import division
+import shutil
+import tempfile
+import numpy as np
+
+from _context import tados
+from tados.zemax.local_engine import LocalRaytraceEngine
+from tados.zemax.raytrace_engine import get_fields
+from tados.zemax.raytrace_cache import RaytraceCache
+
+surfaces = [ {'thick': np.inf},
+             {'curv': 1/50., 'thick': 5, 'n': 1.5},
+             {'thick': 96.},
+             {} ];
+
+def test_raytrace_cache():
+  engine = LocalRaytraceEngine(surfaces,field=1,epd=10);
+  px,py = np.random.RandomState(0).rand(2,1000)*2-1;
+  cachedir = tempfile.mkdtemp();
+  try:
+    for compress in (False,True):
+      cache = RaytraceCache(engine,cachedir,compress=compress);
+      cache.clear();
+      ret = cache.trace_rays(0,0.5,px,py,1);
+      cached = cache.trace_rays(0,0.5,px,py,1);
+      assert cache.hits==1 and cache.misses==1;
+      assert np.array_equal(cached,ret) and cached.dtype==ret.dtype;
+      # cached results can be modified in place (without changing the cache)
+      xy = get_fields(cached,('x','y')); xy += 1;
+      assert np.array_equal(cache.trace_rays(0,0.5,px,py,1),ret) and cache.hits==2;
+      # different ray inputs or system state
+      cache.trace_rays(0,0.5,px,py,1,surf=2);
+      engine.set_surface_data(2,engine.SDAT_THICK,95.);
+      cache.trace_rays(0,0.5,px,py,1);
+      engine.set_surface_data(2,engine.SDAT_THICK,96.);
+      assert cache.misses==3;
+      assert np.array_equal(cache.trace_rays(0,0.5,px,py,1),ret) and cache.hits==3;
+    # least-recently used entries are evicted first
+    cache = RaytraceCache(engine,cachedir);
+    cache.clear();
+    cache.trace_rays(0,0,px,py,1); size = cache.get_size();
+    cache.trace_rays(0,1,px,py,1);
+    cache.trace_rays(0,0,px,py,1);             # access first entry again
+    cache.max_size = int(2.5*size);
+    cache.trace_rays(0,0.5,px,py,1);
+    assert cache.get_size()<=cache.max_size;
+    cache.trace_rays(0,0,px,py,1); cache.trace_rays(0,1,px,py,1);
+    assert cache.hits==2 and cache.misses==4;
+    # analysis results (array and parameters)
+    engine.spot = lambda x: (np.full((3,4),x),{'Units': 'mm'});
+    data,params = cache.analysis('spot',2.);
+    cached,cached_params = cache.analysis('spot',2.);
+    assert cache.hits==3 and np.array_equal(cached,data) and cached_params==params;
+    cached += 1;
+    assert np.array_equal(cache.analysis('spot',2.)[0],data);
+    # different analysis settings
+    engine.get_analysis_settings = lambda: b'Image Width: 1';
+    cache.analysis('spot',2.);
+    assert cache.hits==4 and cache.misses==6;
+  finally:
+    shutil.rmtree(cachedir);
+
+if __name__ == '__main__':
+  test_raytrace_cache();
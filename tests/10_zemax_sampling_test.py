@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the sampling of pupil and field coordinates
+
+@author: Hambach
+"""
+
+from __future__ import division
+import numpy as np
+
+from _context import tados
+from tados.zemax import sampling
+from tados.illumination.adaptive_mesh import AdaptiveMesh
+
+def test_hexapolar_sampling():
+  Nr = 20;
+  x,y,Ntet,weight,offsets = sampling.hexapolar_sampling(Nr,rmax=2,ind=True,offsets=True);
+  assert x.size==offsets[-1]==np.sum(Ntet) and np.array_equal(np.diff(offsets),Ntet);
+  # compare with ring-by-ring construction
+  for i in range(Nr):
+    tet = np.linspace(0,2*np.pi,Ntet[i],endpoint=False);
+    ring = slice(offsets[i],offsets[i+1]);
+    assert np.allclose(x[ring],2*i/Nr*np.cos(tet)) and np.allclose(y[ring],2*i/Nr*np.sin(tet));
+  # weights are proportional to area of each ring
+  assert np.isclose(np.sum(weight),(1-1/(2*Nr))**2);  # outer ring ends at r=rmax*(1-1/(2Nr))
+  assert np.allclose(weight[1:]/Ntet[1:],weight[1]/6);
+  # backward compatible return values
+  assert len(sampling.hexapolar_sampling(Nr))==2;
+  assert len(sampling.hexapolar_sampling(Nr,ind=True))==4;
+
+def test_weighted_sampling():
+  octagon = sampling.regular_polygon(8);                 # octagon with inner radius 1
+  assert np.allclose(np.max(np.abs(octagon),axis=0),1);
+  for func in (sampling.sobol_sampling, sampling.halton_sampling, sampling.stratified_sampling):
+    for polygon in (None,octagon):
+      x,y,weights = func(1024,polygon=polygon,seed=1);
+      assert abs(x.size-1024)<50 and np.isclose(np.sum(weights),1);
+      if polygon is None: assert np.all(x**2+y**2<=1);
+      else: assert np.all((np.abs(x)<=1) & (np.abs(y)<=1) & (np.abs(x+y)<=np.sqrt(2)) & (np.abs(x-y)<=np.sqrt(2)));
+  # mean of r^2 over unit circle is 1/2
+  x,y,weights = sampling.sobol_sampling(1024,seed=2);
+  assert abs(np.sum(weights*(x**2+y**2))-0.5)<5e-3;
+  # Gaussian apodization: weighted mean of r^2 is w^2/2 (for w<<rmax)
+  x,y,weights = sampling.apodized_sampling(1024,0.5,seed=2);
+  assert abs(np.sum(weights*(x**2+y**2))-0.5**2/2)<5e-3;
+  # samples can be used as seeds for the adaptive mesh
+  mesh = AdaptiveMesh(np.column_stack((x,y)),lambda p: 2*p);
+  assert mesh.domain.shape==(1024,2);
+
+if __name__ == '__main__':
+  test_hexapolar_sampling();
+  test_weighted_sampling();